@@ -0,0 +1,320 @@
+import hashlib
+import math
+import os
+import shutil
+import subprocess
+import threading
+import wave
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SAMPLE_RATE = 22050
+#сколько кадров спектра обрабатывать за раз, чтобы не держать весь трек в complex128
+FFT_CHUNK = 512
+#громкость по EBU R128: блоки 400 мс с шагом 100 мс, абсолютный порог -70 LUFS,
+#относительный - на 10 LU ниже средней громкости прошедших абсолютный порог блоков
+LOUDNESS_BLOCK = 0.4
+LOUDNESS_HOP = 0.1
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+#опорная громкость ReplayGain 2.0 и предел поправки в обе стороны, дБ
+REFERENCE_LUFS = -18.0
+MAX_GAIN_DB = 12.0
+#сколько точек огибающей хранить на трек: пара min/max int8 на точку, 4 КБ на файл
+PEAK_POINTS = 2048
+#сколько готовых результатов держать в памяти: каждый спектр и огибающая - отдельный memmap,
+#а число отображений на процесс ограничено (vm.max_map_count)
+RESULTS_CACHE = 64
+
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+#wav читаем сами, всё остальное декодируем через ffmpeg, если он есть
+def decode_pcm(path, sample_rate=SAMPLE_RATE):
+    if path.lower().endswith(".wav"):
+        try:
+            return _read_wav(path)
+        except (wave.Error, EOFError, KeyError):
+            pass
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return None, None
+    result = subprocess.run(
+        [ffmpeg, "-v", "quiet", "-i", path, "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "-"],
+        capture_output=True
+    )
+    if result.returncode != 0 or not result.stdout:
+        return None, None
+    return np.frombuffer(result.stdout, dtype=np.float32), sample_rate
+
+
+def _read_wav(path):
+    with wave.open(path, "rb") as w:
+        channels = w.getnchannels()
+        width = w.getsampwidth()
+        rate = w.getframerate()
+        raw = w.readframes(w.getnframes())
+    samples = np.frombuffer(raw, dtype={1: np.uint8, 2: np.int16, 4: np.int32}[width]).astype(np.float32)
+    if width == 1:
+        samples = (samples - 128) / 128
+    else:
+        samples /= float(2 ** (8 * width - 1))
+    return samples.reshape(-1, channels).mean(axis=1), rate
+
+
+#энергия в логарифмических полосах для каждого кадра анимации: uint8, форма (кадры, полосы)
+def band_energies(samples, sample_rate, bars=8, fps=20, n_fft=2048):
+    hop = max(1, sample_rate // fps)
+    while n_fft < hop:
+        n_fft *= 2
+    n_frames = max(1, -(-len(samples) // hop))
+    padded = np.zeros((n_frames - 1) * hop + n_fft, dtype=np.float32)
+    padded[:len(samples)] = samples
+    frames = np.lib.stride_tricks.sliding_window_view(padded, n_fft)[::hop]
+    window = np.hanning(n_fft).astype(np.float32)
+    freqs = np.fft.rfftfreq(n_fft, 1 / sample_rate)
+    edges = np.searchsorted(freqs, np.geomspace(60, sample_rate / 2, bars + 1))[:-1]
+    for i in range(1, bars):
+        edges[i] = max(edges[i], edges[i - 1] + 1)
+    widths = np.diff(np.append(edges, len(freqs)))
+    energies = np.empty((n_frames, bars), dtype=np.float32)
+    for start in range(0, n_frames, FFT_CHUNK):
+        power = np.abs(np.fft.rfft(frames[start:start + FFT_CHUNK] * window, axis=1)) ** 2
+        energies[start:start + FFT_CHUNK] = np.add.reduceat(power, edges, axis=1) / widths
+    db = 10 * np.log10(energies + 1e-10)
+    levels = np.clip((db - (db.max() - 60)) / 60, 0, 1)
+    return (levels * 255).astype(np.uint8)
+
+
+#квадрат АЧХ K-фильтра из BS.1770 (полка +4 дБ на верхах и срез ниже 38 Гц).
+#коэффициенты пересчитываются под частоту дискретизации; на 48 кГц они совпадают с табличными
+def k_weighting(freqs, sample_rate):
+    z = np.exp(-2j * np.pi * freqs / sample_rate)
+    K = np.tan(np.pi * 1681.974450955533 / sample_rate)
+    Q = 0.7071752369554196
+    Vh = 10 ** (3.999843853973347 / 20)
+    Vb = Vh ** 0.4996667741545416
+    shelf = ((Vh + Vb * K / Q + K * K, 2 * (K * K - Vh), Vh - Vb * K / Q + K * K), (1 + K / Q + K * K, 2 * (K * K - 1), 1 - K / Q + K * K))
+    K = np.tan(np.pi * 38.13547087602444 / sample_rate)
+    Q = 0.5003270373238773
+    #числитель среза в стандарте не нормирован на a0, поэтому и здесь нормируется только знаменатель
+    a0 = 1 + K / Q + K * K
+    high_pass = ((1, -2, 1), (1, 2 * (K * K - 1) / a0, (1 - K / Q + K * K) / a0))
+    response = np.ones_like(z)
+    for b, a in (shelf, high_pass):
+        response *= (b[0] + b[1] * z + b[2] * z ** 2) / (a[0] + a[1] * z + a[2] * z ** 2)
+    return np.abs(response) ** 2
+
+
+#интегральная громкость в LUFS. фильтр применяется в частотной области: средний квадрат
+#отфильтрованного блока по Парсевалю - это взвешенная сумма его спектра мощности
+def integrated_loudness(samples, sample_rate):
+    block = int(LOUDNESS_BLOCK * sample_rate)
+    hop = int(LOUDNESS_HOP * sample_rate)
+    if len(samples) < block:
+        samples = np.pad(samples, (0, block - len(samples)))
+    frames = np.lib.stride_tricks.sliding_window_view(samples, block)[::hop]
+    freqs = np.fft.rfftfreq(block, 1 / sample_rate)
+    #в одностороннем спектре все бины, кроме нулевого и найквистовского, считаются дважды
+    weights = k_weighting(freqs, sample_rate) * 2
+    weights[0] /= 2
+    if block % 2 == 0:
+        weights[-1] /= 2
+    power = np.empty(len(frames))
+    for start in range(0, len(frames), FFT_CHUNK):
+        spectrum = np.abs(np.fft.rfft(frames[start:start + FFT_CHUNK], axis=1)) ** 2
+        power[start:start + FFT_CHUNK] = spectrum @ weights / block ** 2
+    with np.errstate(divide="ignore"):
+        levels = -0.691 + 10 * np.log10(power)
+    gated = power[levels > ABSOLUTE_GATE]
+    if not len(gated):
+        return None
+    threshold = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+    gated = power[levels > max(ABSOLUTE_GATE, threshold)]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+#огибающая волны: min и max отсчётов в каждом из points равных кусков, int8 формы (points, 2)
+def waveform_peaks(samples, points=PEAK_POINTS):
+    peaks = np.zeros((points, 2), dtype=np.int8)
+    if not len(samples):
+        return peaks
+    edges = np.linspace(0, len(samples), points, endpoint=False).astype(np.int64)
+    peaks[:, 0] = np.clip(np.minimum.reduceat(samples, edges) * 127, -127, 127)
+    peaks[:, 1] = np.clip(np.maximum.reduceat(samples, edges) * 127, -127, 127)
+    return peaks
+
+
+#сводит огибающую к columns столбцам для отрисовки; на memmap читается только сам файл пиков
+def peak_envelope(peaks, columns):
+    edges = np.linspace(0, len(peaks), columns, endpoint=False).astype(np.int64)
+    return np.minimum.reduceat(peaks[:, 0], edges) / 127, np.maximum.reduceat(peaks[:, 1], edges) / 127
+
+
+def _save_array(target, data):
+    tmp = f"{target}.{os.getpid()}.tmp.npy"
+    np.save(tmp, data)
+    os.replace(tmp, target)
+
+
+#выполняется в отдельном процессе
+def analyse_spectrum(path, cache_dir, bars, fps):
+    target = os.path.join(cache_dir, f"{file_hash(path)}.spectrum-{bars}x{fps}.npy")
+    if not os.path.exists(target):
+        samples, rate = decode_pcm(path)
+        if samples is None:
+            return None
+        _save_array(target, band_energies(samples, rate, bars, fps))
+    return target
+
+
+def analyse_peaks(path, cache_dir, points):
+    target = os.path.join(cache_dir, f"{file_hash(path)}.peaks-{points}.npy")
+    if not os.path.exists(target):
+        samples, _ = decode_pcm(path)
+        if samples is None:
+            return None
+        _save_array(target, waveform_peaks(samples, points))
+    return target
+
+
+#выполняется в отдельном процессе; тишина сохраняется как nan.
+#трек уже декодирован, поэтому заодно сохраняются и пики - фоновый обход библиотеки
+#заполняет кэш огибающих, и при переключении трека остаётся только отобразить файл.
+#возвращает (lufs, хэш, mtime_ns, размер): по ним громкость запоминается в каталоге
+def analyse_loudness(path, cache_dir, points=PEAK_POINTS):
+    #stat до чтения: если файл поменяется во время хэширования, запись в каталоге сразу устареет
+    st = os.stat(path)
+    digest = file_hash(path)
+    target = os.path.join(cache_dir, f"{digest}.loudness.npy")
+    peaks_target = os.path.join(cache_dir, f"{digest}.peaks-{points}.npy")
+    if not os.path.exists(target) or not os.path.exists(peaks_target):
+        samples, rate = decode_pcm(path)
+        if samples is None:
+            return None
+        if not os.path.exists(target):
+            lufs = integrated_loudness(samples, rate)
+            _save_array(target, np.array([np.nan if lufs is None else lufs], dtype=np.float32))
+        if not os.path.exists(peaks_target):
+            _save_array(peaks_target, waveform_peaks(samples, points))
+    return float(np.load(target)[0]), digest, st.st_mtime_ns, st.st_size
+
+
+#поправка ReplayGain в дБ по громкости трека; у тишины поправки нет
+def replay_gain(lufs):
+    if lufs is None or math.isnan(lufs):
+        return 0.0
+    return max(-MAX_GAIN_DB, min(MAX_GAIN_DB, REFERENCE_LUFS - lufs))
+
+
+#фоновый анализ треков в пуле процессов; результаты лежат в кэше по хэшу файла,
+#а в UI отдаются через callback уже готовыми массивами, громкость - кортежем из analyse_loudness
+class TrackAnalyzer:
+    def __init__(self, cache_dir=".cache", max_workers=1, bars=8, fps=20, points=PEAK_POINTS, cache_size=RESULTS_CACHE):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.bars = bars
+        self.fps = fps
+        self.points = points
+        self.cache_size = cache_size
+        self._pool = None
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return np is not None
+
+    #digest - хэш файла из каталога: если по нему в кэше уже есть готовый файл, он отображается
+    #прямо здесь, без очереди пула и без повторного хэширования трека
+    def spectrum(self, path, callback, digest=None):
+        self._map_cached(("spectrum", path), digest, f"spectrum-{self.bars}x{self.fps}")
+        return self._request("spectrum", path, callback, analyse_spectrum, self.cache_dir, self.bars, self.fps)
+
+    def loudness(self, path, callback):
+        return self._request("loudness", path, callback, analyse_loudness, self.cache_dir, self.points)
+
+    def peaks(self, path, callback, digest=None):
+        self._map_cached(("peaks", path), digest, f"peaks-{self.points}")
+        return self._request("peaks", path, callback, analyse_peaks, self.cache_dir, self.points)
+
+    #возвращает future, если задача ушла в пул, и None, если ответ уже известен
+    def _request(self, kind, path, callback, job, *args):
+        if not self.available:
+            return None
+        key = (kind, path)
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+        if result is False:
+            return None
+        if result is not None:
+            callback(result)
+            return None
+        future = self._submit(job, path, *args)
+        if future is not None:
+            future.add_done_callback(lambda f: self._done(key, f, callback))
+        return future
+
+    def _submit(self, job, *args):
+        with self._lock:
+            if self._pool is None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            try:
+                return self._pool.submit(job, *args)
+            except RuntimeError:
+                return None
+
+    def _done(self, key, future, callback):
+        if future.cancelled() or future.exception() is not None:
+            return
+        result = future.result()
+        #декодировать нечем - не пытаемся повторно для этого файла
+        if result is None:
+            data = False
+        elif key[0] == "loudness":
+            #громкость - одно число, файл ради него не отображается
+            data = result
+        else:
+            data = np.load(result, mmap_mode="r")
+        self._remember(key, data)
+        if data is not False:
+            callback(data)
+
+    def _map_cached(self, key, digest, suffix):
+        if digest is None or not self.available:
+            return
+        with self._lock:
+            if key in self._results:
+                return
+        try:
+            data = np.load(os.path.join(self.cache_dir, f"{digest}.{suffix}.npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            return
+        self._remember(key, data)
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._results[key] = data
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
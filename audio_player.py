@@ -1,20 +1,41 @@
+import time
+IMPORT_STARTED = time.perf_counter()
 import flet as ft
+import flet.canvas as cv
 import flet_audio as fa
 import os
-import random
+import sys
+import asyncio
 import math
-import time
 import threading
+from scanner import LibraryScanner
+from ranking import PlayRanking
+from scheduler import UpdateScheduler, AnimationLoop, Debouncer, coalesce_updates
+from analysis import peak_envelope, replay_gain
+from playback import PlaybackCore, NullOutput
+from history import SKIPPED, COMPLETED, STOPPED
+from watcher import LibraryWatcher
+from duplicates import DuplicateFinder
+from library import MusicLibrary, Shared, shared_library, track_key
+from metrics import REGISTRY, StartupTimer
+
+#импорт один на процесс, а этапы запуска у каждой сессии свои - см. main()
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+REGISTRY.observe("player_startup_seconds", IMPORT_SECONDS, phase="import")
 
 #настя
 class EqualizerAnimation(ft.Container):
-    def __init__(self, width=300, height=265, bars=8):
+    def __init__(self, width=300, height=265, bars=8, animation_loop=None):
         super().__init__()
         self.width = width
         self.height = height
         self.bars = bars
         self.running = False
-        self._timer = None
+        self.animation_loop = animation_loop
+        self.spectrum = None
+        self.spectrum_fps = 20
+        self.position_ms = 0
+        self.position_at = time.monotonic()
         self.bar_rects = [
             ft.Container(
                 width=width // (bars + 2),
@@ -32,244 +53,653 @@ class EqualizerAnimation(ft.Container):
             width=width,
             height=height
         )
+        if animation_loop is not None:
+            animation_loop.add(self)
 
-    def _animate(self):
-        if not self.running:
-            return
-        t = time.time()
-        for i, bar in enumerate(self.bar_rects):
-            bar.height = 30 + 100 * abs(math.sin(t * 2 + i))
-        self.update()
-        self._timer = threading.Timer(0.05, self._animate)
-        self._timer.start()
+    #вызывается из AnimationLoop на каждом кадре, возвращает изменённые контролы;
+    #если для трека уже посчитан спектр, берём кадр по текущей позиции
+    def tick(self, now):
+        if self.spectrum is not None and len(self.spectrum):
+            position = self.position_ms + (now - self.position_at) * 1000
+            frame = self.spectrum[min(int(position * self.spectrum_fps / 1000), len(self.spectrum) - 1)]
+            for bar, level in zip(self.bar_rects, frame):
+                bar.height = 30 + 100 * int(level) / 255
+        else:
+            t = time.time()
+            for i, bar in enumerate(self.bar_rects):
+                bar.height = 30 + 100 * abs(math.sin(t * 2 + i))
+        return [self.content]
+
+    def set_spectrum(self, frames, fps=20):
+        self.spectrum = frames
+        self.spectrum_fps = fps
+
+    def set_position(self, position_ms):
+        self.position_ms = position_ms
+        self.position_at = time.monotonic()
 
     def start(self):
         if not self.running:
             self.running = True
-            self._animate()
+            self.position_at = time.monotonic()
+            if self.animation_loop is not None:
+                self.animation_loop.wake()
 
     def stop(self):
         self.running = False
-        if self._timer:
-            self._timer.cancel()
-            self._timer = None
 
-#настя
-class AudioPlayerManager:
-    def __init__(self, page, ui):
-        self.current_state = ft.AudioState.PAUSED
-        self.current_track_index = 0
-        self.repeat_mode = False
-        self.shuffle_mode = False
-        self.tracks_folder = "tracks"
-        self.original_playlist = self.load_local_tracks()
-        self.playlist = self.original_playlist.copy()
-        self.play_counts = {track["title"]: 0 for track in self.original_playlist}
-        self.audio_player = fa.Audio(
+#огибающая трека за слайдером позиции: один залитый контур из columns столбцов,
+#чтобы на клиент уходила одна фигура, а не тысячи линий
+class WaveformView(cv.Canvas):
+    def __init__(self, width=308, height=36, columns=110):
+        super().__init__(width=width, height=height)
+        self.columns = columns
+        self.outline = cv.Path([], paint=ft.Paint(color=ft.Colors.with_opacity(0.35, ft.Colors.PURPLE_ACCENT_100), style=ft.PaintingStyle.FILL))
+        self.shapes = [self.outline]
+
+    def set_peaks(self, peaks):
+        if peaks is None or not len(peaks):
+            self.outline.elements = []
+            return
+        low, high = peak_envelope(peaks, self.columns)
+        step = self.width / max(1, self.columns - 1)
+        middle = self.height / 2
+        #минимальная толщина, чтобы тихие места не пропадали совсем
+        top = [middle - max(1.0, value * middle) for value in high]
+        bottom = [middle - min(-1.0, value * middle) for value in low]
+        elements = [cv.Path.MoveTo(0, top[0])]
+        elements += [cv.Path.LineTo(i * step, y) for i, y in enumerate(top)]
+        elements += [cv.Path.LineTo(i * step, bottom[i]) for i in reversed(range(self.columns))]
+        elements.append(cv.Path.Close())
+        self.outline.elements = elements
+
+#воспроизведение на fa.Audio: плееры кладутся в page.overlay
+class FletAudioBackend:
+    def __init__(self, page):
+        self.page = page
+
+    def create_player(self, core):
+        player = fa.Audio(
             autoplay=False,
-            on_state_changed=self.audio_state_changed,
-            on_position_changed=self.audio_position_changed,
-            on_loaded=self.audio_loaded,
+            on_state_changed=core.on_state_changed,
+            on_position_changed=core.on_position_changed,
+            on_loaded=core.on_loaded,
             volume=0.5
         )
-        if page is not None:
-            page.overlay.append(self.audio_player)
-        self.ui = ui
-        self.autoplay_on_load = False
+        if self.page is not None:
+            self.page.overlay.append(player)
+        return player
 
-    #настя
-    def load_local_tracks(self):
-        tracks = []
-        for file in os.listdir(self.tracks_folder):
-            if file.lower().endswith(".mp3"):
-                tracks.append({
-                    "url": f"{self.tracks_folder}/{file}",
-                    "title": os.path.splitext(file)[0]
-                })
-        return tracks
+#настя
+class AudioPlayerManager(PlaybackCore):
+    tracks_folder = Shared()
+    catalog = Shared()
+    analyzer = Shared()
+    loudness_analyzer = Shared()
+    track_gains = Shared()
+    duplicate_groups = Shared()
+    search_index = Shared()
+    index_pending = Shared()
+    play_store = Shared()
+    history = Shared()
+    ranking = Shared()
+    watcher = Shared()
+    track_server = Shared()
+    track_key = staticmethod(track_key)
 
-    #настя
-    def toggle_shuffle(self, e, shuffle_button, page):
-        self.shuffle_mode = not self.shuffle_mode
-        if shuffle_button is not None:
-            shuffle_button.icon_color = ft.Colors.PURPLE_ACCENT_400 if self.shuffle_mode else ft.Colors.GREY
-        if self.shuffle_mode:
-            current_track = self.playlist[self.current_track_index]
-            other_tracks = [t for t in self.playlist if t != current_track]
-            random.shuffle(other_tracks)
-            self.playlist = other_tracks[:self.current_track_index] + [current_track] + other_tracks[self.current_track_index:]
-        else:
-            current_track = self.playlist[self.current_track_index]
-            self.playlist = self.original_playlist.copy()
-            for i, track in enumerate(self.playlist):
-                if track["url"] == current_track["url"]:
-                    self.current_track_index = i
-                    break
-        if self.ui is not None:
-            self.ui.update_queue_list()
-        if page is not None:
-            page.update()
+    #без library у сессии своя библиотека; в веб-режиме main() отдаёт всем сессиям общую
+    def __init__(self, page, ui, backend=None, clock=None, library=None):
+        self.library = library if library is not None else MusicLibrary()
+        self.normalize_loudness = True
+        self.loudness_lookahead = 5
+        self.scan_publish_interval = 1.0
+        self.collapse_duplicates = False
+        super().__init__(backend if backend is not None else FletAudioBackend(page), ui, clock)
+        self.listen = None
+        snapshot = self.library.snapshot
+        self.snapshot = snapshot
+        self.key_index = snapshot.key_index
+        self._original_playlist = self.playlist = snapshot.tracks
+        self.url_index = snapshot.url_index
+        self.library.attach(self)
 
-    #настя
-    def format_time(self, ms):
-        if ms is None:
-            return "00:00"
-        seconds = int(ms / 1000)
-        minutes = seconds // 60
-        seconds %= 60
-        return f"{minutes:02d}:{seconds:02d}"
+    @property
+    def ui(self):
+        return None if isinstance(self.output, NullOutput) else self.output
 
-    #настя
-    def play_pause_click(self, e, play_pause_button, page):
-        if self.current_state == ft.AudioState.PLAYING:
-            self.audio_player.pause()
-            self.current_state = ft.AudioState.PAUSED
-            play_pause_button.icon = "play_circle_filled_rounded"
-            self.ui.equalizer.stop()
-        elif self.current_state in [ft.AudioState.PAUSED, ft.AudioState.STOPPED] and self.audio_player.src:
-            self.audio_player.resume()
-            self.current_state = ft.AudioState.PLAYING
-            play_pause_button.icon = "pause_circle_filled_rounded"
-            current_track = self.playlist[self.current_track_index]["title"]
-            self.play_counts[current_track] += 1
+    @ui.setter
+    def ui(self, ui):
+        self.output = ui if ui is not None else NullOutput()
+
+    #замена списка треков меняет библиотеку, а не только эту сессию
+    @PlaybackCore.original_playlist.setter
+    def original_playlist(self, tracks):
+        self.library.set_tracks(tracks, origin=self)
+
+    #новый снимок библиотеки; grown - в библиотеку добавились треки
+    @coalesce_updates
+    def adopt(self, snapshot, renamed, grown):
+        if snapshot.version <= self.snapshot.version:
+            return
+        was_empty = not self.playlist
+        self.snapshot = snapshot
+        self.key_index = snapshot.key_index
+        self.set_library(snapshot.tracks, snapshot.url_index, renamed)
+        if grown and was_empty and self.playlist and not self.audio_player.src:
+            self.load_track(0, False)
+        if self.ui is not None:
             self.ui.update_stats_list()
-            self.ui.equalizer.start()
-        page.update()
+            self.ui.update_search_list()
 
-    #настя
-    def audio_state_changed(self, e):
-        if e.data == "playing":
-            self.current_state = ft.AudioState.PLAYING
-        elif e.data == "paused":
-            self.current_state = ft.AudioState.PAUSED
-        elif e.data == "stopped":
-            self.current_state = ft.AudioState.STOPPED
+    def track_title(self, key):
+        index = self.key_index.get(key)
+        return self.original_playlist[index]["title"] if index is not None else key
 
     #настя
-    def audio_position_changed(self, e):
-        if not self.ui.progress_slider.disabled and e.data is not None:
-            position = int(e.data)
-            self.ui.progress_slider.value = position
-            self.ui.current_time_text.value = self.format_time(position)
-            duration = self.audio_player.get_duration()
-            if duration is not None and position >= duration - 100:
-                if self.repeat_mode:
-                    self.audio_player.seek(0)
-                    self.audio_player.resume()
-                    current_track = self.playlist[self.current_track_index]["title"]
-                    self.play_counts[current_track] += 1
-                    self.ui.update_stats_list()
-                else:
-                    self.next_track(
-                        e,
-                        self.ui.track_title,
-                        self.ui.play_pause_button,
-                        self.ui.current_time_text,
-                        self.ui.total_time_text,
-                        self.ui.progress_slider,
-                        self.ui.page
-                    )
-            self.ui.page.update()
+    def load_local_tracks(self):
+        self.catalog.refresh(self.tracks_folder)
+        return self.catalog.tracks(self.tracks_folder)
 
-    #настя
-    def audio_loaded(self, e):
-        duration_ms = self.audio_player.get_duration()
-        if duration_ms is not None:
-            self.ui.total_time_text.value = self.format_time(duration_ms)
-            self.ui.progress_slider.max = duration_ms
-            self.ui.page.update()
-        if self.autoplay_on_load:
-            self.audio_player.play()
-            self.current_state = ft.AudioState.PLAYING
-            self.ui.play_pause_button.icon = "pause_circle_filled_rounded"
-            track = self.playlist[self.current_track_index]["title"]
-            self.play_counts[track] += 1
-            self.ui.update_stats_list()
-            self.ui.page.update()
-            self.ui.equalizer.start()
-            self.autoplay_on_load = False
+    def stream_local_tracks(self):
+        return LibraryScanner(self.catalog).scan(self.tracks_folder)
 
-    #настя
-    def toggle_repeat(self, e, repeat_button, page):
-        self.repeat_mode = not self.repeat_mode
-        repeat_button.icon_color = ft.Colors.PURPLE_ACCENT_400 if self.repeat_mode else ft.Colors.GREY
-        page.update()
+    #строит поисковый индекс по текущей библиотеке; до этого поиск находит только
+    #треки, добавленные после запуска, а замена original_playlist индекс не трогает
+    async def index_library(self):
+        if not self.index_pending:
+            return
+        await asyncio.to_thread(self.search_index.sync, list(self.original_playlist))
+        self.index_pending = False
+        self.library.broadcast("library_indexed")
 
-    #настя
-    def load_track(self, track_index, autoplay, track_title, play_pause_button, current_time_text, total_time_text, progress_slider, page):
-        self.current_track_index = track_index
-        track = self.playlist[self.current_track_index]
-        track_title.value = track["title"]
-        self.current_state = ft.AudioState.STOPPED
-        play_pause_button.icon = "play_circle_filled_rounded"
-        current_time_text.value = "00:00"
-        total_time_text.value = "00:00"
-        progress_slider.value = 0
-        self.audio_player.src = track["url"]
-        self.ui.update_queue_list()
-        self.ui.update_stats_list()
-        page.update()
-        if autoplay and self.audio_player.src:
-            self.autoplay_on_load = autoplay
-            self.current_state = ft.AudioState.PLAYING
-            play_pause_button.icon = "pause_circle_filled_rounded"
-            self.play_counts[track["title"]] += 1
-            self.ui.update_stats_list()
-            page.update()
+    def library_indexed(self):
+        if self.ui is not None:
+            self.ui.update_search_list()
 
-    #настя
-    def next_track(self, e, track_title, play_pause_button, current_time_text, total_time_text, progress_slider, page):
-        if self.shuffle_mode:
-            other_indices = [i for i in range(len(self.playlist)) if i != self.current_track_index]
-            new_index = random.choice(other_indices) if other_indices else self.current_track_index
-        else:
-            new_index = (self.current_track_index + 1) % len(self.playlist)
-        self.load_track(new_index, True, track_title, play_pause_button, current_time_text, total_time_text, progress_slider, page)
+    #пересканирует папку в фоне и по мере обхода добавляет найденные треки в очередь;
+    #обход идёт в потоке, а очередь меняется на цикле событий под lock.
+    #каждое добавление копирует снимок библиотеки, поэтому найденное копится, пока его
+    #не станет столько же, сколько уже в библиотеке, или пока не пройдёт scan_publish_interval
+    async def scan_library(self):
+        known = {track["url"] for track in self.original_playlist}
+        found = set()
+        pending = []
+        published_at = self.clock.perf_counter()
+        batches = iter(self.stream_local_tracks())
+        while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+            found.update(track["url"] for track in batch)
+            added = [track for track in batch if track["url"] not in known]
+            known.update(track["url"] for track in added)
+            pending.extend(added)
+            if pending and (len(pending) >= len(self.original_playlist) or self.clock.perf_counter() - published_at >= self.scan_publish_interval):
+                await self.run(self.add_tracks, pending)
+                pending = []
+                published_at = self.clock.perf_counter()
+        if pending:
+            await self.run(self.add_tracks, pending)
+        removed = known - found
+        if removed:
+            await self.run(self.remove_tracks, removed)
 
-    #настя
-    def prev_track(self, e, track_title, play_pause_button, current_time_text, total_time_text, progress_slider, page):
-        if self.shuffle_mode:
-            other_indices = [i for i in range(len(self.playlist)) if i != self.current_track_index]
-            new_index = random.choice(other_indices) if other_indices else self.current_track_index
+    #новые, удалённые и переименованные файлы из LibraryWatcher: пересканируются
+    #только затронутые папки, а очередь правится на месте
+    #наблюдатель общий: события уходят в библиотеку, а она отдаёт их загружающей сессии,
+    #пока та открыта, и следующей после её закрытия
+    def watch_library(self):
+        self.library.claim_loader(self)
+        self.watcher = LibraryWatcher(self.tracks_folder, self.library.library_changed).start()
+
+    #вызывается из потока наблюдателя
+    def library_changed(self, directories):
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.apply_library_changes(directories), self.loop)
         else:
-            new_index = (self.current_track_index - 1 + len(self.playlist)) % len(self.playlist)
-        self.load_track(new_index, True, track_title, play_pause_button, current_time_text, total_time_text, progress_slider, page)
+            self.merge_tracks(*self.rescan_dirs(directories))
+
+    async def apply_library_changes(self, directories):
+        before, after = await asyncio.to_thread(self.rescan_dirs, directories)
+        await self.run(self.merge_tracks, before, after)
+
+    def rescan_dirs(self, directories):
+        return LibraryScanner(self.catalog).rescan(self.tracks_folder, directories)
+
+    #before и after - треки пересканированных папок в каталоге; сравниваем по id,
+    #поэтому переименованный файл заменяет старую запись, а не удаляется и добавляется заново
+    @coalesce_updates
+    def merge_tracks(self, before, after):
+        old = {track["id"]: track for track in before}
+        new = {track["id"]: track for track in after}
+        replaced = [(old[track_id]["url"], track) for track_id, track in new.items() if track_id in old and old[track_id] != track]
+        removed = {track["url"] for track_id, track in old.items() if track_id not in new}
+        self.library.update(list(new.values()), removed, replaced, origin=self)
+
+    #очередь меняется через библиотеку: новый снимок получают все сессии
+    @coalesce_updates
+    def replace_tracks(self, replacements):
+        self.library.update(replaced=replacements, origin=self)
+
+    @coalesce_updates
+    def add_tracks(self, tracks):
+        self.library.update(added=tracks, origin=self)
+
+    @coalesce_updates
+    def remove_tracks(self, urls):
+        self.library.update(removed=urls, origin=self)
+
+    def find_duplicates(self):
+        return DuplicateFinder().find(self.catalog.same_size_files(self.tracks_folder))
+
+    async def detect_duplicates(self):
+        groups = await asyncio.to_thread(self.find_duplicates)
+        await self.run(self.duplicates_found, groups)
+
+    def duplicates_found(self, groups):
+        self.duplicate_groups = groups
+        if self.collapse_duplicates:
+            self.collapse_duplicate_tracks(groups)
+
+    #из каждой группы остаётся одна копия: та, что играет, иначе самая прослушиваемая,
+    #иначе первая в библиотеке. копии убираются из библиотеки, то есть из очереди всех сессий,
+    #и не возвращаются при пересканировании; их прослушивания засчитываются оставшейся копии
+    @coalesce_updates
+    def collapse_duplicate_tracks(self, groups):
+        current_url = self.playlist[self.current_track_index]["url"] if self.playlist else None
+        counts = self.play_counts
+        copies = {}
+        for group in groups:
+            tracks = [self.original_playlist[self.url_index[url]] for url in group if url in self.url_index]
+            if len(tracks) < 2:
+                continue
+            keep = max(tracks, key=lambda track: (track["url"] == current_url, counts.get(self.track_key(track), 0), -self.url_index[track["url"]]))
+            copies.update((track["url"], keep["url"]) for track in tracks if track is not keep)
+        if copies:
+            self.library.collapse(copies, origin=self)
+        return set(copies)
+
+    def track_loading(self, track):
+        #хэш из каталога позволяет сразу отобразить пики, сохранённые фоновым анализом громкости
+        known = self.catalog.analysis(track["url"])
+        digest = known[0] if known is not None else None
+        self.analyzer.peaks(track["url"], lambda peaks, url=track["url"]: self.submit(self.peaks_ready, url, peaks), digest)
+        self.analyzer.spectrum(track["url"], lambda frames, url=track["url"]: self.submit(self.spectrum_ready, url, frames), digest)
+        #поправки для ближайших треков нужны до переключения на них
+        for offset in range(min(self.loudness_lookahead + 1, len(self.playlist))):
+            url = self.playlist[(self.current_track_index + offset) % len(self.playlist)]["url"]
+            if url not in self.track_gains:
+                self.request_gain(url)
+
+    #с запущенным сервером плеер получает трек по http, с поддержкой перемотки по Range
+    def track_source(self, url):
+        return url if self.track_server is None else self.track_server.source(url)
+
+    def player_url(self, player):
+        if self.track_server is None or not player.src:
+            return player.src
+        return self.track_server.track_url(player.src)
+
+    def track_gain(self, url):
+        return self.track_gains.get(url, 0.0) if self.normalize_loudness else 0.0
+
+    #громкость, измеренная при прошлых запусках, берётся из каталога - файл не хэшируется заново
+    def request_gain(self, url):
+        known = self.catalog.analysis(url)
+        if known is not None:
+            self.gain_ready(url, known[1])
+            return None
+        return self.loudness_analyzer.loudness(url, lambda result, url=url: self.loudness_measured(url, result))
+
+    #вызывается из потока пула
+    def loudness_measured(self, url, result):
+        lufs, digest, mtime_ns, size = result
+        self.catalog.store_analysis(url, mtime_ns, size, digest, lufs)
+        self.submit(self.gain_ready, url, lufs)
+
+    #трек, который уже играет, не трогаем, чтобы громкость не прыгала посреди песни
+    def gain_ready(self, url, lufs):
+        self.track_gains[url] = replay_gain(lufs)
+        players = [self.standby_player]
+        if self.current_state != ft.AudioState.PLAYING:
+            players.append(self.audio_player)
+        for player in players:
+            if self.player_url(player) == url:
+                player.volume = self.player_volume(url)
+                self.output.player_changed(player)
+
+    #громкость всей библиотеки считается в фоне, не больше window задач в пуле за раз
+    async def analyze_loudness(self, window=None):
+        window = window or self.loudness_analyzer.max_workers * 2
+        known = await asyncio.to_thread(self.catalog.loudness, self.tracks_folder)
+        for url, lufs in known.items():
+            self.track_gains.setdefault(url, replay_gain(lufs))
+        pending = set()
+        for track in list(self.original_playlist):
+            if track["url"] in self.track_gains:
+                continue
+            future = self.request_gain(track["url"])
+            if future is None:
+                continue
+            pending.add(asyncio.wrap_future(future))
+            if len(pending) >= window:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        if pending:
+            await asyncio.wait(pending)
+
+    #track_started приходит и на продолжение после паузы, и дважды при загрузке с автозапуском,
+    #поэтому прослушивание засчитывается, только когда оно начинается
+    def track_started(self, track):
+        if self.begin_listen(self.track_key(track)):
+            self.count_play(track)
+
+    def track_paused(self):
+        self.pause_listen()
+
+    def track_ended(self, completed):
+        self.end_listen(COMPLETED if completed else SKIPPED)
+
+    def spectrum_ready(self, url, frames):
+        if self.ui is not None and self.playlist and self.playlist[self.current_track_index]["url"] == url:
+            self.ui.equalizer.set_spectrum(frames, self.analyzer.fps)
+
+    def peaks_ready(self, url, peaks):
+        if self.ui is not None and self.playlist and self.playlist[self.current_track_index]["url"] == url:
+            self.ui.show_waveform(peaks)
+
+    def close(self):
+        super().close()
+        self.end_listen(STOPPED)
+        self.library.detach(self)
+
+    @property
+    def play_counts(self):
+        return self.ranking.counts
+
+    @play_counts.setter
+    def play_counts(self, counts):
+        self.ranking = PlayRanking(counts)
+
+    def count_play(self, track):
+        key = self.track_key(track)
+        ranks = self.ranking.increment(key)
+        self.play_store.increment(key)
+        #рейтинг общий: позиции сдвинулись во всех вкладках, не только в этой
+        self.library.broadcast("stats_changed", ranks, origin=self)
+
+    def stats_changed(self, ranks=None):
+        if self.ui is not None:
+            self.ui.update_stats_list(ranks)
+
+    #текущее прослушивание: открывается при старте трека, копит время, пока трек играет,
+    #и уходит в историю при переключении (пропуск), окончании трека или выходе.
+    #возвращает True, если началось новое прослушивание
+    def begin_listen(self, key):
+        if self.listen is not None and self.listen["key"] != key:
+            self.end_listen(SKIPPED)
+        started = self.listen is None
+        if started:
+            self.listen = {"key": key, "start": self.clock.time(), "listened": 0.0, "playing_since": None}
+        if self.listen["playing_since"] is None:
+            self.listen["playing_since"] = self.clock.monotonic()
+        return started
+
+    def pause_listen(self):
+        if self.listen is not None and self.listen["playing_since"] is not None:
+            self.listen["listened"] += self.clock.monotonic() - self.listen["playing_since"]
+            self.listen["playing_since"] = None
+
+    def end_listen(self, outcome):
+        if self.listen is None:
+            return
+        self.pause_listen()
+        listen, self.listen = self.listen, None
+        self.history.record(listen["key"], int(listen["start"] * 1000), int(self.clock.time() * 1000), int(listen["listened"] * 1000), outcome)
+        self.library.broadcast("history_recorded", origin=self)
+
+    def history_recorded(self):
+        if self.ui is not None:
+            self.ui.history_changed()
 
 #таня
 class UIComponents:
-    def __init__(self, page, audio_manager):
+    def __init__(self, page, audio_manager, stats_limit=50, search_limit=50, diagnostics=False, metrics_file="player_metrics.prom", startup=None):
         self.page = page
+        self.startup = startup if startup is not None else StartupTimer()
         self.audio_manager = audio_manager
+        self.stats_limit = stats_limit
+        self.search_limit = search_limit
+        self.diagnostics = diagnostics
+        self.metrics_file = metrics_file
+        self.scheduler = UpdateScheduler(page)
+        self.animation_loop = AnimationLoop(self.scheduler, fps=20)
+        self.app_visible = True
         self.build_ui()
 
+    #вывод для PlaybackCore: ядро сообщает, что поменялось, а контролы правятся здесь
+    def show_track(self, track):
+        self.track_title.value = track["title"]
+        self.play_pause_button.icon = "play_circle_filled_rounded"
+        self.current_time_text.value = "00:00"
+        self.total_time_text.value = "00:00"
+        self.progress_slider.value = 0
+        self.equalizer.set_spectrum(None)
+        self.equalizer.set_position(0)
+        self.waveform.set_peaks(None)
+        self.update_queue_list()
+        self.scheduler.mark(self.track_title, self.play_pause_button, self.current_time_text, self.total_time_text, self.progress_slider, self.waveform)
+
+    def show_waveform(self, peaks):
+        self.waveform.set_peaks(peaks)
+        self.scheduler.mark(self.waveform)
+
+    def show_playing(self, playing):
+        self.play_pause_button.icon = "pause_circle_filled_rounded" if playing else "play_circle_filled_rounded"
+        if playing:
+            self.equalizer.start()
+        else:
+            self.equalizer.stop()
+        self.scheduler.mark(self.play_pause_button)
+
+    def show_duration(self, duration_ms):
+        self.total_time_text.value = self.audio_manager.format_time(duration_ms)
+        self.progress_slider.max = duration_ms
+        self.scheduler.mark(self.total_time_text, self.progress_slider)
+
+    def position_changed(self, position_ms):
+        self.equalizer.set_position(position_ms)
+
+    #пока плеер выключен, слайдер позиции не двигаем
+    def show_position(self, position_ms):
+        if self.progress_slider.disabled:
+            return
+        self.progress_slider.value = position_ms
+        changed = [self.progress_slider]
+        current_time = self.audio_manager.format_time(position_ms)
+        if current_time != self.current_time_text.value:
+            self.current_time_text.value = current_time
+            changed.append(self.current_time_text)
+        self.scheduler.mark(*changed)
+
+    def show_queue(self):
+        self.update_queue_list()
+
+    def show_modes(self, shuffle_mode, repeat_mode):
+        self.shuffle_button.icon_color = ft.Colors.PURPLE_ACCENT_400 if shuffle_mode else ft.Colors.GREY
+        self.repeat_button.icon_color = ft.Colors.PURPLE_ACCENT_400 if repeat_mode else ft.Colors.GREY
+        self.scheduler.mark(self.shuffle_button, self.repeat_button)
+
+    def player_changed(self, player):
+        self.scheduler.mark(player)
+
     #таня
     def update_queue_list(self):
-        self.queue_list.controls = [
-            ft.ListTile(
-                leading=ft.Text("•", color=ft.Colors.PURPLE_ACCENT_400) if i == self.audio_manager.current_track_index else None,
-                title=ft.Text(
-                    track["title"],
-                    size=14,
-                    color=ft.Colors.PURPLE_ACCENT_400 if i == self.audio_manager.current_track_index else ft.Colors.WHITE
-                ),
-                on_click=lambda e, idx=i: self.audio_manager.load_track(idx, True, self.track_title, self.play_pause_button, self.current_time_text, self.total_time_text, self.progress_slider, self.page)
-            ) for i, track in enumerate(self.audio_manager.playlist)
-        ]
-        self.page.update()
+        if self.queue_list is None:
+            return
+        changed = self.sync_queue_rows()
+        if changed:
+            self.scheduler.mark(*changed)
+
+    #строки очереди живут между вызовами: при смене трека перекрашиваем две строки,
+    #а при перемешивании переставляем уже созданные ListTile
+    def sync_queue_rows(self):
+        manager = self.audio_manager
+        changed = []
+        if self.queue_version != manager.playlist_version or len(self.queue_list.controls) != len(manager.playlist):
+            tiles = {}
+            for track in manager.playlist:
+                tile = self.queue_tiles.get(track["url"])
+                if tile is None:
+                    tile = self.build_queue_tile(track)
+                #url тот же, но теги после пересканирования могли смениться
+                elif tile.title.value != track["title"]:
+                    tile.title.value = track["title"]
+                tiles[track["url"]] = tile
+            self.queue_tiles = tiles
+            self.queue_index = {track["url"]: i for i, track in enumerate(manager.playlist)}
+            self.queue_list.controls = [tiles[track["url"]] for track in manager.playlist]
+            self.queue_version = manager.playlist_version
+            changed.append(self.queue_list)
+        current_url = manager.playlist[manager.current_track_index]["url"] if manager.playlist else None
+        if current_url != self.queue_current_url:
+            for url, active in ((self.queue_current_url, False), (current_url, True)):
+                tile = self.queue_tiles.get(url)
+                if tile is not None:
+                    self.set_queue_tile_active(tile, active)
+                    changed.append(tile)
+            self.queue_current_url = current_url
+        if self.queue_list in changed:
+            return [self.queue_list]
+        return changed
+
+    def build_queue_tile(self, track):
+        return ft.ListTile(
+            title=ft.Text(track["title"], size=14, color=ft.Colors.WHITE),
+            data=track["url"],
+            on_click=self.serialized(self.queue_click)
+        )
+
+    def set_queue_tile_active(self, tile, active):
+        tile.leading = ft.Text("•", color=ft.Colors.PURPLE_ACCENT_400) if active else None
+        tile.title.color = ft.Colors.PURPLE_ACCENT_400 if active else ft.Colors.WHITE
+
+    @coalesce_updates
+    def queue_click(self, e):
+        idx = self.queue_index.get(e.control.data)
+        if idx is not None:
+            self.audio_manager.load_track(idx, True)
 
     #таня
-    def update_stats_list(self):
-        sorted_counts = sorted(self.audio_manager.play_counts.items(), key=lambda x: x[1], reverse=True)
-        self.stats_list.controls = [
-            ft.ListTile(
-                title=ft.Text(
-                    f"{i+1}. {track} ({count} прослушиваний)",
-                    size=14,
-                    color=ft.Colors.PURPLE_ACCENT_400 if count > 0 else ft.Colors.WHITE
-                )
-            ) for i, (track, count) in enumerate(sorted_counts)
-        ]
-        self.page.update()
+    def update_stats_list(self, ranks=None):
+        if self.stats_list is None:
+            return
+        changed = self.sync_stats_rows(ranks)
+        if changed:
+            self.scheduler.mark(*changed)
+
+    #перерисовываем только строки, у которых сменился трек или счётчик;
+    #ranks - позиции, которые поменял последний инкремент
+    def sync_stats_rows(self, ranks=None):
+        if self.stats_window is not None:
+            return self.sync_window_rows() if ranks is None else []
+        ranking = self.audio_manager.ranking
+        size = min(len(ranking), self.stats_limit) if self.stats_limit is not None else len(ranking)
+        resized = self.resize_stats_rows(size)
+        if resized:
+            ranks = None
+        changed = []
+        positions = range(size) if ranks is None else [rank for rank in ranks if rank < size]
+        for i in positions:
+            key = ranking.order[i]
+            row = (self.audio_manager.track_title(key), ranking.counts[key])
+            if self.stats_rows[i] == row:
+                continue
+            self.stats_rows[i] = row
+            tile = self.stats_list.controls[i]
+            tile.title.value = f"{i+1}. {row[0]} ({row[1]} прослушиваний)"
+            tile.title.color = ft.Colors.PURPLE_ACCENT_400 if row[1] > 0 else ft.Colors.WHITE
+            changed.append(tile)
+        return [self.stats_list] if resized else changed
+
+    def resize_stats_rows(self, size):
+        if len(self.stats_list.controls) == size:
+            return False
+        del self.stats_list.controls[size:]
+        del self.stats_rows[size:]
+        for _ in range(len(self.stats_list.controls), size):
+            self.stats_list.controls.append(ft.ListTile(title=ft.Text("", size=14, color=ft.Colors.WHITE)))
+            self.stats_rows.append(None)
+        return True
+
+    #статистика за последние stats_window дней считается по истории прослушиваний
+    def sync_window_rows(self):
+        since = int((time.time() - self.stats_window * 86400) * 1000)
+        top = self.audio_manager.history.top(since=since, limit=self.stats_limit)
+        resized = self.resize_stats_rows(len(top))
+        changed = []
+        for i, (key, plays, skips, _) in enumerate(top):
+            row = (self.audio_manager.track_title(key), plays, skips)
+            if self.stats_rows[i] == row:
+                continue
+            self.stats_rows[i] = row
+            tile = self.stats_list.controls[i]
+            tile.title.value = f"{i+1}. {row[0]} ({plays} прослушиваний, пропущено {skips / plays:.0%})"
+            tile.title.color = ft.Colors.PURPLE_ACCENT_400
+            changed.append(tile)
+        return [self.stats_list] if resized else changed
+
+    def history_changed(self):
+        if self.stats_window is not None:
+            self.update_stats_list()
+
+    @coalesce_updates
+    def stats_window_changed(self, e):
+        value = self.stats_window_dropdown.value
+        self.stats_window = None if value == "all" else int(value)
+        self.stats_rows = [None] * len(self.stats_rows)
+        self.update_stats_list()
+
+    #поиск запускается не на каждую букву, а после паузы в наборе
+    def search_changed(self, e):
+        self.search_debouncer(self.search_field.value)
+
+    @coalesce_updates
+    def run_search(self, query):
+        results = self.audio_manager.search_index.search(query, self.search_limit) if query else []
+        changed = self.sync_search_rows(results)
+        if changed:
+            self.scheduler.mark(*changed)
+
+    #библиотека поменялась - пересчитываем результаты для уже введённого запроса
+    def update_search_list(self):
+        if self.search_field is not None and self.search_field.value:
+            self.run_search(self.search_field.value)
+
+    #строки результатов переиспользуются, перерисовываются только изменившиеся
+    def sync_search_rows(self, results):
+        controls = self.search_list.controls
+        resized = len(controls) != len(results)
+        if resized:
+            del controls[len(results):]
+            for _ in range(len(controls), len(results)):
+                controls.append(ft.ListTile(title=ft.Text("", size=14, color=ft.Colors.WHITE), on_click=self.serialized(self.search_click)))
+        changed = []
+        for tile, track in zip(controls, results):
+            if tile.data == track["url"] and tile.title.value == track["title"]:
+                continue
+            tile.data = track["url"]
+            tile.title.value = track["title"]
+            changed.append(tile)
+        return [self.search_list] if resized else changed
+
+    @coalesce_updates
+    def search_click(self, e):
+        idx = self.audio_manager.index_of_url(e.control.data)
+        if idx is not None:
+            self.audio_manager.load_track(idx, True)
+
+    #обработчик для Flet: async-функция, которая выполняет handler под lock плеера
+    def serialized(self, handler):
+        async def run(e):
+            await self.audio_manager.run(handler, e)
+        return run
 
     #таня
     def build_ui(self):
@@ -279,7 +709,7 @@ class UIComponents:
             weight=ft.FontWeight.BOLD,
             text_align=ft.TextAlign.LEFT
         )
-        self.equalizer = EqualizerAnimation(width=300, height=265)
+        self.equalizer = EqualizerAnimation(width=300, height=265, animation_loop=self.animation_loop)
         self.visualizer_placeholder = ft.Container(
             content=self.equalizer,
             width=300, height=265,
@@ -292,11 +722,17 @@ class UIComponents:
         self.total_time_text = ft.Text("00:00")
         self.progress_slider = ft.Slider(
             min=0, max=100, value=0,
-            on_change_end=lambda e: self.audio_manager.audio_player.seek(int(e.control.value)),
+            on_change_end=self.serialized(self.seek_end),
             active_color=ft.Colors.PURPLE_ACCENT_100,
             thumb_color=ft.Colors.PURPLE_700,
-            height=20
+            height=20,
+            left=0, right=0, top=8
         )
+        #огибающая лежит под слайдером; по ней видно, где в треке тихие и громкие части
+        self.waveform = WaveformView(width=308, height=36)
+        self.waveform.left = 24
+        self.waveform.top = 0
+        self.progress_stack = ft.Stack(controls=[self.waveform, self.progress_slider], height=36)
         
         self.time_row = ft.Row(
             controls=[self.current_time_text, self.total_time_text],
@@ -305,33 +741,33 @@ class UIComponents:
 
         self.shuffle_button = ft.IconButton(
             icon="shuffle_rounded",
-            on_click=lambda e: self.audio_manager.toggle_shuffle(e, self.shuffle_button, self.page),
+            on_click=self.serialized(self.audio_manager.toggle_shuffle),
             icon_size=30,
             icon_color=ft.Colors.GREY,
             tooltip="Перемешать треки"
         )
         self.prev_button = ft.IconButton(
             icon="skip_previous_rounded",
-            on_click=lambda e: self.audio_manager.prev_track(e, self.track_title, self.play_pause_button, self.current_time_text, self.total_time_text, self.progress_slider, self.page),
+            on_click=self.serialized(self.audio_manager.prev_track),
             icon_size=40,
             icon_color=ft.Colors.PURPLE_ACCENT_400
         )
         self.play_pause_button = ft.IconButton(
             icon="play_circle_filled_rounded",
             visible=True,
-            on_click=lambda e: self.audio_manager.play_pause_click(e, self.play_pause_button, self.page),
+            on_click=self.serialized(self.audio_manager.play_pause_click),
             icon_size=60,
             icon_color=ft.Colors.PURPLE_ACCENT_400
         )
         self.next_button = ft.IconButton(
             icon="skip_next_rounded",
-            on_click=lambda e: self.audio_manager.next_track(e, self.track_title, self.play_pause_button, self.current_time_text, self.total_time_text, self.progress_slider, self.page),
+            on_click=self.serialized(self.audio_manager.next_track),
             icon_size=40,
             icon_color=ft.Colors.PURPLE_ACCENT_400
         )
         self.repeat_button = ft.IconButton(
             icon="repeat_rounded",
-            on_click=lambda e: self.audio_manager.toggle_repeat(e, self.repeat_button, self.page),
+            on_click=self.serialized(self.audio_manager.toggle_repeat),
             icon_size=30,
             icon_color=ft.Colors.GREY,
             tooltip="Повтор трека"
@@ -343,20 +779,20 @@ class UIComponents:
         )
         self.volume_down_button = ft.IconButton(
             icon="volume_down_rounded",
-            on_click=self.volume_down,
+            on_click=self.serialized(self.volume_down),
             icon_size=30,
             icon_color=ft.Colors.PURPLE_ACCENT_400
         )
         self.volume_up_button = ft.IconButton(
             icon="volume_up_rounded",
-            on_click=self.volume_up,
+            on_click=self.serialized(self.volume_up),
             icon_size=30,
             icon_color=ft.Colors.PURPLE_ACCENT_400
         )
 
         self.volume_slider = ft.Slider(
             min=0, max=1, divisions=100, value=0.5,
-            width=150, on_change=self.volume_change,
+            width=150, on_change=self.serialized(self.volume_change),
             active_color=ft.Colors.PURPLE_ACCENT_100,
             thumb_color=ft.Colors.PURPLE_700,
             height=20,
@@ -369,13 +805,13 @@ class UIComponents:
 
         self.power_switch = ft.Switch(
             label="On",
-            on_change=self.toggle_player_power,
+            on_change=self.serialized(self.toggle_player_power),
             value=True,
             active_color=ft.Colors.PURPLE_ACCENT_200
         )
         self.help_button = ft.IconButton(
             icon="help_outline_rounded",
-            on_click=self.toggle_help,
+            on_click=self.serialized(self.toggle_help),
             tooltip="Справка",
             icon_color=ft.Colors.PURPLE_ACCENT_400
         )
@@ -385,40 +821,6 @@ class UIComponents:
             vertical_alignment=ft.CrossAxisAlignment.CENTER
         )
 
-        self.help_text_content = ("▶️/⏸️: Запуск/пауза\n" "🔀: Перемешать треки\n" "⏪/⏩: Переключение\n" "🔉: Громкость\n" "🔁: Повтор трека\n" "On/Off: Вкл/Выкл")
-        self.close_button = ft.ElevatedButton(
-            "Закрыть",
-            on_click=self.toggle_help,
-            bgcolor=ft.Colors.PURPLE_ACCENT_400,
-            color=ft.Colors.WHITE
-        )
-        self.help_panel = ft.Container(
-            content=ft.Column(
-                [
-                    ft.Text("Справка", size=18, weight=ft.FontWeight.BOLD),
-                    ft.Text(self.help_text_content, size=14),
-                    self.close_button
-                ],
-                spacing=12,
-                horizontal_alignment=ft.CrossAxisAlignment.CENTER
-            ),
-            width=300,
-            height=250,
-            padding=20,
-            border_radius=ft.border_radius.all(8),
-            bgcolor=ft.Colors.GREY_800.with_opacity(0.95, ft.Colors.GREY_800),
-            alignment=ft.alignment.center
-        )
-        self.help_container = ft.Container(
-            content=self.help_panel,
-            alignment=ft.alignment.center,
-            visible=False,
-            width=400,
-            height=750,
-            bgcolor=ft.Colors.BLACK.with_opacity(0.3, ft.Colors.BLACK)
-        )
-        self.page.overlay.append(self.help_container)
-
         self.player_layout = ft.Container(
             content=ft.Column(
                 controls=[
@@ -426,7 +828,7 @@ class UIComponents:
                     ft.Divider(height=10, color="transparent"),
                     self.visualizer_placeholder,
                     self.track_title,
-                    self.progress_slider,
+                    self.progress_stack,
                     self.time_row,
                     self.playback_controls,
                     self.volume_controls
@@ -442,66 +844,41 @@ class UIComponents:
             bgcolor=ft.Colors.BLACK26
         )
 
-        self.queue_list = ft.ListView(
-            controls=[
-                ft.ListTile(
-                    leading=ft.Text("•", color=ft.Colors.PURPLE_ACCENT_400) if i == self.audio_manager.current_track_index else None,
-                    title=ft.Text(
-                        track["title"],
-                        size=14,
-                        color=ft.Colors.PURPLE_ACCENT_400 if i == self.audio_manager.current_track_index else ft.Colors.WHITE
-                    ),
-                    on_click=lambda e, idx=i: self.audio_manager.load_track(idx, True, self.track_title, self.play_pause_button, self.current_time_text, self.total_time_text, self.progress_slider, self.page)
-                ) for i, track in enumerate(self.audio_manager.playlist)
-            ],
-            spacing=5,
-            padding=10
-        )
-
-        self.stats_list = ft.ListView(
-            controls=[
-                ft.ListTile(
-                    title=ft.Text(
-                        f"{i+1}. {track} ({count} прослушиваний)",
-                        size=14,
-                        color=ft.Colors.PURPLE_ACCENT_400 if count > 0 else ft.Colors.WHITE
-                    )
-                ) for i, (track, count) in enumerate(sorted(self.audio_manager.play_counts.items(), key=lambda x: x[1], reverse=True))
-            ],
-            spacing=5,
-            padding=10
-        )
+        #вкладки, кроме плеера, и справка строятся при первом открытии
+        self.queue_list = None
+        self.stats_list = None
+        self.stats_window = None
+        self.search_field = None
+        self.search_list = None
+        self.diagnostics_text = None
+        self.help_container = None
+        self.search_debouncer = Debouncer(0.15, lambda query: self.audio_manager.submit(self.run_search, query))
 
+        tabs = [
+            ft.Tab(
+                text="Плеер",
+                content=ft.Container(
+                    content=self.player_layout,
+                    alignment=ft.alignment.top_left
+                ),
+                tab_content=ft.Text("Плеер", color=ft.Colors.WHITE)
+            ),
+            ft.Tab(text="В очереди", tab_content=ft.Text("В очереди", color=ft.Colors.WHITE)),
+            ft.Tab(text="Статистика", tab_content=ft.Text("Статистика", color=ft.Colors.WHITE)),
+            ft.Tab(text="Поиск", tab_content=ft.Text("Поиск", color=ft.Colors.WHITE)),
+        ]
+        self.tab_builders = {1: self.build_queue_tab, 2: self.build_stats_tab, 3: self.build_search_tab}
+        self.diagnostics_tab = None
+        if self.diagnostics:
+            self.diagnostics_tab = ft.Tab(text="Диагностика", tab_content=ft.Text("Диагностика", color=ft.Colors.WHITE))
+            self.tab_builders[len(tabs)] = self.build_diagnostics_tab
+            tabs.append(self.diagnostics_tab)
         self.tabs = ft.Tabs(
             selected_index=0,
             animation_duration=300,
-            tabs=[
-                ft.Tab(
-                    text="Плеер",
-                    content=ft.Container(
-                        content=self.player_layout,
-                        alignment=ft.alignment.top_left
-                    ),
-                    tab_content=ft.Text("Плеер", color=ft.Colors.WHITE)
-                ),
-                ft.Tab(
-                    text="В очереди",
-                    content=ft.Container(
-                        content=self.queue_list,
-                        alignment=ft.alignment.top_left
-                    ),
-                    tab_content=ft.Text("В очереди", color=ft.Colors.WHITE)
-                ),
-                ft.Tab(
-                    text="Статистика",
-                    content=ft.Container(
-                        content=self.stats_list,
-                        alignment=ft.alignment.top_left
-                    ),
-                    tab_content=ft.Text("Статистика", color=ft.Colors.WHITE)
-                ),
-            ],
+            tabs=tabs,
             expand=True,
+            on_change=self.serialized(self.tab_changed),
             tab_alignment=ft.MainAxisAlignment.CENTER,
             indicator_color=ft.Colors.PURPLE_ACCENT_400,
             label_color=ft.Colors.PURPLE_ACCENT_400
@@ -514,26 +891,206 @@ class UIComponents:
         self.page.horizontal_alignment = ft.CrossAxisAlignment.START
         self.page.vertical_alignment = ft.MainAxisAlignment.START
 
+    def build_queue_tab(self):
+        self.queue_list = ft.ListView(
+            controls=[],
+            spacing=5,
+            padding=10
+        )
+        self.queue_tiles = {}
+        self.queue_index = {}
+        self.queue_version = None
+        self.queue_current_url = None
+        self.sync_queue_rows()
+        return ft.Container(
+            content=self.queue_list,
+            alignment=ft.alignment.top_left
+        )
+
+    def build_stats_tab(self):
+        self.stats_list = ft.ListView(
+            controls=[],
+            spacing=5,
+            padding=10,
+            expand=True
+        )
+        self.stats_rows = []
+        self.sync_stats_rows()
+        self.stats_window_dropdown = ft.Dropdown(
+            value="all",
+            options=[
+                ft.dropdown.Option(key="all", text="За всё время"),
+                ft.dropdown.Option(key="7", text="За 7 дней"),
+                ft.dropdown.Option(key="30", text="За 30 дней"),
+            ],
+            on_change=self.serialized(self.stats_window_changed),
+            width=200
+        )
+        return ft.Container(
+            content=ft.Column([self.stats_window_dropdown, self.stats_list], expand=True),
+            alignment=ft.alignment.top_left,
+            padding=ft.padding.only(top=10)
+        )
+
+    def build_search_tab(self):
+        self.search_field = ft.TextField(
+            hint_text="Название, исполнитель или альбом",
+            on_change=self.serialized(self.search_changed),
+            border_color=ft.Colors.PURPLE_ACCENT_400
+        )
+        self.search_list = ft.ListView(
+            controls=[],
+            spacing=5,
+            padding=10,
+            expand=True
+        )
+        return ft.Container(
+            content=ft.Column([self.search_field, self.search_list], expand=True),
+            alignment=ft.alignment.top_left,
+            padding=ft.padding.only(left=10, top=10, right=10)
+        )
+
+    def build_diagnostics_tab(self):
+        self.diagnostics_text = ft.Text("", size=12, font_family="monospace", selectable=True)
+        return ft.Container(
+            content=ft.Column(
+                [
+                    ft.Row([
+                        ft.ElevatedButton("Обновить", on_click=self.serialized(self.refresh_diagnostics)),
+                        ft.ElevatedButton("Сохранить", on_click=self.serialized(self.export_metrics)),
+                    ]),
+                    ft.Column([self.diagnostics_text], scroll=ft.ScrollMode.AUTO, expand=True),
+                ],
+                expand=True
+            ),
+            alignment=ft.alignment.top_left,
+            padding=ft.padding.only(left=10, top=10, right=10)
+        )
+
+    def build_help(self):
+        self.help_text_content = ("▶️/⏸️: Запуск/пауза\n" "🔀: Перемешать треки\n" "⏪/⏩: Переключение\n" "🔉: Громкость\n" "🔁: Повтор трека\n" "On/Off: Вкл/Выкл")
+        self.close_button = ft.ElevatedButton(
+            "Закрыть",
+            on_click=self.serialized(self.toggle_help),
+            bgcolor=ft.Colors.PURPLE_ACCENT_400,
+            color=ft.Colors.WHITE
+        )
+        self.help_panel = ft.Container(
+            content=ft.Column(
+                [
+                    ft.Text("Справка", size=18, weight=ft.FontWeight.BOLD),
+                    ft.Text(self.help_text_content, size=14),
+                    self.close_button
+                ],
+                spacing=12,
+                horizontal_alignment=ft.CrossAxisAlignment.CENTER
+            ),
+            width=300,
+            height=250,
+            padding=20,
+            border_radius=ft.border_radius.all(8),
+            bgcolor=ft.Colors.GREY_800.with_opacity(0.95, ft.Colors.GREY_800),
+            alignment=ft.alignment.center
+        )
+        self.help_container = ft.Container(
+            content=self.help_panel,
+            alignment=ft.alignment.center,
+            visible=False,
+            width=400,
+            height=750,
+            bgcolor=ft.Colors.BLACK.with_opacity(0.3, ft.Colors.BLACK)
+        )
+        self.page.overlay.append(self.help_container)
+
+    #строит содержимое вкладки при первом открытии
+    def ensure_tab(self, index):
+        builder = self.tab_builders.pop(index, None)
+        if builder is not None:
+            self.tabs.tabs[index].content = builder()
+            self.scheduler.mark(self.tabs.tabs[index])
+
+    #эквалайзер анимируется, только пока видна вкладка плеера
+    @coalesce_updates
+    def tab_changed(self, e):
+        self.animation_loop.set_visible(self.tabs.selected_index == 0 and self.app_visible)
+        self.ensure_tab(self.tabs.selected_index)
+        if self.diagnostics_tab is not None and self.tabs.tabs[self.tabs.selected_index] is self.diagnostics_tab:
+            self.refresh_diagnostics()
+
+    def app_lifecycle_changed(self, e):
+        self.app_visible = e.state not in (ft.AppLifecycleState.HIDE, ft.AppLifecycleState.PAUSE, ft.AppLifecycleState.DETACH)
+        self.tab_changed(e)
+
+    def close(self, e=None):
+        self.search_debouncer.cancel()
+        self.equalizer.stop()
+        self.animation_loop.shutdown()
+        self.audio_manager.close()
+        if self.diagnostics:
+            REGISTRY.write(self.metrics_file)
+
+    #сводка метрик: обработчики по суммарному времени, отправки page.update(), кадры и потоки
+    def diagnostics_lines(self):
+        ms = lambda seconds: "-" if seconds is None else f"{seconds * 1000:.2f}"
+        lines = [f"{'обработчик':<36} {'вызовы':>7} {'p50 мс':>7} {'p95 мс':>7} {'всего мс':>9}"]
+        handlers = REGISTRY.family("player_handler_seconds")
+        for labels, histogram in sorted(handlers, key=lambda item: -item[1].sum):
+            lines.append(f"{labels['handler']:<36} {histogram.count:>7} {ms(histogram.quantile(0.5)):>7} {ms(histogram.quantile(0.95)):>7} {histogram.sum * 1000:>9.1f}")
+        for kind in ("partial", "full"):
+            histogram = REGISTRY.histogram("player_page_update_seconds", kind=kind)
+            if histogram is not None:
+                lines.append(f"page.update() {kind}: {histogram.count}, p95 {ms(histogram.quantile(0.95))} мс")
+        sizes = REGISTRY.histogram("player_page_update_controls")
+        if sizes is not None:
+            lines.append(f"контролов за отправку: в среднем {sizes.sum / sizes.count:.1f}, p95 {sizes.quantile(0.95)}")
+        lines.append(f"отправок сэкономлено: {self.scheduler.saved}")
+        frames = REGISTRY.histogram("player_animation_frame_seconds")
+        if frames is not None:
+            late = REGISTRY.counter("player_animation_late_frames_total")
+            lines.append(f"кадры эквалайзера: {frames.count}, p95 {ms(frames.quantile(0.95))} мс, опоздали {late}")
+        lines.append(f"потоков: {threading.active_count()}")
+        lines.append(f"сессий на библиотеке: {len(self.audio_manager.library.sessions)}")
+        groups = self.audio_manager.duplicate_groups
+        lines.append(f"дубликаты: {len(groups)} групп, лишних копий {sum(len(group) - 1 for group in groups)}")
+        lines.append("")
+        lines.append(f"запуск (импорт модулей {IMPORT_SECONDS * 1000:.1f} мс):")
+        lines.extend(self.startup.report())
+        return lines
+
+    @coalesce_updates
+    def refresh_diagnostics(self, e=None):
+        self.diagnostics_text.value = "\n".join(self.diagnostics_lines())
+        self.scheduler.mark(self.diagnostics_text)
+
+    #рядом с файлом в формате Prometheus кладём тот же снимок в JSON
+    def export_metrics(self, e=None):
+        REGISTRY.write(self.metrics_file)
+        REGISTRY.write(os.path.splitext(self.metrics_file)[0] + ".json")
+
+    def seek_end(self, e):
+        self.audio_manager.audio_player.seek(int(e.control.value))
+
     #таня
+    @coalesce_updates
     def volume_change(self, e):
-        self.audio_manager.audio_player.volume = self.volume_slider.value
-        self.audio_manager.audio_player.update()
+        self.scheduler.mark(*self.audio_manager.set_volume(self.volume_slider.value))
 
     #таня
+    @coalesce_updates
     def volume_down(self, e):
-        new_volume = max(0, self.audio_manager.audio_player.volume - 0.1)
-        self.audio_manager.audio_player.volume = new_volume
+        new_volume = max(0, self.audio_manager.volume - 0.1)
         self.volume_slider.value = new_volume
-        self.page.update()
+        self.scheduler.mark(*self.audio_manager.set_volume(new_volume), self.volume_slider)
 
     #таня
+    @coalesce_updates
     def volume_up(self, e):
-        new_volume = min(1, self.audio_manager.audio_player.volume + 0.1)
-        self.audio_manager.audio_player.volume = new_volume
+        new_volume = min(1, self.audio_manager.volume + 0.1)
         self.volume_slider.value = new_volume
-        self.page.update()
+        self.scheduler.mark(*self.audio_manager.set_volume(new_volume), self.volume_slider)
 
     #таня
+    @coalesce_updates
     def toggle_player_power(self, e):
         is_on = e.data == "true"
         is_disabled = not is_on
@@ -544,17 +1101,19 @@ class UIComponents:
             button.icon_color = button_color
         for slider in [self.progress_slider, self.volume_slider]:
             slider.disabled = is_disabled
-        if not is_on and self.audio_manager.audio_player.src:
-            self.audio_manager.audio_player.pause()
-            self.audio_manager.current_state = ft.AudioState.PAUSED
-            self.play_pause_button.icon = "play_circle_filled_rounded"
-            self.equalizer.stop()
-        self.page.update()
+        if not is_on:
+            self.audio_manager.pause()
+        self.scheduler.mark(self.power_switch, self.playback_controls, self.volume_controls, self.progress_slider)
 
     #таня
+    @coalesce_updates
     def toggle_help(self, e):
+        if self.help_container is None:
+            self.build_help()
+            #новый контрол в page.overlay уходит клиенту только с полным обновлением
+            self.scheduler.mark()
         self.help_container.visible = not self.help_container.visible
-        self.page.update()
+        self.scheduler.mark(self.help_container)
 
 #таня
 def main(page: ft.Page):
@@ -563,11 +1122,49 @@ def main(page: ft.Page):
     page.vertical_alignment = ft.MainAxisAlignment.START
     page.theme_mode = ft.ThemeMode.DARK
 
-    audio_manager = AudioPlayerManager(page, None)
-    ui = UIComponents(page, audio_manager)
+    diagnostics = bool(os.environ.get("PLAYER_DIAGNOSTICS"))
+    #в веб-режиме main() вызывается для каждой вкладки, а библиотека на процесс одна;
+    #этапы запуска считаются для каждой вкладки отдельно
+    startup = StartupTimer()
+    with startup.phase("library"):
+        library = shared_library()
+        #PLAYER_TRACKS_URL - внешний адрес сервера, если вкладки открываются не на этой машине
+        library.serve_tracks(os.environ.get("PLAYER_TRACKS_HOST", "127.0.0.1"), int(os.environ.get("PLAYER_TRACKS_PORT", "0")), os.environ.get("PLAYER_TRACKS_URL"))
+        #серверы запускаются до создания сессии, чтобы ошибка порта не оставила её подключённой к библиотеке
+        if os.environ.get("PLAYER_METRICS_PORT"):
+            library.serve_metrics(int(os.environ["PLAYER_METRICS_PORT"]))
+        audio_manager = AudioPlayerManager(page, None, library=library)
+    audio_manager.collapse_duplicates = bool(os.environ.get("PLAYER_COLLAPSE_DUPLICATES"))
+    with startup.phase("ui build"):
+        ui = UIComponents(page, audio_manager, diagnostics=diagnostics, startup=startup)
     audio_manager.ui = ui
+    audio_manager.loop = page.loop
+    page.on_app_lifecycle_state_change = ui.serialized(ui.app_lifecycle_changed)
+    #on_disconnect не конец сессии: Flet держит её и после переподключения вкладки,
+    #поэтому сессия отключается от библиотеки только в on_close
+    page.on_close = ui.close
     page.add(ui.tabs)
-    audio_manager.load_track(0, False, ui.track_title, ui.play_pause_button, ui.current_time_text, ui.total_time_text, ui.progress_slider, page)
+    if audio_manager.playlist:
+        audio_manager.load_track(0, False)
+    #первая отрисовка - момент, когда вкладка плеера ушла клиенту, от начала main() этой вкладки
+    startup.mark("first paint")
+
+    #индекс поиска и пересканирование папки - уже после первой отрисовки
+    async def load_library():
+        with startup.phase("search index"):
+            await audio_manager.index_library()
+        #наблюдатель запускается до пересканирования, чтобы не потерять файлы, появившиеся во время обхода
+        audio_manager.watch_library()
+        with startup.phase("scan"):
+            await audio_manager.scan_library()
+        with startup.phase("duplicates"):
+            await audio_manager.detect_duplicates()
+        if diagnostics:
+            print("\n".join(startup.report()), file=sys.stderr)
+        await audio_manager.analyze_loudness()
+
+    if library.claim_loader(audio_manager):
+        page.run_task(load_library)
 
 if __name__ == "__main__":
     ft.app(target=main)
\ No newline at end of file
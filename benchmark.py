@@ -0,0 +1,224 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+from audio_player import AudioPlayerManager, UIComponents
+from catalog import TrackCatalog
+from library import MusicLibrary
+from simulation import VirtualClock, FakeAudioBackend
+
+BASELINE_PATH = "benchmark_baseline.json"
+SIZES = (1000, 10000, 100000)
+
+
+#страница, которая только считает вызовы page.update()
+class CountingPage:
+    def __init__(self):
+        self.overlay = []
+        self.updates = 0
+
+    def update(self, *controls):
+        self.updates += 1
+
+
+#минимальный id3v2.3 с названием, чтобы при сканировании работал и разбор тегов
+def id3_tag(title):
+    text = b"\x00" + title.encode("latin-1")
+    frame = b"TIT2" + len(text).to_bytes(4, "big") + b"\x00\x00" + text
+    size = len(frame)
+    return b"ID3\x03\x00\x00" + bytes([size >> 21 & 0x7F, size >> 14 & 0x7F, size >> 7 & 0x7F, size & 0x7F]) + frame
+
+
+#папка как у настоящей библиотеки: исполнитель/альбом/трек, по per_dir файлов в альбоме
+def make_library(root, count, per_dir=100):
+    for i in range(count):
+        directory = os.path.join(root, f"artist{i // (per_dir * 10):03d}", f"album{i // per_dir:04d}")
+        if i % per_dir == 0:
+            os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{i % per_dir:03d} track{i}.mp3"), "wb") as f:
+            f.write(id3_tag(f"Track {i}"))
+
+
+def measure(run, page, repeat, setup=None):
+    times = []
+    updates = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        before = page.updates
+        start = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - start) * 1000)
+        updates.append(page.updates - before)
+    #память меряем отдельным прогоном: tracemalloc сильно замедляет код
+    if setup is not None:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "median_ms": statistics.median(times),
+        "min_ms": min(times),
+        "peak_kb": peak / 1024,
+        "updates": max(updates),
+    }
+
+
+def bench_size(size, repeat, workdir):
+    results = {}
+    root = os.path.join(workdir, f"tracks{size}")
+    start = time.perf_counter()
+    make_library(root, size)
+    print(f"[{size}] библиотека создана за {time.perf_counter() - start:.1f} с", file=sys.stderr)
+
+    page = CountingPage()
+    data = os.path.join(workdir, f"data{size}")
+    db_path = os.path.join(data, "library.db")
+    os.makedirs(data)
+    library = MusicLibrary(root, db_path=db_path, cache_dir=os.path.join(data, ".cache"),
+                           play_counts_path=os.path.join(data, "play_counts"), history_dir=os.path.join(data, "history"))
+    manager = AudioPlayerManager(None, None, backend=FakeAudioBackend(VirtualClock()), library=library)
+    #анализ спектра идёт в отдельном процессе и в замеры не входит
+    manager.track_loading = lambda track: None
+
+    def fresh_catalog():
+        manager.catalog.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        manager.catalog = TrackCatalog(db_path)
+
+    results["load_local_tracks cold"] = measure(manager.load_local_tracks, page, max(1, repeat // 3), fresh_catalog)
+    results["load_local_tracks warm"] = measure(manager.load_local_tracks, page, repeat)
+    tracks = manager.load_local_tracks()
+    manager.original_playlist = tracks
+    manager.playlist = tracks.copy()
+    manager.play_counts = {manager.track_key(track): 0 for track in tracks}
+
+    ui = None
+
+    #кадры эквалайзера идут из своего потока и в page.update() обработчиков не входят
+    def build_ui():
+        nonlocal ui
+        ui = UIComponents(page, manager)
+        ui.animation_loop.set_visible(False)
+
+    results["ui build"] = measure(build_ui, page, max(1, repeat // 3))
+    #вкладки очереди и статистики строятся при первом открытии
+    results["open queue and stats tabs"] = measure(lambda: (ui.ensure_tab(1), ui.ensure_tab(2)), page, max(1, repeat // 3), build_ui)
+    manager.ui = ui
+
+    def shuffle_off():
+        if manager.shuffle_mode:
+            manager.toggle_shuffle()
+
+    results["toggle_shuffle on"] = measure(manager.toggle_shuffle, page, repeat, shuffle_off)
+    results["toggle_shuffle off"] = measure(manager.toggle_shuffle, page, repeat, lambda: None if manager.shuffle_mode else manager.toggle_shuffle())
+
+    shuffle_off()
+    results["next_track linear"] = measure(manager.next_track, page, repeat)
+    manager.toggle_shuffle()
+    results["next_track shuffle"] = measure(manager.next_track, page, repeat)
+    shuffle_off()
+
+    def reorder():
+        #без перемешивания очередь - это список библиотеки, его на месте не меняем
+        manager.playlist = manager.playlist[::-1]
+        manager.playlist_version += 1
+
+    results["update_queue_list reorder"] = measure(ui.update_queue_list, page, repeat, reorder)
+
+    def move_current():
+        manager.current_track_index = random.randrange(len(manager.playlist))
+
+    results["update_queue_list track change"] = measure(ui.update_queue_list, page, repeat, move_current)
+
+    rng = random.Random(size)
+    results["update_stats_list after play"] = measure(lambda: manager.count_play(manager.playlist[rng.randrange(len(manager.playlist))]), page, repeat)
+
+    manager.duration_ms = 10 ** 9
+
+    #пачка событий позиции, пришедших почти одновременно (например, после подвисания клиента)
+    def position_burst():
+        for position in range(1000):
+            manager.audio_position_changed(SimpleNamespace(control=manager.audio_player, data=str(position)))
+
+    results["audio_position_changed x1000"] = measure(position_burst, page, repeat)
+    ui.close()
+    manager.close()
+    return {f"{size}/{name}": value for name, value in results.items()}
+
+
+#совсем короткие замеры шумят, поэтому регрессией считаем рост больше чем на min_delta_ms
+def compare(results, baseline, threshold, min_delta_ms=0.1):
+    regressions = []
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = value["median_ms"] / base["median_ms"] if base["median_ms"] else 1.0
+        value["baseline_ratio"] = ratio
+        if ratio > threshold and value["median_ms"] - base["median_ms"] > min_delta_ms:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def report(results):
+    width = max(len(name) for name in results)
+    print(f"{'замер':<{width}}  {'медиана, мс':>12}  {'мин, мс':>10}  {'пик, КБ':>10}  {'update()':>8}  {'к базе':>7}")
+    for name, value in results.items():
+        ratio = value.get("baseline_ratio")
+        print(
+            f"{name:<{width}}  {value['median_ms']:>12.3f}  {value['min_ms']:>10.3f}  {value['peak_kb']:>10.0f}"
+            f"  {value['updates']:>8}  {'' if ratio is None else f'{ratio:.2f}x':>7}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры горячих путей плеера на синтетической библиотеке")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeat", type=int, default=9)
+    parser.add_argument("--save", action="store_true", help="сохранить результаты как базу для сравнения")
+    parser.add_argument("--compare", action="store_true", help="сравнить с сохранённой базой")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=1.25, help="во сколько раз медиана может вырасти без ошибки")
+    args = parser.parse_args(argv)
+    baseline_path = os.path.abspath(args.baseline)
+
+    results = {}
+    #каталог, счётчики и история - во временной папке, чтобы не трогать настоящие
+    workdir = tempfile.mkdtemp(prefix="player-bench-")
+    try:
+        for size in args.sizes:
+            results.update(bench_size(size, args.repeat, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    regressions = []
+    if args.compare:
+        with open(baseline_path, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+    report(results)
+    if args.save:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            saved = {name: {key: v for key, v in value.items() if key != "baseline_ratio"} for name, value in results.items()}
+            json.dump({"machine": platform.machine(), "python": platform.python_version(), "results": saved}, f, indent=1, ensure_ascii=False)
+    for name, ratio in regressions:
+        print(f"регрессия: {name} медленнее базы в {ratio:.2f} раза", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
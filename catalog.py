@@ -0,0 +1,214 @@
+import math
+import sqlite3
+import threading
+from scanner import LibraryScanner
+
+SCHEMA_VERSION = 4
+TRACK_COLUMNS = "id, path, title, artist, album, track_no"
+
+
+def _track(row):
+    track_id, path, title, artist, album, track_no = row
+    return {"id": track_id, "url": path, "title": title, "artist": artist, "album": album, "track_no": track_no}
+
+
+#каталог треков на диске: строки ключуются путём, рядом храним mtime и размер.
+#в analysis - результаты анализа громкости; они верны, пока mtime и размер файла совпадают с tracks
+class TrackCatalog:
+    def __init__(self, db_path="library.db"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        #каталог - это кэш, поэтому при смене схемы его проще пересоздать.
+        #но id треков - ключи счётчиков прослушиваний, так что новые версии схемы
+        #должны переносить таблицу tracks, а не сбрасывать её
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.conn.executescript("DROP TABLE IF EXISTS dirs; DROP TABLE IF EXISTS tracks;")
+        self.conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                root TEXT NOT NULL,
+                parent TEXT,
+                mtime_ns INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS tracks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL UNIQUE,
+                root TEXT NOT NULL,
+                dir TEXT NOT NULL,
+                title TEXT NOT NULL,
+                artist TEXT,
+                album TEXT,
+                track_no INTEGER,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS analysis (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                lufs REAL
+            );
+            CREATE INDEX IF NOT EXISTS dirs_root ON dirs(root);
+            CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+            CREATE INDEX IF NOT EXISTS tracks_root ON tracks(root, path);
+            CREATE INDEX IF NOT EXISTS tracks_dir ON tracks(dir);
+            PRAGMA user_version = {SCHEMA_VERSION};
+            """
+        )
+        self.conn.commit()
+
+    def refresh(self, root, scanner=None):
+        scanner = scanner or LibraryScanner(self)
+        for _ in scanner.scan(root):
+            pass
+        return scanner.dirs_rescanned > 0
+
+    def tracks(self, root):
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {TRACK_COLUMNS} FROM tracks WHERE root = ? ORDER BY dir, track_no, path", (root,)
+            ).fetchall()
+        return [_track(row) for row in rows]
+
+    def dir_states(self, root):
+        with self._lock:
+            return dict(self.conn.execute("SELECT path, mtime_ns FROM dirs WHERE root = ?", (root,)))
+
+    def dir_tracks(self, directory):
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {TRACK_COLUMNS} FROM tracks WHERE dir = ? ORDER BY track_no, path", (directory,)
+            ).fetchall()
+        return [_track(row) for row in rows]
+
+    #треки папки вместе со всеми вложенными
+    def tree_tracks(self, directory):
+        prefix = directory + "/"
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {TRACK_COLUMNS} FROM tracks WHERE dir = ? OR substr(dir, 1, ?) = ?", (directory, len(prefix), prefix)
+            ).fetchall()
+        return [_track(row) for row in rows]
+
+    def file_states(self, directory):
+        with self._lock:
+            return {
+                path: (mtime_ns, size)
+                for path, mtime_ns, size in self.conn.execute(
+                    "SELECT path, mtime_ns, size FROM tracks WHERE dir = ?", (directory,)
+                )
+            }
+
+    #кандидаты в дубликаты: файлы, чей размер встречается в папке больше одного раза
+    def same_size_files(self, root):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT path, size FROM tracks WHERE root = ? AND size IN "
+                "(SELECT size FROM tracks WHERE root = ? GROUP BY size HAVING COUNT(*) > 1)", (root, root)
+            ).fetchall()
+
+    #громкость, посчитанная при прошлых запусках, для файлов, которые с тех пор не менялись.
+    #nan - тишина (sqlite хранит nan как NULL)
+    def loudness(self, root):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT a.path, a.lufs FROM analysis a JOIN tracks t ON t.path = a.path "
+                "WHERE t.root = ? AND a.mtime_ns = t.mtime_ns AND a.size = t.size", (root,)
+            ).fetchall()
+        return {path: math.nan if lufs is None else lufs for path, lufs in rows}
+
+    #(хэш, lufs) файла, если он не менялся после анализа, иначе None
+    def analysis(self, path):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT a.digest, a.lufs FROM analysis a JOIN tracks t ON t.path = a.path "
+                "WHERE a.path = ? AND a.mtime_ns = t.mtime_ns AND a.size = t.size", (path,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], math.nan if row[1] is None else row[1]
+
+    def store_analysis(self, path, mtime_ns, size, digest, lufs):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO analysis VALUES (?, ?, ?, ?, ?)",
+                (path, mtime_ns, size, digest, None if math.isnan(lufs) else lufs)
+            )
+            self.conn.commit()
+
+    def subdirs(self, directory):
+        with self._lock:
+            return [row[0] for row in self.conn.execute("SELECT path FROM dirs WHERE parent = ?", (directory,))]
+
+    #changed - строки (path, title, artist, album, track_no, mtime_ns, size) только для изменившихся файлов
+    def store_dir(self, root, directory, mtime_ns, paths, changed, subdirs):
+        with self._lock:
+            seen = set(paths)
+            stored = self.conn.execute("SELECT path, mtime_ns, size FROM tracks WHERE dir = ?", (directory,)).fetchall()
+            gone = {path: (file_mtime_ns, size) for path, file_mtime_ns, size in stored if path not in seen}
+            #переименование внутри папки: у нового файла те же mtime и размер, что у пропавшего.
+            #строка переезжает на новый путь вместе с id, и счётчики прослушиваний сохраняются
+            if gone and changed:
+                renamed_from = {state: path for path, state in gone.items()}
+                existing = {row[0] for row in stored}
+                for path, *_, file_mtime_ns, size in changed:
+                    old = renamed_from.pop((file_mtime_ns, size), None)
+                    if old is not None and path not in existing:
+                        self.conn.execute("UPDATE tracks SET path = ? WHERE path = ?", (path, old))
+                        self.conn.execute("UPDATE OR REPLACE analysis SET path = ? WHERE path = ?", (path, old))
+                        del gone[old]
+            if gone:
+                self.conn.executemany("DELETE FROM tracks WHERE path = ?", [(path,) for path in gone])
+                self.conn.executemany("DELETE FROM analysis WHERE path = ?", [(path,) for path in gone])
+            if changed:
+                #upsert, а не REPLACE: строка и её id сохраняются при изменении файла
+                self.conn.executemany(
+                    """
+                    INSERT INTO tracks (path, root, dir, title, artist, album, track_no, mtime_ns, size)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(path) DO UPDATE SET
+                        root = excluded.root, dir = excluded.dir, title = excluded.title,
+                        artist = excluded.artist, album = excluded.album, track_no = excluded.track_no,
+                        mtime_ns = excluded.mtime_ns, size = excluded.size
+                    """,
+                    [(path, root, directory, *rest) for path, *rest in changed]
+                )
+            current = set(subdirs)
+            for (old,) in self.conn.execute("SELECT path FROM dirs WHERE parent = ?", (directory,)).fetchall():
+                if old not in current:
+                    self._drop_tree(old)
+            parent = None if directory == root else directory.rsplit("/", 1)[0]
+            self.conn.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)", (directory, root, parent, mtime_ns))
+
+    def drop_dir(self, directory):
+        with self._lock:
+            self._drop_tree(directory)
+
+    def forget_root(self, root):
+        with self._lock:
+            self.conn.execute("DELETE FROM tracks WHERE root = ?", (root,))
+            self.conn.execute("DELETE FROM dirs WHERE root = ?", (root,))
+            self.conn.commit()
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def _drop_tree(self, directory):
+        prefix = directory + "/"
+        self.conn.execute(
+            "DELETE FROM tracks WHERE dir = ? OR substr(dir, 1, ?) = ?", (directory, len(prefix), prefix)
+        )
+        self.conn.execute(
+            "DELETE FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?", (directory, len(prefix), prefix)
+        )
+        self.conn.execute("DELETE FROM analysis WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))
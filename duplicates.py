@@ -0,0 +1,95 @@
+import argparse
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from analysis import file_hash
+from scanner import AUDIO_EXTENSIONS
+
+PARTIAL_CHUNK = 64 * 1024
+
+
+#blake2b от первых и последних chunk байт. hashlib отпускает GIL на больших буферах,
+#поэтому потоки пула читают и хэшируют файлы параллельно
+def partial_hash(path, size, chunk=PARTIAL_CHUNK):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        h.update(f.read(chunk))
+        if size > chunk:
+            f.seek(max(chunk, size - chunk))
+            h.update(f.read(chunk))
+    return h.hexdigest()
+
+
+#поиск одинаковых файлов в три отсева: размер, хэш начала и конца файла, полный хэш.
+#каждый следующий этап читает только файлы, у которых остались кандидаты в пару
+class DuplicateFinder:
+    def __init__(self, max_workers=None, chunk=PARTIAL_CHUNK):
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+        self.chunk = chunk
+        self.partial_hashed = 0
+        self.full_hashed = 0
+
+    #files - пары (путь, размер); возвращает группы путей, по одной на каждый набор копий
+    def find(self, files):
+        self.partial_hashed = 0
+        self.full_hashed = 0
+        by_size = {}
+        for path, size in files:
+            #пустые файлы одинаковы, но это не треки
+            if size > 0:
+                by_size.setdefault(size, []).append(path)
+        candidates = [(path, size) for size, paths in by_size.items() if len(paths) > 1 for path in paths]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            groups = self._group(pool, candidates, lambda path, size: partial_hash(path, size, self.chunk))
+            self.partial_hashed = len(candidates)
+            #файл не длиннее двух кусков уже прочитан целиком, полный хэш ничего не добавит
+            small = [group for group in groups if group[0][1] <= 2 * self.chunk]
+            large = [item for group in groups if group[0][1] > 2 * self.chunk for item in group]
+            self.full_hashed = len(large)
+            groups = small + self._group(pool, large, lambda path, size: file_hash(path))
+        return sorted(sorted(path for path, _ in group) for group in groups)
+
+    #хэширует файлы в пуле и возвращает группы (путь, размер) с совпавшими размером и хэшем;
+    #файлы, которые не удалось прочитать, выпадают
+    def _group(self, pool, items, digest):
+        def job(item):
+            try:
+                return digest(*item)
+            except OSError:
+                return None
+        groups = {}
+        for item, value in zip(items, pool.map(job, items)):
+            if value is not None:
+                groups.setdefault((item[1], value), []).append(item)
+        return [group for group in groups.values() if len(group) > 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск одинаковых треков в папке")
+    parser.add_argument("folder", nargs="?", default="tracks")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    files = []
+    for directory, _, names in os.walk(args.folder):
+        for name in names:
+            if name.lower().endswith(AUDIO_EXTENSIONS):
+                path = f"{directory}/{name}"
+                try:
+                    files.append((path, os.stat(path).st_size))
+                except OSError:
+                    continue
+    finder = DuplicateFinder(args.workers)
+    started = time.perf_counter()
+    groups = finder.find(files)
+    elapsed = time.perf_counter() - started
+    for group in groups:
+        print("\n".join(group))
+        print()
+    print(f"файлов: {len(files)}, групп дубликатов: {len(groups)}, хэш начала и конца: {finder.partial_hashed}, "
+          f"полный хэш: {finder.full_hashed}, {elapsed:.2f} с", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+import wave
+from library import MusicLibrary
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+#общие заготовки тестов. все файлы библиотеки - каталог, кэш анализа, счётчики и история - лежат внутри tmp
+def temp_library(tmp, tracks="tracks"):
+    return MusicLibrary(os.path.join(tmp, tracks), db_path=os.path.join(tmp, "library.db"), cache_dir=os.path.join(tmp, ".cache"),
+                        play_counts_path=os.path.join(tmp, "play_counts"), history_dir=os.path.join(tmp, "history"))
+
+
+#страница Flet без клиента: запоминает, какие контролы отправлялись
+class FakePage:
+    def __init__(self):
+        self.overlay = []
+        self.updated = []
+
+    def update(self, *controls):
+        self.updated.append(controls)
+
+
+def sine(amplitude, seconds=3, rate=22050):
+    return (amplitude * np.sin(2 * np.pi * 997 * np.arange(seconds * rate) / rate)).astype(np.float32)
+
+
+def write_wav(path, samples, rate=22050):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes((samples * 32767).astype(np.int16).tobytes())
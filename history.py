@@ -0,0 +1,217 @@
+import array
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#чем закончилось прослушивание
+SKIPPED, COMPLETED, STOPPED = 0, 1, 2
+#колонки события и их типы array: номер трека в таблице ключей, начало и конец (мс с эпохи),
+#сколько миллисекунд трек реально играл и исход
+COLUMNS = (("track", "i"), ("start", "q"), ("end", "q"), ("listened", "i"), ("outcome", "b"))
+CHUNK_SIZE = 1 << 16
+
+
+#кусок истории фиксированного размера: массивы выделены сразу, поэтому никогда
+#не растут и на них можно один раз завести numpy-представления без копирования
+class _Chunk:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = 0
+        self.min_start = None
+        self.max_start = None
+        self.columns = {name: array.array(code, bytes(array.array(code).itemsize * capacity)) for name, code in COLUMNS}
+        self._views = None
+
+    def append(self, row):
+        i = self.size
+        for (name, _), value in zip(COLUMNS, row):
+            self.columns[name][i] = value
+        start = row[1]
+        self.min_start = start if self.min_start is None else min(self.min_start, start)
+        self.max_start = start if self.max_start is None else max(self.max_start, start)
+        self.size += 1
+
+    def fill(self, columns, start, stop):
+        for name, column in columns.items():
+            self.columns[name][:stop - start] = column[start:stop]
+        starts = columns["start"][start:stop]
+        self.min_start = min(starts)
+        self.max_start = max(starts)
+        self.size = stop - start
+
+    def views(self):
+        if self._views is None:
+            self._views = {name: np.frombuffer(column, dtype=column.typecode) for name, column in self.columns.items()}
+        return {name: view[:self.size] for name, view in self._views.items()}
+
+    def overlaps(self, since, until):
+        if not self.size:
+            return False
+        if since is not None and self.max_start < since:
+            return False
+        return until is None or self.min_start < until
+
+
+#история прослушиваний по колонкам: в памяти - куски по chunk_size событий,
+#на диске - по файлу на колонку, куда события дописываются в конец.
+#окно по времени отсекает целые куски по min/max начала, остальное считается
+#через np.bincount по номерам треков
+class ListeningHistory:
+    def __init__(self, path="history", chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.keys = []
+        self.key_ids = {}
+        self.chunks = []
+        self._files = None
+        self._writer = None
+        self._lock = threading.Lock()
+        if path is not None:
+            self.load()
+
+    def __len__(self):
+        return sum(chunk.size for chunk in self.chunks)
+
+    def load(self):
+        keys_path = os.path.join(self.path, "keys.txt")
+        if not os.path.exists(keys_path):
+            return
+        with open(keys_path, "r+b") as f:
+            data = f.read()
+            #оборванный последний ключ отрезаем, иначе следующий допишется к нему
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                f.truncate(end)
+        self.keys = data[:end].decode("utf-8").split("\n")[:-1]
+        self.key_ids = {key: i for i, key in enumerate(self.keys)}
+        columns = {}
+        for name, code in COLUMNS:
+            column = array.array(code)
+            column_path = os.path.join(self.path, f"{name}.bin")
+            if os.path.exists(column_path):
+                with open(column_path, "rb") as f:
+                    data = f.read()
+                column.frombytes(data[:len(data) - len(data) % column.itemsize])
+            columns[name] = column
+        #если процесс упал посреди записи события, колонки могут разойтись по длине -
+        #берём только полные строки и обрезаем хвосты файлов
+        rows = min(len(column) for column in columns.values())
+        if any(len(column) != rows for column in columns.values()):
+            for name, column in columns.items():
+                with open(os.path.join(self.path, f"{name}.bin"), "r+b") as f:
+                    f.truncate(rows * column.itemsize)
+        for offset in range(0, rows, self.chunk_size):
+            chunk = _Chunk(self.chunk_size)
+            chunk.fill(columns, offset, min(rows, offset + self.chunk_size))
+            self.chunks.append(chunk)
+
+    def record(self, key, start_ms, end_ms, listened_ms, outcome):
+        with self._lock:
+            track = self.key_ids.get(key)
+            new_key = track is None
+            if new_key:
+                track = self.key_ids[key] = len(self.keys)
+                self.keys.append(key)
+            row = (track, start_ms, end_ms, listened_ms, outcome)
+            self._append(row)
+            if self.path is not None:
+                #на диск событие пишет отдельный поток, чтобы не задерживать обработчик
+                if self._writer is None:
+                    self._writer = ThreadPoolExecutor(1, thread_name_prefix="history")
+                self._writer.submit(self._write, row, key if new_key else None)
+
+    def _append(self, row):
+        if not self.chunks or self.chunks[-1].size == self.chunk_size:
+            self.chunks.append(_Chunk(self.chunk_size))
+        self.chunks[-1].append(row)
+
+    def _write(self, row, new_key):
+        if self._files is None:
+            os.makedirs(self.path, exist_ok=True)
+            self._files = {name: open(os.path.join(self.path, f"{name}.bin"), "ab") for name, _ in COLUMNS}
+            self._files["keys"] = open(os.path.join(self.path, "keys.txt"), "a", encoding="utf-8")
+        #ключ пишем раньше события, чтобы в файлах не оказалось ссылки на незаписанный трек
+        if new_key is not None:
+            self._files["keys"].write(new_key + "\n")
+            self._files["keys"].flush()
+        for (name, code), value in zip(COLUMNS, row):
+            f = self._files[name]
+            array.array(code, [value]).tofile(f)
+            f.flush()
+
+    #по каждому треку: число прослушиваний, пропусков и сколько миллисекунд он играл
+    #среди событий, начавшихся в [since, until)
+    def totals(self, since=None, until=None):
+        with self._lock:
+            if np is None:
+                return self._totals_py(since, until)
+            size = len(self.keys)
+            plays = np.zeros(size, dtype=np.int64)
+            skips = np.zeros(size, dtype=np.int64)
+            listened = np.zeros(size, dtype=np.int64)
+            for chunk in self.chunks:
+                if not chunk.overlaps(since, until):
+                    continue
+                columns = chunk.views()
+                mask = None
+                if since is not None and chunk.min_start < since:
+                    mask = columns["start"] >= since
+                if until is not None and chunk.max_start >= until:
+                    below = columns["start"] < until
+                    mask = below if mask is None else mask & below
+                if mask is not None:
+                    columns = {name: column[mask] for name, column in columns.items()}
+                track = columns["track"]
+                plays += np.bincount(track, minlength=size)
+                skips += np.bincount(track[columns["outcome"] == SKIPPED], minlength=size)
+                listened += np.bincount(track, weights=columns["listened"], minlength=size).astype(np.int64)
+            return plays, skips, listened
+
+    def _totals_py(self, since, until):
+        size = len(self.keys)
+        plays, skips, listened = [0] * size, [0] * size, [0] * size
+        for chunk in self.chunks:
+            if not chunk.overlaps(since, until):
+                continue
+            columns = chunk.columns
+            for i in range(chunk.size):
+                start = columns["start"][i]
+                if (since is not None and start < since) or (until is not None and start >= until):
+                    continue
+                track = columns["track"][i]
+                plays[track] += 1
+                skips[track] += columns["outcome"][i] == SKIPPED
+                listened[track] += columns["listened"][i]
+        return plays, skips, listened
+
+    #самые прослушиваемые треки окна: [(ключ, прослушивания, пропуски, мс), ...]
+    def top(self, since=None, until=None, limit=None):
+        plays, skips, listened = self.totals(since, until)
+        if np is not None:
+            order = np.lexsort((-listened, -plays))
+            order = order[plays[order] > 0]
+        else:
+            order = sorted((i for i in range(len(plays)) if plays[i]), key=lambda i: (-plays[i], -listened[i]))
+        if limit is not None:
+            order = order[:limit]
+        return [(self.keys[i], int(plays[i]), int(skips[i]), int(listened[i])) for i in order]
+
+    def skip_rates(self, since=None, until=None):
+        plays, skips, _ = self.totals(since, until)
+        return {self.keys[i]: float(skips[i] / plays[i]) for i in range(len(plays)) if plays[i]}
+
+    def close(self):
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.shutdown(wait=True)
+        with self._lock:
+            files, self._files = self._files, None
+        if files is not None:
+            for f in files.values():
+                f.close()
@@ -0,0 +1,238 @@
+import os
+import threading
+from analysis import TrackAnalyzer
+from catalog import TrackCatalog
+from history import ListeningHistory
+from metrics import serve
+from playcounts import PlayCountStore
+from ranking import PlayRanking
+from search import SearchIndex
+from trackserver import TrackServer
+
+
+#стабильный ключ трека для статистики: id строки в каталоге, а без каталога - путь
+def track_key(track):
+    return str(track.get("id") or track["url"])
+
+
+#снимок библиотеки: треки и индексы по url и по ключу статистики. снимок не меняется,
+#поэтому все сессии держат ссылки на один и тот же, а изменение собирает новый
+class LibrarySnapshot:
+    __slots__ = ("tracks", "url_index", "key_index", "version")
+
+    def __init__(self, tracks, version=0, url_index=None, key_index=None):
+        self.tracks = tracks
+        self.url_index = url_index if url_index is not None else {track["url"]: i for i, track in enumerate(tracks)}
+        self.key_index = key_index if key_index is not None else {track_key(track): i for i, track in enumerate(tracks)}
+        self.version = version
+
+    #снимок с треками new в конце: индексы копируются и дополняются, а не собираются заново
+    def extended(self, new, version):
+        url_index = self.url_index.copy()
+        key_index = self.key_index.copy()
+        for i, track in enumerate(new, len(self.tracks)):
+            url_index[track["url"]] = i
+            key_index[track_key(track)] = i
+        return LibrarySnapshot(self.tracks + new, version, url_index, key_index)
+
+
+#атрибут сессии, который на самом деле хранится в библиотеке
+class Shared:
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, session, owner=None):
+        return self if session is None else getattr(session.library, self.name)
+
+    def __set__(self, session, value):
+        setattr(session.library, self.name, value)
+
+
+#библиотека, общая для всех сессий процесса: в веб-режиме Flet каждая вкладка браузера
+#запускает свой main(), но каталог, поиск, счётчики, история и анализ треков существуют
+#в одном экземпляре. у сессии остаются очередь, перемешивание и состояние плееров
+class MusicLibrary:
+    def __init__(self, tracks_folder="tracks", db_path="library.db", cache_dir=".cache", play_counts_path="play_counts", history_dir="history"):
+        self.tracks_folder = tracks_folder
+        self.catalog = TrackCatalog(db_path)
+        self.analyzer = TrackAnalyzer(cache_dir)
+        #громкость треков считается отдельным пулом, чтобы не задерживать спектр текущего трека
+        self.loudness_analyzer = TrackAnalyzer(cache_dir, max_workers=max(1, (os.cpu_count() or 2) - 1))
+        self.track_gains = {}
+        self.duplicate_groups = []
+        #ключи схлопнутых копий дубликатов: пересканирование и наблюдатель их не возвращают
+        self.collapsed = set()
+        self.search_index = SearchIndex()
+        #поисковый индекс по каталогу строится в фоне, см. AudioPlayerManager.index_library
+        self.index_pending = True
+        self.play_store = PlayCountStore(play_counts_path)
+        self.history = ListeningHistory(history_dir)
+        self.watcher = None
+        self.track_server = None
+        self.metrics_server = None
+        self.snapshot = LibrarySnapshot(self.catalog.tracks(tracks_folder))
+        self.ranking = PlayRanking({key: self.play_store.get(key) for key in self.snapshot.key_index})
+        self.sessions = []
+        self.loader = None
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def attach(self, session):
+        with self._lock:
+            self.sessions.append(session)
+
+    #библиотека закрывается вместе с последней сессией; изменения папки после закрытия
+    #загружающей сессии применяет одна из оставшихся
+    def detach(self, session):
+        with self._lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+            if self.loader is session:
+                self.loader = self.sessions[0] if self.sessions else None
+            if self.sessions or self.closed:
+                return
+            self.closed = True
+        self.close()
+
+    #пересканирование, индекс и наблюдатель за папкой запускает только первая сессия
+    def claim_loader(self, session):
+        with self._lock:
+            if self.loader is not None:
+                return False
+            self.loader = session
+            return True
+
+    #вызывается из потока наблюдателя за папкой
+    def library_changed(self, directories):
+        with self._lock:
+            loader = self.loader
+        if loader is not None:
+            loader.library_changed(directories)
+
+    #http-сервер треков один на процесс: запускает его первая сессия
+    def serve_tracks(self, host="127.0.0.1", port=0, public_url=None):
+        with self._lock:
+            if self.track_server is None:
+                self.track_server = TrackServer(self.tracks_folder, host, port, public_url).start()
+            return self.track_server
+
+    #эндпоинт метрик тоже один на процесс: вторая вкладка не должна занимать тот же порт
+    def serve_metrics(self, port):
+        with self._lock:
+            if self.metrics_server is None:
+                self.metrics_server = serve(port)
+            return self.metrics_server
+
+    def set_tracks(self, tracks, origin=None):
+        self.snapshot = LibrarySnapshot(tracks, self.snapshot.version + 1)
+        self.ranking = PlayRanking({key: self.play_store.get(key) for key in self.snapshot.key_index})
+        if not self.index_pending:
+            self.search_index.sync(tracks)
+        self.publish({}, False, origin)
+
+    #replaced - пары (старый url, трек). старый снимок не трогается: сессии, которые
+    #ещё на нём, переключаются на новый в своём обработчике
+    def update(self, added=(), removed=(), replaced=(), origin=None):
+        old = self.snapshot
+        replaced = {old_url: track for old_url, track in replaced if old_url in old.url_index}
+        removed = set(removed) & old.url_index.keys()
+        if replaced or removed:
+            tracks = [replaced.get(track["url"], track) for track in old.tracks if track["url"] not in removed]
+            known = {track["url"] for track in tracks}
+        else:
+            #чистое добавление (пересканирование, новые файлы) не перебирает старые треки
+            tracks = old.tracks
+            known = old.url_index
+        new = []
+        seen = set()
+        for track in added:
+            #один файл может прийти и от пересканирования, и от наблюдателя за папкой
+            if track["url"] not in known and track["url"] not in seen and track_key(track) not in self.collapsed:
+                seen.add(track["url"])
+                new.append(track)
+        if not (replaced or removed or new):
+            return False
+        for old_url, track in replaced.items():
+            key = track_key(track)
+            if key != track_key(old.tracks[old.url_index[old_url]]):
+                self.ranking.counts.setdefault(key, self.play_store.get(key))
+                self.ranking.add(key)
+            self.search_index.remove(old_url)
+            self.search_index.add(track)
+        for url in removed:
+            self.search_index.remove(url)
+        for track in new:
+            key = track_key(track)
+            self.search_index.add(track)
+            self.ranking.counts.setdefault(key, self.play_store.get(key))
+            self.ranking.add(key)
+        if tracks is old.tracks:
+            self.snapshot = old.extended(new, old.version + 1)
+        else:
+            self.snapshot = LibrarySnapshot(tracks + new, old.version + 1)
+        if removed:
+            self.ranking = PlayRanking({key: count for key, count in self.ranking.counts.items() if key in self.snapshot.key_index})
+        self.publish({old_url: track["url"] for old_url, track in replaced.items()}, bool(new), origin)
+        return True
+
+    #copies - {url копии: url оставшейся копии}. копии уходят из библиотеки, а их
+    #прослушивания в рейтинге достаются оставшейся; на диске счётчики не меняются
+    def collapse(self, copies, origin=None):
+        old = self.snapshot
+        for url, keep_url in copies.items():
+            key = track_key(old.tracks[old.url_index[url]])
+            keep_key = track_key(old.tracks[old.url_index[keep_url]])
+            self.collapsed.add(key)
+            self.ranking.counts[keep_key] = self.ranking.counts.get(keep_key, 0) + self.ranking.counts.get(key, 0)
+        return self.update(removed=copies, origin=origin)
+
+    #сессия, в чьём обработчике идёт изменение, получает снимок сразу,
+    #остальные - через свой цикл событий под своим lock
+    def publish(self, renamed, grown, origin=None):
+        snapshot = self.snapshot
+        with self._lock:
+            sessions = list(self.sessions)
+        if origin is not None and origin not in sessions:
+            sessions.append(origin)
+        for session in sessions:
+            if session is origin:
+                session.adopt(snapshot, renamed, grown)
+            else:
+                session.submit(session.adopt, snapshot, renamed, grown)
+
+    #как и publish: сессия origin получает вызов сразу, остальные - через свой цикл событий
+    def broadcast(self, handler_name, *args, origin=None):
+        with self._lock:
+            sessions = list(self.sessions)
+        for session in sessions:
+            if session is origin:
+                getattr(session, handler_name)(*args)
+            else:
+                session.submit(getattr(session, handler_name), *args)
+
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+        if self.track_server is not None:
+            self.track_server.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+        self.analyzer.close()
+        self.loudness_analyzer.close()
+        self.play_store.close()
+        self.history.close()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+#библиотека процесса: создаётся первой сессией, закрывается с последней
+#и создаётся заново, если после этого откроется новая вкладка. paths - пути для MusicLibrary
+def shared_library(**paths):
+    global _shared
+    with _shared_lock:
+        if _shared is None or _shared.closed:
+            _shared = MusicLibrary(**paths)
+        return _shared
@@ -0,0 +1,151 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+#текстовые фреймы, которые нам нужны: id3v2.3/2.4 и короткие id из id3v2.2
+ID3V2_FRAMES = {"TIT2": "title", "TPE1": "artist", "TALB": "album", "TRCK": "track_no"}
+ID3V22_FRAMES = {"TT2": "title", "TP1": "artist", "TAL": "album", "TRK": "track_no"}
+#фреймы длиннее этого - не текст, который нам интересен (например обложки), их не читаем
+MAX_TEXT_FRAME = 4096
+TEXT_ENCODINGS = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}
+
+
+def read_tags(path):
+    tags = {}
+    with open(path, "rb") as f:
+        header = f.read(10)
+        if len(header) == 10 and header[:3] == b"ID3" and header[3] in (2, 3, 4):
+            tags.update(_read_id3v2(f, header))
+        if len(tags) < len(ID3V2_FRAMES):
+            for key, value in _read_id3v1(f).items():
+                tags.setdefault(key, value)
+    if "track_no" in tags:
+        tags["track_no"] = _parse_track_no(tags["track_no"])
+        if tags["track_no"] is None:
+            del tags["track_no"]
+    return tags
+
+
+def display_title(tags, stem):
+    title = tags.get("title")
+    if not title:
+        return stem
+    if tags.get("artist"):
+        return f"{tags['artist']} - {title}"
+    return title
+
+
+def _syncsafe(data):
+    return (data[0] & 0x7F) << 21 | (data[1] & 0x7F) << 14 | (data[2] & 0x7F) << 7 | (data[3] & 0x7F)
+
+
+#идём по заголовкам фреймов через seek и читаем только тела нужных текстовых фреймов
+def _read_id3v2(f, header):
+    version = header[3]
+    flags = header[5]
+    end = 10 + _syncsafe(header[6:10])
+    pos = 10
+    if flags & 0x40 and version >= 3:
+        ext = f.read(4)
+        if len(ext) < 4:
+            return {}
+        pos += _syncsafe(ext) if version == 4 else int.from_bytes(ext, "big") + 4
+    if version == 2:
+        id_len, header_len, wanted = 3, 6, ID3V22_FRAMES
+    else:
+        id_len, header_len, wanted = 4, 10, ID3V2_FRAMES
+    found = {}
+    while pos + header_len <= end and len(found) < len(wanted):
+        f.seek(pos)
+        frame_header = f.read(header_len)
+        if len(frame_header) < header_len or frame_header[0] == 0:
+            break
+        frame_id = frame_header[:id_len].decode("latin-1")
+        if version == 2:
+            size = int.from_bytes(frame_header[3:6], "big")
+        elif version == 3:
+            size = int.from_bytes(frame_header[4:8], "big")
+        else:
+            size = _syncsafe(frame_header[4:8])
+        pos += header_len
+        if size <= 0 or pos + size > end:
+            break
+        key = wanted.get(frame_id)
+        if key is not None and size <= MAX_TEXT_FRAME and not _is_packed(version, frame_header):
+            data = f.read(size)
+            if version == 4 and frame_header[9] & 0x01:
+                data = data[4:]
+            text = _decode_text(data)
+            if text:
+                found[key] = text
+        pos += size
+    return found
+
+
+#сжатые, зашифрованные и unsync-фреймы пропускаем
+def _is_packed(version, frame_header):
+    if version == 3:
+        return bool(frame_header[9] & 0xC0)
+    if version == 4:
+        return bool(frame_header[9] & 0x0E)
+    return False
+
+
+def _decode_text(data):
+    if not data:
+        return ""
+    encoding = TEXT_ENCODINGS.get(data[0])
+    if encoding is None:
+        return ""
+    text = data[1:].decode(encoding, errors="replace")
+    return text.split("\x00", 1)[0].strip()
+
+
+def _read_id3v1(f):
+    f.seek(0, os.SEEK_END)
+    if f.tell() < 128:
+        return {}
+    f.seek(-128, os.SEEK_END)
+    data = f.read(128)
+    if data[:3] != b"TAG":
+        return {}
+    tags = {}
+    for key, start, stop in (("title", 3, 33), ("artist", 33, 63), ("album", 63, 93)):
+        value = _decode_v1(data[start:stop])
+        if value:
+            tags[key] = value
+    if data[125] == 0 and data[126] != 0:
+        tags["track_no"] = str(data[126])
+    return tags
+
+
+#в id3v1 кодировка не указана: пробуем utf-8, иначе считаем, что это cp1251
+def _decode_v1(raw):
+    raw = raw.split(b"\x00", 1)[0].strip()
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("cp1251", errors="replace")
+
+
+def _parse_track_no(value):
+    number = str(value).split("/", 1)[0].strip()
+    return int(number) if number.isdigit() else None
+
+
+def _read_tags_safe(path):
+    try:
+        return read_tags(path)
+    except OSError:
+        return {}
+
+
+#пул для чтения тегов: чтение заголовков - это в основном ожидание диска, поэтому хватает потоков
+class MetadataExtractor:
+    def __init__(self, max_workers=8):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def extract(self, paths):
+        return list(self.pool.map(_read_tags_safe, paths))
+
+    def close(self):
+        self.pool.shutdown(wait=True)
@@ -0,0 +1,208 @@
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#границы корзин гистограмм: задержки в секундах и размеры в штуках
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    #оценка квантиля по корзинам: верхняя граница корзины, где набирается q всех наблюдений
+    def quantile(self, q):
+        if not self.count:
+            return None
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= q * self.count:
+                return bound
+        return math.inf
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.sum, "buckets": dict(zip(map(str, self.buckets), self.counts)), "inf": self.counts[-1]}
+
+
+#счётчики, гистограммы и вычисляемые значения с метками; наблюдение - это
+#bisect и пара сложений под общим lock, поэтому их можно ставить в горячие пути
+class Metrics:
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    #значение считается в момент выгрузки, например число живых потоков
+    def gauge(self, name, func):
+        self.gauges[name] = func
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def histogram(self, name, **labels):
+        return self.histograms.get((name, tuple(sorted(labels.items()))))
+
+    def counter(self, name, **labels):
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    #все гистограммы с этим именем: [(метки, гистограмма)]
+    def family(self, name):
+        with self._lock:
+            return [(dict(labels), histogram) for (key, labels), histogram in self.histograms.items() if key == name]
+
+    def snapshot(self):
+        with self._lock:
+            counters = [(name, dict(labels), value) for (name, labels), value in self.counters.items()]
+            histograms = [(name, dict(labels), histogram.to_dict()) for (name, labels), histogram in self.histograms.items()]
+        gauges = [(name, {}, func()) for name, func in self.gauges.items()]
+        return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+    def to_json(self):
+        snapshot = self.snapshot()
+        return json.dumps({
+            kind: [{"name": name, "labels": labels, "value": value} for name, labels, value in items]
+            for kind, items in snapshot.items()
+        }, indent=1)
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for name, labels, value in sorted(snapshot["counters"], key=lambda item: item[0]):
+            declare(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for name, labels, value in sorted(snapshot["gauges"], key=lambda item: item[0]):
+            declare(name, "gauge")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for name, labels, value in sorted(snapshot["histograms"], key=lambda item: item[0]):
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, count in value["buckets"].items():
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {value['count']}")
+            lines.append(f"{name}_sum{_labels(labels)} {value['sum']}")
+            lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    #формат выбирается по расширению: .json - JSON, иначе текстовый формат Prometheus
+    def write(self, path):
+        data = self.to_json() if path.endswith(".json") else self.to_prometheus()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{str(value)}"' for key, value in labels.items()) + "}"
+
+
+REGISTRY = Metrics()
+REGISTRY.gauge("player_threads", threading.active_count)
+
+
+#время запуска по этапам; каждый этап попадает и в реестр метрик
+class StartupTimer:
+    def __init__(self, started=None, metrics=REGISTRY):
+        self.started = started if started is not None else time.perf_counter()
+        self.metrics = metrics
+        self.phases = []
+
+    def record(self, name, seconds):
+        self.phases.append((name, seconds))
+        self.metrics.observe("player_startup_seconds", seconds, phase=name)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    #момент от начала запуска, а не длительность отдельного этапа
+    def mark(self, name):
+        self.record(name, time.perf_counter() - self.started)
+
+    def report(self):
+        width = max((len(name) for name, _ in self.phases), default=0)
+        return [f"{name:<{width}} {seconds * 1000:>9.1f} мс" for name, seconds in self.phases]
+
+
+#локальный http-эндпоинт: /metrics - Prometheus, /metrics.json - JSON
+def serve(port, metrics=REGISTRY, host="127.0.0.1"):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = metrics.to_prometheus(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = metrics.to_json(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
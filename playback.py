@@ -0,0 +1,493 @@
+import asyncio
+import time
+from collections import deque
+from flet import AudioState
+from metrics import REGISTRY
+from scheduler import SystemClock, TrackEndTimer, coalesce_updates
+from shuffle import ShuffleOrder
+
+
+#вывод по умолчанию: ядро играет без интерфейса (тесты, бенчмарки)
+class NullOutput:
+    scheduler = None
+
+    def show_track(self, track):
+        pass
+
+    def show_playing(self, playing):
+        pass
+
+    def show_duration(self, duration_ms):
+        pass
+
+    def position_changed(self, position_ms):
+        pass
+
+    def show_position(self, position_ms):
+        pass
+
+    def show_queue(self):
+        pass
+
+    def show_modes(self, shuffle_mode, repeat_mode):
+        pass
+
+    def player_changed(self, player):
+        pass
+
+
+#логика воспроизведения без интерфейса: очередь, перемешивание, повтор, два плеера
+#для бесшовного перехода и таймер конца трека. плееры создаёт backend
+#(fa.Audio или симуляция), а всё, что надо показать, уходит в output.
+#время берётся из clock, поэтому на виртуальных часах плеер можно гонять быстрее реального
+class PlaybackCore:
+    def __init__(self, backend, output=None, clock=None):
+        self.backend = backend
+        self.output = output if output is not None else NullOutput()
+        self.clock = clock if clock is not None else SystemClock()
+        self.current_state = AudioState.PAUSED
+        self.current_track_index = 0
+        self.repeat_mode = False
+        self.shuffle_mode = False
+        self.shuffle_order = ShuffleOrder()
+        self.shuffle_cycle_start = 0
+        self.playlist_version = 0
+        #без перемешивания playlist - тот же список, что original_playlist, своей копии очереди нет
+        self._original_playlist = []
+        self.url_index = {}
+        self.playlist = self._original_playlist
+        #два плеера: активный играет, резервный заранее загружает следующий трек
+        self.audio_player = backend.create_player(self)
+        self.standby_player = backend.create_player(self)
+        self.gapless = True
+        #громкость, выбранная пользователем; плееру уходит она же с поправкой трека
+        self.volume = 0.5
+        self.next_index = None
+        self.standby_ready_url = None
+        self.standby_duration_ms = None
+        self.load_started_at = None
+        self.swap_latency_ms = None
+        self.swap_latencies = deque(maxlen=100)
+        self.load_latencies = deque(maxlen=100)
+        self.autoplay_on_load = False
+        self.duration_ms = None
+        self.position_ms = 0
+        self.position_update_interval = 0.25
+        self.skip_position_frames = True
+        self.position_updated_at = float("-inf")
+        self.end_timer = TrackEndTimer(self.end_timer_fired, clock=self.clock)
+        #все изменения состояния плеера выполняются по одному: тик позиции
+        #не может вклиниться посреди загрузки трека
+        self.lock = asyncio.Lock()
+        self.loop = None
+
+    #хуки для того, кто ведёт статистику и анализ треков
+    def track_loading(self, track):
+        pass
+
+    def track_started(self, track):
+        pass
+
+    def track_paused(self):
+        pass
+
+    def track_ended(self, completed):
+        pass
+
+    @property
+    def scheduler(self):
+        return self.output.scheduler
+
+    #в метриках видно и ожидание lock, и время самого обработчика
+    async def run(self, handler, *args):
+        name = getattr(handler, "__qualname__", "handler")
+        queued = time.perf_counter()
+        async with self.lock:
+            started = time.perf_counter()
+            REGISTRY.observe("player_lock_wait_seconds", started - queued)
+            try:
+                return handler(*args)
+            except Exception:
+                REGISTRY.inc("player_handler_errors_total", handler=name)
+                raise
+            finally:
+                REGISTRY.observe("player_handler_seconds", time.perf_counter() - started, handler=name)
+
+    async def on_state_changed(self, e):
+        await self.run(self.audio_state_changed, e)
+
+    async def on_position_changed(self, e):
+        await self.run(self.audio_position_changed, e)
+
+    #длительность запрашивается у клиента без блокировки цикла событий и до захвата lock
+    async def on_loaded(self, e):
+        duration_ms = await e.control.get_duration_async()
+        await self.run(self.audio_loaded, e, duration_ms)
+
+    #вызов из потока таймера: выполняется на цикле событий под lock, а без цикла - сразу
+    def submit(self, handler, *args):
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.run(handler, *args), self.loop)
+        else:
+            handler(*args)
+
+    def end_timer_fired(self):
+        self.submit(self.track_finished)
+
+    #события резервного плеера не должны трогать интерфейс
+    def from_active(self, e):
+        return getattr(e, "control", None) in (None, self.audio_player)
+
+    def set_volume(self, volume):
+        self.volume = volume
+        for player in (self.audio_player, self.standby_player):
+            player.volume = self.player_volume(self.player_url(player))
+        return self.audio_player, self.standby_player
+
+    #адрес, который получает плеер; AudioPlayerManager отдаёт треки через свой http-сервер
+    def track_source(self, url):
+        return url
+
+    #путь трека, загруженного в плеер
+    def player_url(self, player):
+        return player.src
+
+    #поправка громкости трека в дБ; AudioPlayerManager берёт её из анализа громкости
+    def track_gain(self, url):
+        return 0.0
+
+    #громкость плеера не может быть больше 1, поэтому тихие треки поднимаются
+    #только в пределах запаса, который оставил пользователь
+    def player_volume(self, url):
+        gain = self.track_gain(url) if url else 0.0
+        return min(1.0, self.volume * 10 ** (gain / 20))
+
+    def format_time(self, ms):
+        if ms is None:
+            return "00:00"
+        seconds = int(ms / 1000)
+        minutes = seconds // 60
+        seconds %= 60
+        return f"{minutes:02d}:{seconds:02d}"
+
+    @property
+    def original_playlist(self):
+        return self._original_playlist
+
+    @original_playlist.setter
+    def original_playlist(self, tracks):
+        self._original_playlist = tracks
+        self.url_index = {track["url"]: i for i, track in enumerate(tracks)}
+
+    def index_of_url(self, url):
+        index = self.url_index.get(url)
+        if index is not None and self.shuffle_mode:
+            return self.shuffle_order.shuffled_position(index)
+        return index
+
+    #в режиме перемешивания плейлист уже лежит в порядке перестановки, поэтому
+    #следующий трек - просто следующая позиция; когда круг вернулся к началу, перемешиваем заново
+    def pick_next_index(self):
+        if not self.playlist:
+            return 0
+        next_index = (self.current_track_index + 1) % len(self.playlist)
+        if self.shuffle_mode and len(self.playlist) > 1 and next_index == self.shuffle_cycle_start:
+            self.reshuffle_cycle()
+            return 0
+        return next_index
+
+    def reshuffle_cycle(self):
+        current = self.shuffle_order.original_index(self.current_track_index)
+        last = len(self.original_playlist) - 1
+        self.shuffle_order.shuffle(len(self.original_playlist), anchor=current, anchor_pos=last)
+        self.playlist = [self.original_playlist[i] for i in self.shuffle_order.order]
+        self.current_track_index = last
+        self.shuffle_cycle_start = 0
+        self.playlist_version += 1
+        self.output.show_queue()
+
+    #следующий трек выбирается заранее, чтобы его можно было предзагрузить
+    def peek_next_index(self):
+        if self.next_index is None or self.next_index >= len(self.playlist):
+            self.next_index = self.pick_next_index()
+        return self.next_index
+
+    def preload_next(self):
+        if not self.gapless or len(self.playlist) < 2:
+            return
+        url = self.playlist[self.peek_next_index()]["url"]
+        if self.player_url(self.standby_player) == url:
+            #в очереди из двух треков освободившийся плеер уже держит следующий:
+            #загружать нечего, достаточно перемотать его в начало
+            if self.standby_ready_url != url and self.standby_duration_ms is not None:
+                self.standby_player.seek(0)
+                self.standby_ready_url = url
+            return
+        self.standby_ready_url = None
+        self.standby_duration_ms = None
+        #громкость выставляется заранее, чтобы при переключении ничего не досылать
+        self.standby_player.volume = self.player_volume(url)
+        self.standby_player.src = self.track_source(url)
+        self.output.player_changed(self.standby_player)
+
+    def standby_loaded(self, e, duration_ms):
+        self.standby_duration_ms = duration_ms
+        self.standby_ready_url = self.player_url(self.standby_player)
+
+    #меняем плееры ролями: резервный уже загружен, поэтому play() начинается сразу
+    def swap_players(self):
+        previous = self.audio_player
+        self.audio_player, self.standby_player = self.standby_player, previous
+        self.audio_player.play()
+        previous.pause()
+        self.duration_ms = self.standby_duration_ms
+        self.standby_ready_url = None
+        self.standby_duration_ms = None
+        self.swap_latency_ms = (self.clock.perf_counter() - self.load_started_at) * 1000
+        self.swap_latencies.append(self.swap_latency_ms)
+
+    @coalesce_updates
+    def add_tracks(self, tracks):
+        #один файл может прийти и от пересканирования, и от наблюдателя за папкой
+        tracks = [track for track in tracks if track["url"] not in self.url_index]
+        if not tracks:
+            return
+        was_empty = not self.playlist
+        shared = self.playlist is self.original_playlist
+        for track in tracks:
+            self.url_index[track["url"]] = len(self.original_playlist)
+            self.original_playlist.append(track)
+        if not shared:
+            self.playlist.extend(tracks)
+        if self.shuffle_mode:
+            self.shuffle_order.extend(len(tracks))
+        self.playlist_version += 1
+        self.next_index = None
+        if was_empty and not self.audio_player.src:
+            self.load_track(0, False)
+        else:
+            self.output.show_queue()
+
+    @coalesce_updates
+    def remove_tracks(self, urls):
+        current_url = self.playlist[self.current_track_index]["url"] if self.playlist else None
+        self.original_playlist = [track for track in self.original_playlist if track["url"] not in urls]
+        self.playlist = [track for track in self.playlist if track["url"] not in urls]
+        self.playlist_version += 1
+        self.next_index = None
+        if self.shuffle_mode:
+            self.shuffle_order.reset([self.url_index[track["url"]] for track in self.playlist])
+            if self.shuffle_cycle_start >= len(self.playlist):
+                self.shuffle_cycle_start = 0
+        index = self.index_of_url(current_url)
+        self.current_track_index = index if index is not None else 0
+        self.output.show_queue()
+
+    #переход на новую версию библиотеки целиком: tracks и url_index уже собраны и могут быть
+    #общими с другими сессиями. очередь сессии пересобирается по url: текущий трек и порядок
+    #перемешивания сохраняются, новые треки встают в конец, renamed - старый url -> новый
+    @coalesce_updates
+    def set_library(self, tracks, url_index, renamed=None):
+        renamed = renamed or {}
+        current_url = self.playlist[self.current_track_index]["url"] if self.playlist else None
+        current_url = renamed.get(current_url, current_url)
+        if self.shuffle_mode:
+            order = []
+            for track in self.playlist:
+                index = url_index.get(renamed.get(track["url"], track["url"]))
+                if index is not None:
+                    order.append(index)
+            if len(order) < len(tracks):
+                kept = set(order)
+                order.extend(i for i in range(len(tracks)) if i not in kept)
+            self.shuffle_order.reset(order)
+            self.playlist = [tracks[i] for i in order]
+            if self.shuffle_cycle_start >= len(self.playlist):
+                self.shuffle_cycle_start = 0
+        else:
+            self.playlist = tracks
+        self._original_playlist = tracks
+        self.url_index = url_index
+        self.playlist_version += 1
+        self.next_index = None
+        index = self.index_of_url(current_url)
+        self.current_track_index = index if index is not None else 0
+        self.output.show_queue()
+
+    #переименованные треки и треки с новыми тегами остаются на своих местах:
+    #позиции в очереди и порядок перемешивания не меняются
+    @coalesce_updates
+    def replace_tracks(self, replacements):
+        new_tracks = {}
+        for old_url, track in replacements:
+            index = self.url_index.pop(old_url, None)
+            if index is None:
+                continue
+            self.original_playlist[index] = track
+            self.url_index[track["url"]] = index
+            new_tracks[old_url] = track
+        if not new_tracks:
+            return
+        self.playlist = [new_tracks.get(track["url"], track) for track in self.playlist]
+        self.playlist_version += 1
+        self.next_index = None
+        self.output.show_queue()
+
+    @coalesce_updates
+    def toggle_shuffle(self, e=None):
+        self.shuffle_mode = not self.shuffle_mode
+        self.next_index = None
+        if self.playlist and self.shuffle_mode:
+            self.shuffle_order.shuffle(len(self.original_playlist), anchor=self.current_track_index, anchor_pos=self.current_track_index)
+            self.shuffle_cycle_start = self.current_track_index
+            self.playlist = [self.original_playlist[i] for i in self.shuffle_order.order]
+            self.playlist_version += 1
+        elif self.playlist:
+            self.current_track_index = self.shuffle_order.original_index(self.current_track_index)
+            self.playlist = self.original_playlist
+            self.playlist_version += 1
+        self.output.show_queue()
+        self.output.show_modes(self.shuffle_mode, self.repeat_mode)
+
+    @coalesce_updates
+    def toggle_repeat(self, e=None):
+        self.repeat_mode = not self.repeat_mode
+        self.output.show_modes(self.shuffle_mode, self.repeat_mode)
+
+    @coalesce_updates
+    def pause(self):
+        if not self.audio_player.src:
+            return
+        self.audio_player.pause()
+        self.current_state = AudioState.PAUSED
+        self.end_timer.cancel()
+        self.track_paused()
+        self.output.show_playing(False)
+
+    @coalesce_updates
+    def play_pause_click(self, e=None):
+        if self.current_state == AudioState.PLAYING:
+            self.pause()
+        elif self.current_state in [AudioState.PAUSED, AudioState.STOPPED] and self.audio_player.src:
+            self.audio_player.resume()
+            self.current_state = AudioState.PLAYING
+            self.end_timer.sync(self.position_ms, self.duration_ms)
+            self.track_started(self.playlist[self.current_track_index])
+            self.output.show_playing(True)
+            self.preload_next()
+
+    def audio_state_changed(self, e):
+        if not self.from_active(e):
+            return
+        if e.data == "playing":
+            self.current_state = AudioState.PLAYING
+            self.end_timer.sync(self.position_ms, self.duration_ms)
+        elif e.data == "paused":
+            self.current_state = AudioState.PAUSED
+            self.end_timer.cancel()
+            self.track_paused()
+        elif e.data == "stopped":
+            self.current_state = AudioState.STOPPED
+            self.end_timer.cancel()
+            self.track_paused()
+        elif e.data == "completed" and self.end_timer.cancel():
+            self.track_finished()
+
+    @coalesce_updates
+    def audio_position_changed(self, e):
+        if not self.from_active(e) or e.data is None:
+            return
+        position = int(e.data)
+        self.position_ms = position
+        self.output.position_changed(position)
+        if self.current_state == AudioState.PLAYING:
+            self.end_timer.sync(position, self.duration_ms)
+        now = self.clock.monotonic()
+        if self.skip_position_frames and now - self.position_updated_at < self.position_update_interval:
+            return
+        self.position_updated_at = now
+        self.output.show_position(position)
+
+    #вызывается таймером конца трека
+    @coalesce_updates
+    def track_finished(self):
+        self.track_ended(True)
+        if self.repeat_mode:
+            self.audio_player.seek(0)
+            self.audio_player.resume()
+            self.position_ms = 0
+            self.track_started(self.playlist[self.current_track_index])
+            self.end_timer.sync(0, self.duration_ms)
+        else:
+            self.next_track()
+
+    @coalesce_updates
+    def audio_loaded(self, e, duration_ms):
+        if not self.from_active(e):
+            self.standby_loaded(e, duration_ms)
+            return
+        self.duration_ms = duration_ms
+        if self.load_started_at is not None:
+            self.load_latencies.append((self.clock.perf_counter() - self.load_started_at) * 1000)
+            self.load_started_at = None
+        if duration_ms is not None:
+            self.output.show_duration(duration_ms)
+        if self.autoplay_on_load:
+            self.audio_player.play()
+            self.current_state = AudioState.PLAYING
+            self.end_timer.sync(0, self.duration_ms)
+            self.track_started(self.playlist[self.current_track_index])
+            self.output.show_playing(True)
+            self.autoplay_on_load = False
+            self.preload_next()
+
+    @coalesce_updates
+    def load_track(self, track_index, autoplay):
+        self.load_started_at = self.clock.perf_counter()
+        self.track_ended(False)
+        self.current_track_index = track_index
+        track = self.playlist[self.current_track_index]
+        self.next_index = None
+        self.end_timer.cancel()
+        duration_ms, self.duration_ms = self.duration_ms, None
+        self.position_ms = 0
+        self.current_state = AudioState.STOPPED
+        self.output.show_track(track)
+        self.track_loading(track)
+        if autoplay and self.gapless and self.standby_ready_url == track["url"]:
+            self.swap_players()
+            #освободившийся плеер остаётся загруженным прошлым треком - запоминаем его длительность
+            self.standby_duration_ms = duration_ms
+            self.load_started_at = None
+            self.current_state = AudioState.PLAYING
+            if self.duration_ms is not None:
+                self.output.show_duration(self.duration_ms)
+            self.end_timer.sync(0, self.duration_ms)
+            self.track_started(track)
+            self.output.show_playing(True)
+            self.preload_next()
+            return
+        self.audio_player.volume = self.player_volume(track["url"])
+        self.audio_player.src = self.track_source(track["url"])
+        self.output.player_changed(self.audio_player)
+        if autoplay and self.audio_player.src:
+            self.autoplay_on_load = autoplay
+            self.current_state = AudioState.PLAYING
+            self.track_started(track)
+            self.output.show_playing(True)
+
+    #при холодном запуске кнопки доступны раньше, чем библиотека загрузилась
+    @coalesce_updates
+    def next_track(self, e=None):
+        if not self.playlist:
+            return
+        self.load_track(self.peek_next_index(), True)
+
+    @coalesce_updates
+    def prev_track(self, e=None):
+        if not self.playlist:
+            return
+        self.load_track((self.current_track_index - 1 + len(self.playlist)) % len(self.playlist), True)
+
+    def close(self):
+        self.end_timer.cancel()
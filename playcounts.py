@@ -0,0 +1,150 @@
+import glob
+import os
+import threading
+
+
+#счётчики прослушиваний на диске: снимок <path>.tsv плюс журналы <path>.<поколение>.log,
+#куда дописываются инкременты. запись идёт в фоне пачками с одним fsync на пачку,
+#а когда журнал разрастается, он сворачивается в новый снимок.
+#снимок помнит, с какого поколения журнала начинаются ещё не учтённые в нём записи,
+#поэтому падение посреди сворачивания не приводит к двойному счёту
+class PlayCountStore:
+    def __init__(self, path="play_counts", flush_interval=1.0, compact_after=10000):
+        self.path = path
+        self.snapshot_path = path + ".tsv"
+        self.flush_interval = flush_interval
+        self.compact_after = compact_after
+        self.counts = {}
+        self.generation = 0
+        self.log_lines = 0
+        self.flushes = 0
+        self.compactions = 0
+        self._pending = []
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.load()
+
+    @property
+    def log_path(self):
+        return f"{self.path}.{self.generation}.log"
+
+    #снимок и журналы читаются целиком, каждый файл за один read()
+    def load(self):
+        counts = {}
+        generation = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            if lines and lines[0].startswith("#log "):
+                generation = int(lines.pop(0)[5:])
+            for line in lines:
+                key, _, count = line.rpartition("\t")
+                if key and count.isdigit():
+                    counts[key] = int(count)
+        self.log_lines = 0
+        for log_generation, log_path in self._logs():
+            if log_generation < generation:
+                os.remove(log_path)
+                continue
+            with open(log_path, "r+b") as f:
+                data = f.read()
+                #последняя строка может быть оборвана, если процесс упал посреди записи:
+                #её отрезаем, иначе следующий инкремент допишется в её конец
+                end = data.rfind(b"\n") + 1
+                if end < len(data):
+                    f.truncate(end)
+            for line in data[:end].decode("utf-8").split("\n")[:-1]:
+                key, _, delta = line.rpartition("\t")
+                if key and delta.isdigit():
+                    counts[key] = counts.get(key, 0) + int(delta)
+                    self.log_lines += 1
+            generation = max(generation, log_generation)
+        self.generation = generation
+        self.counts = counts
+        return counts
+
+    def get(self, key):
+        return self.counts.get(key, 0)
+
+    def increment(self, key, delta=1):
+        with self._cond:
+            if self._closed:
+                return
+            self.counts[key] = self.counts.get(key, 0) + delta
+            self._pending.append((key, delta))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="play-counts", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def flush(self):
+        with self._io_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if batch:
+                self._write(batch)
+
+    def compact(self):
+        with self._io_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+                if batch:
+                    self._write(batch)
+                snapshot = dict(self.counts)
+                self.generation += 1
+                self.log_lines = 0
+            tmp = self.snapshot_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(f"#log {self.generation}\n")
+                f.write("".join(f"{key}\t{count}\n" for key, count in snapshot.items()))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snapshot_path)
+            for log_generation, log_path in self._logs():
+                if log_generation < self.generation:
+                    os.remove(log_path)
+            self.compactions += 1
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                #даём накопиться пачке, чтобы не делать fsync на каждое нажатие
+                self._cond.wait(self.flush_interval)
+            self.flush()
+            if self.log_lines >= self.compact_after:
+                self.compact()
+
+    def _write(self, batch):
+        merged = {}
+        for key, delta in batch:
+            merged[key] = merged.get(key, 0) + delta
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write("".join(f"{key}\t{delta}\n" for key, delta in merged.items()))
+            f.flush()
+            os.fsync(f.fileno())
+        self.log_lines += len(merged)
+        self.flushes += 1
+
+    def _logs(self):
+        logs = []
+        prefix = self.path + "."
+        for log_path in glob.glob(glob.escape(prefix) + "*.log"):
+            generation = log_path[len(prefix):-len(".log")]
+            if generation.isdigit():
+                logs.append((int(generation), log_path))
+        return sorted(logs)
@@ -0,0 +1,55 @@
+#рейтинг прослушиваний: ключи лежат в массиве по убыванию счётчика,
+#а для каждого значения счётчика помним, где начинается его блок.
+#счётчик растёт на 1, поэтому трек достаточно поменять местами с первым
+#элементом своего блока - порядок сохраняется, сортировать ничего не нужно
+class PlayRanking:
+    def __init__(self, counts):
+        self.counts = counts
+        self.rebuild()
+
+    def rebuild(self):
+        self.order = sorted(self.counts, key=lambda key: self.counts[key], reverse=True)
+        self.pos = {key: i for i, key in enumerate(self.order)}
+        self.block_start = {}
+        for i, key in enumerate(self.order):
+            self.block_start.setdefault(self.counts[key], i)
+
+    #возвращает позиции, у которых поменялся трек или счётчик
+    def increment(self, key):
+        if key not in self.pos:
+            self.add(key)
+        count = self.counts[key]
+        p = self.pos[key]
+        start = self.block_start[count]
+        if p != start:
+            other = self.order[start]
+            self.order[start], self.order[p] = key, other
+            self.pos[key], self.pos[other] = start, p
+        self.counts[key] = count + 1
+        if start + 1 < len(self.order) and self.counts[self.order[start + 1]] == count:
+            self.block_start[count] = start + 1
+        else:
+            del self.block_start[count]
+        self.block_start.setdefault(count + 1, start)
+        return (start, p) if p != start else (start,)
+
+    def add(self, key):
+        if key in self.pos:
+            return
+        count = self.counts.setdefault(key, 0)
+        if self.order and self.counts[self.order[-1]] < count:
+            self.rebuild()
+            return
+        self.pos[key] = len(self.order)
+        self.order.append(key)
+        self.block_start.setdefault(count, self.pos[key])
+
+    def rank(self, key):
+        return self.pos[key]
+
+    def top(self, n=None):
+        keys = self.order if n is None else self.order[:n]
+        return [(key, self.counts[key]) for key in keys]
+
+    def __len__(self):
+        return len(self.order)
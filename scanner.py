@@ -0,0 +1,124 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from metadata import MetadataExtractor, display_title
+
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".aac", ".flac", ".ogg", ".oga", ".opus", ".wav")
+
+
+#рекурсивный обход папки с треками: каталоги читаются параллельно в пуле потоков,
+#а найденные треки отдаются пачками, не дожидаясь конца обхода
+class LibraryScanner:
+    FRESH_DIR_WINDOW = 2.0
+
+    def __init__(self, catalog, max_workers=4, batch_size=200, extensions=AUDIO_EXTENSIONS, metadata_workers=8):
+        self.catalog = catalog
+        self.max_workers = max_workers
+        self.metadata_workers = metadata_workers
+        self.batch_size = batch_size
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.dirs_rescanned = 0
+
+    def scan(self, root):
+        self.dirs_rescanned = 0
+        try:
+            os.stat(root)
+        except FileNotFoundError:
+            self.catalog.forget_root(root)
+            return
+        known = self.catalog.dir_states(root)
+        batch = []
+        self.metadata = MetadataExtractor(self.metadata_workers)
+        try:
+            yield from self._walk(root, known, batch)
+        finally:
+            self.metadata.close()
+
+    def _walk(self, root, known, batch):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = {pool.submit(self._list_dir, root, known.get(root)): root}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    directory = pending.pop(future)
+                    try:
+                        mtime_ns, paths, changed, subdirs = future.result()
+                    except OSError:
+                        self.catalog.drop_dir(directory)
+                        continue
+                    if mtime_ns is None:
+                        subdirs = self.catalog.subdirs(directory)
+                    else:
+                        self.catalog.store_dir(root, directory, mtime_ns, paths, changed, subdirs)
+                        self.dirs_rescanned += 1
+                    for sub in subdirs:
+                        pending[pool.submit(self._list_dir, sub, known.get(sub))] = sub
+                    batch.extend(self.catalog.dir_tracks(directory))
+                if len(batch) >= self.batch_size:
+                    self.catalog.commit()
+                    yield batch
+                    batch = []
+        self.catalog.commit()
+        if batch:
+            yield batch
+
+    #пересканирует только перечисленные папки, а в них - новые подпапки целиком.
+    #возвращает треки этих папок в каталоге до и после, чтобы можно было посчитать разницу
+    def rescan(self, root, directories):
+        before = []
+        after = []
+        pending = list(directories)
+        seen = set()
+        self.metadata = MetadataExtractor(self.metadata_workers)
+        try:
+            while pending:
+                directory = pending.pop()
+                if directory in seen or not (directory == root or directory.startswith(root + "/")):
+                    continue
+                seen.add(directory)
+                known_subdirs = set(self.catalog.subdirs(directory))
+                before.extend(self.catalog.dir_tracks(directory))
+                try:
+                    mtime_ns, paths, changed, subdirs = self._list_dir(directory, None)
+                except OSError:
+                    before.extend(self.catalog.tree_tracks(directory))
+                    self.catalog.drop_dir(directory)
+                    continue
+                for sub in known_subdirs.difference(subdirs):
+                    before.extend(self.catalog.tree_tracks(sub))
+                self.catalog.store_dir(root, directory, mtime_ns, paths, changed, subdirs)
+                self.dirs_rescanned += 1
+                pending.extend(sub for sub in subdirs if sub not in known_subdirs)
+                after.extend(self.catalog.dir_tracks(directory))
+            self.catalog.commit()
+        finally:
+            self.metadata.close()
+        return before, after
+
+    #выполняется в потоке пула: stat/scandir и чтение тегов только у изменившихся файлов
+    def _list_dir(self, directory, known_mtime_ns):
+        st = os.stat(directory)
+        if st.st_mtime_ns == known_mtime_ns:
+            return None, None, None, None
+        files = []
+        subdirs = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                path = f"{directory}/{entry.name}"
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(path)
+                    elif entry.name.lower().endswith(self.extensions) and entry.is_file():
+                        file_st = entry.stat()
+                        files.append((path, os.path.splitext(entry.name)[0], file_st.st_mtime_ns, file_st.st_size))
+                except OSError:
+                    continue
+        cached = self.catalog.file_states(directory)
+        stale = [file for file in files if cached.get(file[0]) != (file[2], file[3])]
+        changed = []
+        for (path, stem, file_mtime_ns, size), tags in zip(stale, self.metadata.extract([file[0] for file in stale])):
+            changed.append((path, display_title(tags, stem), tags.get("artist"), tags.get("album"), tags.get("track_no"), file_mtime_ns, size))
+        mtime_ns = st.st_mtime_ns
+        if time.time() - st.st_mtime < self.FRESH_DIR_WINDOW:
+            mtime_ns = -1
+        return mtime_ns, [file[0] for file in files], changed, subdirs
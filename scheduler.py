@@ -0,0 +1,289 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from metrics import REGISTRY, SIZE_BUCKETS
+
+
+#обработчики только помечают изменённые контролы, а планировщик отправляет их
+#клиенту одним page.update() - в конце обработчика и не чаще одного раза за кадр
+class UpdateScheduler:
+    def __init__(self, page, fps=60, metrics=REGISTRY):
+        self.page = page
+        self.metrics = metrics
+        self.frame_interval = 1 / fps
+        self.requested = 0
+        self.flushes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._dirty = {}
+        self._full = False
+        self._scheduled = False
+        self._last_flush = 0.0
+
+    #сколько page.update() удалось не делать
+    @property
+    def saved(self):
+        return self.requested - self.flushes
+
+    def mark(self, *controls):
+        with self._lock:
+            self.requested += 1
+            if controls:
+                for control in controls:
+                    self._dirty.setdefault(id(control), control)
+            else:
+                self._full = True
+        if getattr(self._local, "depth", 0) == 0:
+            self._schedule()
+
+    @contextmanager
+    def batch(self):
+        self._local.depth = getattr(self._local, "depth", 0) + 1
+        try:
+            yield self
+        finally:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                self._schedule()
+
+    def _schedule(self):
+        with self._lock:
+            if self._scheduled or not (self._dirty or self._full):
+                return
+            delay = self._last_flush + self.frame_interval - time.monotonic()
+            loop = getattr(self.page, "loop", None)
+            if delay > 0 and loop is not None and loop.is_running():
+                #кадр ещё не закончился - досылаем всё накопленное в его конце
+                self._scheduled = True
+                loop.call_soon_threadsafe(loop.call_later, delay, self.page.run_thread, self.flush)
+                return
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._scheduled = False
+            if not (self._dirty or self._full):
+                return
+            controls = list(self._dirty.values())
+            full = self._full
+            self._dirty.clear()
+            self._full = False
+            self._last_flush = time.monotonic()
+            self.flushes += 1
+        started = time.perf_counter()
+        if full:
+            self.page.update()
+        else:
+            self.page.update(*controls)
+        self.metrics.observe("player_page_update_seconds", time.perf_counter() - started, kind="full" if full else "partial")
+        if not full:
+            self.metrics.observe("player_page_update_controls", len(controls), SIZE_BUCKETS)
+
+
+#все page.update() внутри обработчика сливаются в один
+def coalesce_updates(handler):
+    @functools.wraps(handler)
+    def wrapper(self, *args, **kwargs):
+        scheduler = self.scheduler
+        if scheduler is None:
+            return handler(self, *args, **kwargs)
+        with scheduler.batch():
+            return handler(self, *args, **kwargs)
+    return wrapper
+
+
+#один долгоживущий поток на все анимации: на каждом кадре опрашивает запущенные
+#анимации и помечает их контролы в UpdateScheduler; если анимировать нечего
+#или вкладка не видна, поток спит до следующего wake()
+class AnimationLoop:
+    def __init__(self, scheduler, fps=20):
+        self.scheduler = scheduler
+        self.fps = fps
+        self.visible = True
+        self.frames = 0
+        self._targets = []
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    @property
+    def frame_interval(self):
+        return 1 / self.fps
+
+    def add(self, target):
+        with self._cond:
+            self._targets.append(target)
+            self._cond.notify()
+
+    def remove(self, target):
+        with self._cond:
+            self._targets.remove(target)
+
+    def set_visible(self, visible):
+        with self._cond:
+            self.visible = visible
+            self._cond.notify()
+
+    def wake(self):
+        with self._cond:
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run, name="animation-loop", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def shutdown(self, timeout=1.0):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _active(self):
+        if not self.visible:
+            return []
+        return [target for target in self._targets if target.running]
+
+    def _run(self):
+        next_frame = time.monotonic()
+        while True:
+            with self._cond:
+                while not self._stopped and not self._active():
+                    self._cond.wait()
+                    next_frame = time.monotonic()
+                if self._stopped:
+                    return
+                active = self._active()
+            now = time.monotonic()
+            changed = []
+            for target in active:
+                changed.extend(target.tick(now))
+            if changed:
+                self.scheduler.mark(*changed)
+            self.frames += 1
+            REGISTRY.observe("player_animation_frame_seconds", time.monotonic() - now)
+            next_frame += self.frame_interval
+            delay = next_frame - time.monotonic()
+            if delay < 0:
+                #кадр не уложился в свой интервал
+                REGISTRY.inc("player_animation_late_frames_total")
+                next_frame = time.monotonic()
+                continue
+            with self._cond:
+                if not self._stopped:
+                    self._cond.wait(delay)
+
+
+#реальное время; PlaybackCore может получить вместо него виртуальные часы
+class SystemClock:
+    def monotonic(self):
+        return time.monotonic()
+
+    def perf_counter(self):
+        return time.perf_counter()
+
+    def time(self):
+        return time.time()
+
+    def call_later(self, delay, callback, *args):
+        timer = threading.Timer(delay, callback, args=args)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+
+#локальный таймер конца трека: вместо проверки position >= duration на каждом тике
+#заводим один таймер на момент окончания и перезаводим его, только если позиция
+#разошлась с прогнозом (перемотка, пауза)
+class TrackEndTimer:
+    def __init__(self, callback, lead_ms=100, tolerance_ms=250, clock=None):
+        self.callback = callback
+        self.clock = clock if clock is not None else SystemClock()
+        self.lead_ms = lead_ms
+        self.tolerance = tolerance_ms / 1000
+        self.rearms = 0
+        self._lock = threading.Lock()
+        self._timer = None
+        self._deadline = None
+        self._token = 0
+
+    @property
+    def armed(self):
+        return self._timer is not None
+
+    def sync(self, position_ms, duration_ms):
+        if duration_ms is None:
+            return
+        remaining = max(0, duration_ms - self.lead_ms - position_ms) / 1000
+        deadline = self.clock.monotonic() + remaining
+        with self._lock:
+            if self._timer is not None and abs(deadline - self._deadline) < self.tolerance:
+                return
+            if self._timer is not None:
+                self._timer.cancel()
+            self._token += 1
+            self._deadline = deadline
+            self._timer = self.clock.call_later(remaining, self._fire, self._token)
+            self.rearms += 1
+
+    #возвращает True, если таймер был заведён и ещё не сработал
+    def cancel(self):
+        with self._lock:
+            self._token += 1
+            timer, self._timer = self._timer, None
+        if timer is None:
+            return False
+        timer.cancel()
+        return True
+
+    def _fire(self, token):
+        with self._lock:
+            if token != self._token:
+                return
+            self._timer = None
+        self.callback()
+
+
+#откладывает вызов до паузы в событиях: срабатывает один раз через delay после последнего.
+#серию событий обслуживает один поток: вызов только сдвигает срок, а поток, дождавшись его,
+#выполняет callback и завершается, если новых событий не было
+class Debouncer:
+    def __init__(self, delay, callback):
+        self.delay = delay
+        self.callback = callback
+        self.fired = 0
+        self.threads = 0
+        self._cond = threading.Condition()
+        self._deadline = None
+        self._args = ()
+        self._thread = None
+
+    def __call__(self, *args):
+        with self._cond:
+            self._deadline = time.monotonic() + self.delay
+            self._args = args
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="debouncer", daemon=True)
+                self.threads += 1
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self):
+        with self._cond:
+            self._deadline = None
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._deadline is None:
+                    self._thread = None
+                    return
+                remaining = self._deadline - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                args, self._deadline = self._args, None
+                self.fired += 1
+            self.callback(*args)
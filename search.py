@@ -0,0 +1,201 @@
+import heapq
+import re
+import threading
+from collections import Counter, deque
+
+WORD = re.compile(r"\w+")
+#оценки совпадения слова запроса со словом трека; нечёткие совпадения получают
+#сходство по триграммам от MIN_SIMILARITY до 1, то есть всегда ниже префиксных
+EXACT = 3.0
+PREFIX = 2.0
+MIN_SIMILARITY = 0.3
+
+
+def tokenize(text):
+    return WORD.findall(text.casefold().replace("ё", "е"))
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(grams, other):
+    shared = len(grams & other)
+    return shared / (len(grams) + len(other) - shared)
+
+
+class _Node:
+    __slots__ = ("children", "docs")
+
+    def __init__(self):
+        self.children = {}
+        #url треков, в которых есть слово, заканчивающееся в этом узле
+        self.docs = None
+
+
+#индекс для поиска по мере набора: префиксное дерево слов из названия, исполнителя
+#и альбома плюс инвертированный индекс триграмм слов для опечаток.
+#обновляется по одному треку, поэтому пересканирование библиотеки его не перестраивает
+class SearchIndex:
+    def __init__(self, fields=("title", "artist", "album")):
+        self.fields = fields
+        self.root = _Node()
+        self.docs = {}
+        self.grams = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, track):
+        with self._lock:
+            self._add(track)
+
+    def remove(self, url):
+        with self._lock:
+            self._remove(url)
+
+    #приводит индекс к списку треков, трогая только добавленные, удалённые и изменённые
+    def sync(self, tracks):
+        with self._lock:
+            urls = {track["url"] for track in tracks}
+            for url in [url for url in self.docs if url not in urls]:
+                self._remove(url)
+            for track in tracks:
+                entry = self.docs.get(track["url"])
+                if entry is None or entry[0] != track:
+                    self._add(track)
+
+    def _add(self, track):
+        url = track["url"]
+        if url in self.docs:
+            self._remove(url)
+        tokens = set()
+        for field in self.fields:
+            value = track.get(field)
+            if value:
+                tokens.update(tokenize(str(value)))
+        self.docs[url] = (track, tokens)
+        for token in tokens:
+            node = self.root
+            for ch in token:
+                child = node.children.get(ch)
+                if child is None:
+                    child = node.children[ch] = _Node()
+                node = child
+            if node.docs is None:
+                node.docs = set()
+                for gram in trigrams(token):
+                    self.grams.setdefault(gram, set()).add(token)
+            node.docs.add(url)
+
+    def _remove(self, url):
+        entry = self.docs.pop(url, None)
+        if entry is None:
+            return
+        for token in entry[1]:
+            path = [self.root]
+            for ch in token:
+                path.append(path[-1].children[ch])
+            node = path[-1]
+            node.docs.discard(url)
+            if node.docs:
+                continue
+            node.docs = None
+            for gram in trigrams(token):
+                tokens = self.grams[gram]
+                tokens.discard(token)
+                if not tokens:
+                    del self.grams[gram]
+            #обрезаем опустевшую ветку дерева
+            for i in range(len(token), 0, -1):
+                if path[i].children or path[i].docs is not None:
+                    break
+                del path[i - 1].children[token[i - 1]]
+
+    def _node(self, token):
+        node = self.root
+        for ch in token:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+        return node
+
+    #обход поддерева в ширину: короткие слова (ближе к запросу) попадаются первыми,
+    #поэтому при limit можно остановиться, не доходя до длинных
+    def _prefix(self, word, limit=None):
+        found = {}
+        node = self._node(word)
+        if node is None:
+            return found
+        queue = deque([(node, 0)])
+        while queue:
+            node, depth = queue.popleft()
+            if node.docs:
+                score = EXACT if depth == 0 else PREFIX + len(word) / (len(word) + depth)
+                for url in node.docs:
+                    found.setdefault(url, score)
+                if limit is not None and len(found) >= limit:
+                    break
+            queue.extend((child, depth + 1) for child in node.children.values())
+        return found
+
+    def _fuzzy(self, word):
+        found = {}
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.grams.get(gram, ()))
+        for token, count in shared.items():
+            score = count / (len(grams) + len(trigrams(token)) - count)
+            if score < MIN_SIMILARITY:
+                continue
+            for url in self._node(token).docs:
+                if found.get(url, 0) < score:
+                    found[url] = score
+        return found
+
+    def _match(self, word, tokens):
+        best = 0
+        grams = trigrams(word) if len(word) >= 3 else None
+        for token in tokens:
+            if token == word:
+                return EXACT
+            if token.startswith(word):
+                best = max(best, PREFIX + len(word) / len(token))
+            elif grams is not None and best < PREFIX:
+                score = similarity(grams, trigrams(token))
+                if score >= MIN_SIMILARITY:
+                    best = max(best, score)
+        return best
+
+    #самое длинное слово запроса ищем по индексу, остальными фильтруем найденное
+    def search(self, query, limit=50):
+        words = tokenize(query)
+        if not words:
+            return []
+        anchor = max(words, key=len)
+        rest = list(words)
+        rest.remove(anchor)
+        with self._lock:
+            matches = self._prefix(anchor, None if rest else limit)
+            if len(anchor) >= 3 and (limit is None or len(matches) < limit):
+                for url, score in self._fuzzy(anchor).items():
+                    matches.setdefault(url, score)
+            scores = {}
+            for url, score in matches.items():
+                tokens = self.docs[url][1]
+                for word in rest:
+                    best = self._match(word, tokens)
+                    if not best:
+                        break
+                    score += best
+                else:
+                    scores[url] = score
+            rank = lambda url: (-scores[url], self.docs[url][0]["title"])
+            if limit is None:
+                ranked = sorted(scores, key=rank)
+            else:
+                ranked = heapq.nsmallest(limit, scores, key=rank)
+            return [self.docs[url][0] for url in ranked]
@@ -0,0 +1,45 @@
+import random
+
+
+#порядок перемешивания хранится как перестановка индексов исходного плейлиста
+#плюс обратная перестановка, поэтому переходы между режимами не ищут треки в списке
+class ShuffleOrder:
+    def __init__(self, rng=None):
+        self.rng = rng or random.Random()
+        self.order = []
+        self.position = []
+
+    #новая перестановка, в которой исходный трек anchor стоит на позиции anchor_pos
+    def shuffle(self, size, anchor=None, anchor_pos=0):
+        rest = [i for i in range(size) if i != anchor] if anchor is not None else list(range(size))
+        self.rng.shuffle(rest)
+        #перемешивание, совпавшее с исходным порядком, пользователь не отличит от выключенного.
+        #такое перемешивание повторяется целиком, чтобы остальные порядки остались равновероятными
+        while len(rest) > 1 and all(rest[i] < rest[i + 1] for i in range(len(rest) - 1)):
+            self.rng.shuffle(rest)
+        if anchor is not None:
+            rest.insert(anchor_pos, anchor)
+        return self.reset(rest)
+
+    def reset(self, order):
+        self.order = order
+        self.position = [0] * len(order)
+        for pos, index in enumerate(order):
+            self.position[index] = pos
+        return order
+
+    #новые треки добавляются в конец текущего круга
+    def extend(self, count):
+        start = len(self.position)
+        for index in range(start, start + count):
+            self.position.append(len(self.order))
+            self.order.append(index)
+
+    def original_index(self, pos):
+        return self.order[pos]
+
+    def shuffled_position(self, index):
+        return self.position[index]
+
+    def __len__(self):
+        return len(self.order)
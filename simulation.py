@@ -0,0 +1,182 @@
+import heapq
+import itertools
+from types import SimpleNamespace
+
+
+class _Call:
+    __slots__ = ("cancelled",)
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+#виртуальные часы: время стоит на месте, пока его не продвинут через advance(),
+#а отложенные вызовы выполняются по порядку своих моментов
+class VirtualClock:
+    def __init__(self, start=0.0, epoch=1_700_000_000.0):
+        self.now = start
+        self.epoch = epoch
+        self.calls_run = 0
+        self._queue = []
+        self._seq = itertools.count()
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def time(self):
+        return self.epoch + self.now
+
+    def call_later(self, delay, callback, *args):
+        call = _Call()
+        heapq.heappush(self._queue, (self.now + max(0.0, delay), next(self._seq), call, callback, args))
+        return call
+
+    def advance(self, seconds):
+        self.run_until(self.now + seconds)
+
+    def run_until(self, deadline):
+        while self._queue and self._queue[0][0] <= deadline:
+            when, _, call, callback, args = heapq.heappop(self._queue)
+            if call.cancelled:
+                continue
+            self.now = when
+            self.calls_run += 1
+            callback(*args)
+        self.now = max(self.now, deadline)
+
+
+#плеер-симулятор с интерфейсом fa.Audio: после установки src через load_ms
+#присылает loaded, пока играет - position_changed раз в tick_ms,
+#а в конце трека - state_changed "completed". события отдаются обработчикам
+#PlaybackCore напрямую, без цикла событий
+class FakeAudio:
+    def __init__(self, backend, core):
+        self.backend = backend
+        self.core = core
+        self.clock = backend.clock
+        self.volume = 0.5
+        self.loaded = False
+        self.playing = False
+        self.duration = None
+        self._src = None
+        self._position = 0
+        self._started_at = None
+        self._load_call = None
+        self._tick_call = None
+
+    @property
+    def src(self):
+        return self._src
+
+    @src.setter
+    def src(self, url):
+        if url == self._src:
+            return
+        self._stop_ticks()
+        if self._load_call is not None:
+            self._load_call.cancel()
+        self._src = url
+        self.loaded = False
+        self.playing = False
+        self._position = 0
+        self.duration = None
+        if url:
+            self._load_call = self.clock.call_later(self.backend.load_ms / 1000, self._finish_load)
+
+    @property
+    def position(self):
+        if self.playing:
+            elapsed = (self.clock.monotonic() - self._started_at) * 1000
+            return min(self.duration, self._position + int(elapsed))
+        return self._position
+
+    def play(self):
+        self.resume()
+
+    def resume(self):
+        if not self.loaded or self.playing:
+            return
+        self.playing = True
+        self._started_at = self.clock.monotonic()
+        self._emit_state("playing")
+        self._schedule_tick()
+
+    def pause(self):
+        if not self.playing:
+            return
+        self._position = self.position
+        self.playing = False
+        self._stop_ticks()
+        self._emit_state("paused")
+
+    def seek(self, position_ms):
+        self._position = max(0, min(int(position_ms), self.duration or 0))
+        if self.playing:
+            self._started_at = self.clock.monotonic()
+            self._stop_ticks()
+            self._schedule_tick()
+
+    async def get_duration_async(self):
+        return self.duration
+
+    def _finish_load(self):
+        self._load_call = None
+        self.duration = self.backend.duration_of(self._src)
+        self.loaded = True
+        self.backend.events += 1
+        self.core.audio_loaded(SimpleNamespace(control=self, data=None), self.duration)
+
+    def _schedule_tick(self):
+        remaining = self.duration - self.position
+        delay = min(self.backend.tick_ms, remaining) / 1000
+        self._tick_call = self.clock.call_later(delay, self._tick)
+
+    def _stop_ticks(self):
+        if self._tick_call is not None:
+            self._tick_call.cancel()
+            self._tick_call = None
+
+    def _tick(self):
+        self._tick_call = None
+        position = self.position
+        self.backend.events += 1
+        self.core.audio_position_changed(SimpleNamespace(control=self, data=str(position)))
+        if not self.playing:
+            return
+        if position >= self.duration:
+            self._position = self.duration
+            self.playing = False
+            self._emit_state("completed")
+            return
+        self._schedule_tick()
+
+    def _emit_state(self, state):
+        self.backend.events += 1
+        self.core.audio_state_changed(SimpleNamespace(control=self, data=state))
+
+
+#backend для PlaybackCore на виртуальных часах: длительность трека берётся
+#из durations или по умолчанию default_duration_ms
+class FakeAudioBackend:
+    def __init__(self, clock, durations=None, default_duration_ms=180000, load_ms=50, tick_ms=200):
+        self.clock = clock
+        self.durations = durations or {}
+        self.default_duration_ms = default_duration_ms
+        self.load_ms = load_ms
+        self.tick_ms = tick_ms
+        self.events = 0
+        self.players = []
+
+    def duration_of(self, url):
+        return self.durations.get(url, self.default_duration_ms)
+
+    def create_player(self, core):
+        player = FakeAudio(self, core)
+        self.players.append(player)
+        return player
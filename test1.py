@@ -1,11 +1,14 @@
 import unittest
 import os
+import shutil
+import tempfile
 from audio_player import AudioPlayerManager
+from fixtures import temp_library
 
 class TestLoadLocalTracks(unittest.TestCase):
     def setUp(self):
-        self.manager = AudioPlayerManager(None, None)
-        self.manager.tracks_folder = "test_tracks"
+        self.tmp = tempfile.mkdtemp()
+        self.manager = AudioPlayerManager(None, None, library=temp_library(self.tmp, "test_tracks"))
         os.makedirs(self.manager.tracks_folder, exist_ok=True)
         open(os.path.join(self.manager.tracks_folder, "track1.mp3"), "w").close()
         open(os.path.join(self.manager.tracks_folder, "track2.mp3"), "w").close()
@@ -17,9 +20,9 @@ class TestLoadLocalTracks(unittest.TestCase):
         self.assertEqual(tracks[1]["title"], "track2", "второй трек должен быть track2")
 
     def tearDown(self):
-        for file in os.listdir(self.manager.tracks_folder):
-            os.remove(os.path.join(self.manager.tracks_folder, file))
-        os.rmdir(self.manager.tracks_folder)
+        self.manager.close()
+        self.manager.catalog.close()
+        shutil.rmtree(self.tmp)
 
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import shutil
+import tempfile
+import asyncio
+import time
+from types import SimpleNamespace
+from audio_player import AudioPlayerManager, UIComponents
+from scheduler import TrackEndTimer
+from fixtures import temp_library, FakePage
+
+class TestPositionThrottle(unittest.TestCase):
+    def setUp(self):
+        self.page = FakePage()
+        self.tmp = tempfile.mkdtemp()
+        self.manager = AudioPlayerManager(None, None, library=temp_library(self.tmp))
+        self.manager.original_playlist = [{"url": "track1.mp3", "title": "track1"}]
+        self.manager.playlist = self.manager.original_playlist.copy()
+        self.manager.play_counts = {"track1.mp3": 0}
+        self.ui = UIComponents(self.page, self.manager)
+        self.manager.ui = self.ui
+
+    def tearDown(self):
+        self.manager.close()
+        self.manager.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def test_position_burst_is_throttled(self):
+        self.manager.duration_ms = 180000
+        for position in range(1000, 1200, 10):
+            self.manager.audio_position_changed(SimpleNamespace(data=str(position)))
+        self.assertEqual(len(self.page.updated), 1, "пачка событий позиции должна дать одно обновление")
+        self.assertEqual(self.manager.position_ms, 1190, "позиция должна запоминаться даже без перерисовки")
+        self.manager.skip_position_frames = False
+        self.manager.audio_position_changed(SimpleNamespace(data="1200"))
+        self.assertEqual(self.ui.progress_slider.value, 1200, "без пропуска кадров слайдер обновляется всегда")
+
+def stub_audio(player, calls, duration):
+    player.play = lambda: calls.append(("play", player))
+    player.pause = lambda: calls.append(("pause", player))
+    player.resume = lambda: calls.append(("resume", player))
+    async def get_duration_async():
+        return duration
+    player.get_duration_async = get_duration_async
+
+class TestGaplessPlayback(unittest.TestCase):
+    def setUp(self):
+        self.page = FakePage()
+        self.tmp = tempfile.mkdtemp()
+        self.manager = AudioPlayerManager(None, None, library=temp_library(self.tmp))
+        self.manager.original_playlist = [{"url": f"track{i}.mp3", "title": f"track{i}"} for i in range(3)]
+        self.manager.playlist = self.manager.original_playlist.copy()
+        self.manager.play_counts = {track["url"]: 0 for track in self.manager.playlist}
+        self.ui = UIComponents(self.page, self.manager)
+        self.manager.ui = self.ui
+        self.calls = []
+        stub_audio(self.manager.audio_player, self.calls, 1000)
+        stub_audio(self.manager.standby_player, self.calls, 2000)
+
+    def tearDown(self):
+        self.manager.close()
+        self.manager.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def load(self, index):
+        self.manager.load_track(index, True)
+
+    def test_swap_to_preloaded_track(self):
+        first, standby = self.manager.audio_player, self.manager.standby_player
+        self.load(0)
+        asyncio.run(self.manager.on_loaded(SimpleNamespace(control=first)))
+        self.assertEqual(standby.src, "track1.mp3", "резервный плеер должен загружать следующий трек")
+        asyncio.run(self.manager.on_loaded(SimpleNamespace(control=standby)))
+        self.calls.clear()
+        self.manager.track_finished()
+        self.manager.end_timer.cancel()
+        self.assertIs(self.manager.audio_player, standby, "плееры должны поменяться ролями")
+        self.assertEqual(self.calls, [("play", standby), ("pause", first)], "следующий трек должен стартовать без загрузки")
+        self.assertEqual(self.manager.duration_ms, 2000, "длительность берётся из предзагрузки")
+        self.assertEqual(self.manager.current_track_index, 1, "текущим должен стать следующий трек")
+        self.assertEqual(len(self.manager.swap_latencies), 1, "задержка переключения должна измеряться")
+        self.assertEqual(first.src, "track2.mp3", "освободившийся плеер должен загружать следующий трек")
+
+    def test_events_from_standby_are_ignored(self):
+        self.manager.duration_ms = 180000
+        self.manager.audio_position_changed(SimpleNamespace(control=self.manager.standby_player, data="5000"))
+        self.assertEqual(self.manager.position_ms, 0, "позиция резервного плеера не должна влиять на интерфейс")
+
+class TestTrackEndTimer(unittest.TestCase):
+    def test_fires_once_at_end(self):
+        fired = []
+        timer = TrackEndTimer(lambda: fired.append(time.monotonic()), lead_ms=0)
+        start = time.monotonic()
+        timer.sync(0, 100)
+        for position in (20, 40, 60):
+            timer.sync(position, 100)
+        self.assertEqual(timer.rearms, 1, "без расхождения таймер не должен перезаводиться")
+        time.sleep(0.2)
+        self.assertEqual(len(fired), 1, "таймер должен сработать один раз")
+        self.assertAlmostEqual(fired[0] - start, 0.1, delta=0.05, msg="таймер должен сработать к концу трека")
+
+    def test_seek_rearms_and_cancel_stops(self):
+        fired = []
+        timer = TrackEndTimer(lambda: fired.append(1), lead_ms=0)
+        timer.sync(0, 10000)
+        timer.sync(9000, 10000)
+        self.assertEqual(timer.rearms, 2, "перемотка должна перезавести таймер")
+        self.assertTrue(timer.cancel(), "отмена заведённого таймера должна вернуть True")
+        self.assertFalse(timer.cancel(), "повторная отмена ничего не делает")
+        self.assertEqual(fired, [], "отменённый таймер не должен срабатывать")
+
+if __name__ == "__main__":
+    unittest.main()
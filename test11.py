@@ -0,0 +1,67 @@
+import unittest
+import shutil
+import tempfile
+import random
+from audio_player import AudioPlayerManager
+from shuffle import ShuffleOrder
+from fixtures import temp_library
+
+class TestShuffleOrder(unittest.TestCase):
+    def test_permutation_and_inverse(self):
+        order = ShuffleOrder(random.Random(1))
+        order.shuffle(100, anchor=42, anchor_pos=10)
+        self.assertEqual(sorted(order.order), list(range(100)), "должна получиться перестановка")
+        self.assertEqual(order.original_index(10), 42, "опорный трек должен остаться на своей позиции")
+        for pos, index in enumerate(order.order):
+            self.assertEqual(order.shuffled_position(index), pos, "обратная перестановка должна совпадать")
+
+    def test_never_identity(self):
+        for seed in range(50):
+            order = ShuffleOrder(random.Random(seed))
+            self.assertNotEqual(order.shuffle(3, anchor=1, anchor_pos=1), [0, 1, 2], "перемешивание не должно совпадать с исходным порядком")
+
+    def test_uniform(self):
+        order = ShuffleOrder(random.Random(5))
+        counts = {}
+        for _ in range(6000):
+            key = tuple(order.shuffle(3))
+            counts[key] = counts.get(key, 0) + 1
+        self.assertEqual(len(counts), 5, "исходный порядок не выпадает, остальные - все")
+        self.assertLess(max(counts.values()) - min(counts.values()), 150, "порядки должны быть равновероятны")
+
+class TestShuffleMode(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.manager = AudioPlayerManager(None, None, library=temp_library(self.tmp))
+        self.manager.original_playlist = [{"url": f"track{i}.mp3", "title": f"track{i}"} for i in range(10)]
+        self.manager.playlist = self.manager.original_playlist.copy()
+        self.manager.current_track_index = 4
+        self.manager.shuffle_order.rng = random.Random(3)
+
+    def tearDown(self):
+        self.manager.close()
+        self.manager.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def test_no_repeats_until_cycle_ends(self):
+        self.manager.toggle_shuffle(None)
+        played = [self.manager.playlist[self.manager.current_track_index]["url"]]
+        for _ in range(9):
+            self.manager.current_track_index = self.manager.pick_next_index()
+            played.append(self.manager.playlist[self.manager.current_track_index]["url"])
+        self.assertEqual(len(set(played)), 10, "за круг каждый трек должен сыграть ровно один раз")
+        last = played[-1]
+        self.manager.current_track_index = self.manager.pick_next_index()
+        self.assertEqual(self.manager.current_track_index, 0, "новый круг начинается с начала перестановки")
+        self.assertNotEqual(self.manager.playlist[0]["url"], last, "новый круг не должен начинаться с только что сыгранного трека")
+
+    def test_toggle_off_restores_current(self):
+        self.manager.toggle_shuffle(None)
+        self.manager.current_track_index = 7
+        url = self.manager.playlist[7]["url"]
+        self.manager.toggle_shuffle(None)
+        self.assertEqual(self.manager.playlist[self.manager.current_track_index]["url"], url, "текущий трек должен сохраниться")
+        self.assertEqual(self.manager.playlist, self.manager.original_playlist, "порядок должен вернуться к исходному")
+
+if __name__ == "__main__":
+    unittest.main()
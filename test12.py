@@ -0,0 +1,60 @@
+import unittest
+import os
+import shutil
+import tempfile
+from playcounts import PlayCountStore
+
+class TestPlayCountStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "play_counts")
+
+    def test_counts_survive_restart(self):
+        store = PlayCountStore(self.path, flush_interval=0.01)
+        for _ in range(5):
+            store.increment("1")
+        store.increment("2")
+        store.close()
+        self.assertEqual(PlayCountStore(self.path).counts, {"1": 5, "2": 1}, "счётчики должны пережить перезапуск")
+
+    def test_batches_are_merged(self):
+        store = PlayCountStore(self.path, flush_interval=10)
+        for _ in range(100):
+            store.increment("1")
+        store.flush()
+        self.assertEqual(store.flushes, 1, "пачка инкрементов должна писаться одним fsync")
+        self.assertEqual(store.log_lines, 1, "инкременты одного трека в пачке должны сливаться")
+        store.close()
+
+    def test_compaction(self):
+        store = PlayCountStore(self.path, flush_interval=10)
+        store.increment("1")
+        store.flush()
+        store.compact()
+        store.increment("1")
+        store.close()
+        self.assertEqual(store.generation, 1, "после сворачивания должен начаться новый журнал")
+        self.assertFalse(os.path.exists(self.path + ".0.log"), "старый журнал должен удалиться")
+        self.assertEqual(PlayCountStore(self.path).counts, {"1": 2}, "снимок и новый журнал должны складываться")
+
+    def test_stale_log_and_torn_line(self):
+        with open(self.path + ".tsv", "w", encoding="utf-8") as f:
+            f.write("#log 1\n1\t3\n")
+        with open(self.path + ".0.log", "w", encoding="utf-8") as f:
+            f.write("1\t3\n")
+        with open(self.path + ".1.log", "w", encoding="utf-8") as f:
+            f.write("1\t1\n2\t")
+        store = PlayCountStore(self.path)
+        self.assertEqual(store.counts, {"1": 4}, "учтённый в снимке журнал и оборванная строка не должны считаться")
+        self.assertFalse(os.path.exists(self.path + ".0.log"), "устаревший журнал должен удалиться")
+        store.increment("2")
+        store.close()
+        with open(self.path + ".1.log", encoding="utf-8") as f:
+            self.assertEqual(f.read(), "1\t1\n2\t1\n", "оборванная строка должна отрезаться, а не склеиваться со следующей")
+        self.assertEqual(PlayCountStore(self.path).counts, {"1": 4, "2": 1})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from types import SimpleNamespace
+from audio_player import AudioPlayerManager, UIComponents
+from history import ListeningHistory, SKIPPED, COMPLETED
+from fixtures import temp_library, FakePage
+
+DAY = 86400000
+
+class TestListeningHistory(unittest.TestCase):
+    def test_window_and_skip_rate(self):
+        history = ListeningHistory(None, chunk_size=4)
+        now = 100 * DAY
+        for day in range(10):
+            history.record("a", now - day * DAY, now - day * DAY + 1000, 1000, COMPLETED)
+        history.record("b", now - 20 * DAY, now, 500, SKIPPED)
+        history.record("b", now - DAY, now, 500, SKIPPED)
+        history.record("b", now - DAY, now, 500, COMPLETED)
+        self.assertEqual(len(history.chunks), 4, "события должны раскладываться по кускам")
+        top = history.top(since=now - 7 * DAY)
+        self.assertEqual(top[0][:3], ("a", 8, 0), "в окно 7 дней должны попасть только свежие прослушивания")
+        self.assertEqual(top[1][:3], ("b", 2, 1), "старое прослушивание не должно попасть в окно")
+        self.assertEqual(history.skip_rates()["b"], 2 / 3, "доля пропусков считается по всем событиям трека")
+        self.assertEqual([row[0] for row in history.top(until=now - 10 * DAY)], ["b"], "until должен отсекать поздние события")
+
+    def test_persistence_and_torn_row(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "history")
+            history = ListeningHistory(path)
+            history.record("a", 1, 2, 1, COMPLETED)
+            history.record("b", 3, 4, 1, SKIPPED)
+            history.close()
+            with open(os.path.join(path, "track.bin"), "ab") as f:
+                f.write(b"\x00\x00\x00\x00")
+            loaded = ListeningHistory(path)
+            self.assertEqual(len(loaded), 2, "недописанное событие должно отбрасываться")
+            self.assertEqual([row[:3] for row in loaded.top()], [("a", 1, 0), ("b", 1, 1)], "история должна пережить перезапуск")
+            loaded.close()
+            with open(os.path.join(path, "keys.txt"), "a", encoding="utf-8") as f:
+                f.write("tor")
+            loaded = ListeningHistory(path)
+            loaded.record("c", 5, 6, 1, COMPLETED)
+            loaded.close()
+            with open(os.path.join(path, "keys.txt"), encoding="utf-8") as f:
+                self.assertEqual(f.read(), "a\nb\nc\n", "оборванный ключ должен отрезаться, а не склеиваться со следующим")
+            self.assertEqual([row[0] for row in ListeningHistory(path).top()], ["a", "b", "c"])
+        finally:
+            shutil.rmtree(tmp)
+
+class TestListenSessions(unittest.TestCase):
+    def setUp(self):
+        self.page = FakePage()
+        self.tmp = tempfile.mkdtemp()
+        self.manager = AudioPlayerManager(None, None, library=temp_library(self.tmp))
+        self.manager.history = ListeningHistory(None)
+        self.manager.original_playlist = [{"url": f"track{i}.mp3", "title": f"track{i}"} for i in range(3)]
+        self.manager.playlist = self.manager.original_playlist.copy()
+        self.manager.play_counts = {track["url"]: 0 for track in self.manager.playlist}
+        self.ui = UIComponents(self.page, self.manager)
+        self.manager.ui = self.ui
+        self.manager.audio_player.play = lambda: None
+
+    def tearDown(self):
+        self.manager.close()
+        self.manager.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def test_skip_and_completion(self):
+        self.manager.load_track(0, True)
+        self.manager.load_track(1, True)
+        self.manager.end_timer.cancel()
+        self.manager.end_listen(COMPLETED)
+        top = {key: (plays, skips) for key, plays, skips, _ in self.manager.history.top()}
+        self.assertEqual(top, {"track0.mp3": (1, 1), "track1.mp3": (1, 0)}, "переключение трека должно записываться как пропуск")
+
+    def test_play_counted_once_per_listen(self):
+        self.manager.audio_player.pause = lambda: None
+        self.manager.audio_player.resume = lambda: None
+        self.manager.load_track(0, True)
+        self.manager.audio_loaded(SimpleNamespace(control=self.manager.audio_player), 1000)
+        for _ in range(3):
+            self.manager.play_pause_click()
+            self.manager.play_pause_click()
+        self.assertEqual(self.manager.play_counts["track0.mp3"], 1, "загрузка с автозапуском и пауза не должны добавлять прослушиваний")
+        self.assertEqual(self.manager.play_store.get("track0.mp3"), 1)
+        self.manager.end_timer.cancel()
+        self.manager.track_finished()
+        self.assertEqual(self.manager.play_counts["track1.mp3"], 1, "следующий трек - новое прослушивание")
+
+    def test_window_rows(self):
+        now = int(time.time() * 1000)
+        self.manager.history.record("track2.mp3", now, now, 1000, SKIPPED)
+        self.manager.history.record("track2.mp3", now - 10 * DAY, now, 1000, COMPLETED)
+        self.ui.ensure_tab(2)
+        self.ui.stats_window_dropdown.value = "7"
+        self.ui.stats_window_changed(None)
+        self.assertEqual([tile.title.value for tile in self.ui.stats_list.controls], ["1. track2 (1 прослушиваний, пропущено 100%)"], "статистика окна должна строиться по истории")
+
+if __name__ == "__main__":
+    unittest.main()
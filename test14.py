@@ -0,0 +1,88 @@
+import unittest
+import shutil
+import tempfile
+import asyncio
+import time
+from audio_player import AudioPlayerManager, UIComponents
+from search import SearchIndex
+from scheduler import Debouncer
+from fixtures import temp_library, FakePage
+
+def track(url, title, artist=None, album=None):
+    return {"url": url, "title": title, "artist": artist, "album": album}
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.sync([
+            track("1.mp3", "Кино - Группа крови", "Кино", "Группа крови"),
+            track("2.mp3", "Кино - Звезда по имени Солнце", "Кино"),
+            track("3.mp3", "Гранж"),
+            track("4.mp3", "Групповой трек"),
+        ])
+
+    def urls(self, query):
+        return [result["url"] for result in self.index.search(query)]
+
+    def test_prefix_and_ranking(self):
+        self.assertEqual(self.urls("груп")[0], "1.mp3", "трек с префиксом должен находиться")
+        self.assertEqual(self.urls("группа"), ["1.mp3", "4.mp3"], "точное совпадение должно быть выше префиксного и нечёткого")
+        self.assertEqual(self.urls("кино солн"), ["2.mp3"], "все слова запроса должны совпадать")
+
+    def test_fuzzy(self):
+        self.assertEqual(self.urls("звезды"), ["2.mp3"], "опечатка должна находиться по триграммам")
+        self.assertEqual(self.urls("ЗВЁЗДА"), ["2.mp3"], "регистр и ё не должны мешать поиску")
+        self.assertEqual(self.urls("ххх"), [], "запрос без общих триграмм не должен ничего находить")
+
+    def test_incremental_update(self):
+        self.index.remove("1.mp3")
+        self.assertNotIn("1.mp3", self.urls("крови"), "удалённый трек не должен находиться")
+        self.assertNotIn("крови", self.index.root.children["к"].children, "опустевшая ветка дерева должна удаляться")
+        self.index.sync([track("2.mp3", "Кино - Кукушка", "Кино"), track("5.mp3", "Кукушка")])
+        self.assertEqual(sorted(self.urls("кукушка")), ["2.mp3", "5.mp3"], "sync должен переиндексировать изменённые треки")
+        self.assertEqual(self.urls("гранж"), [], "sync должен удалять пропавшие треки")
+
+class TestDebouncer(unittest.TestCase):
+    def test_burst_fires_once(self):
+        calls = []
+        debouncer = Debouncer(0.05, calls.append)
+        for text in ["к", "ки", "кин", "кино"]:
+            debouncer(text)
+        time.sleep(0.2)
+        self.assertEqual(calls, ["кино"], "после серии нажатий поиск должен выполниться один раз с последним текстом")
+
+    def test_burst_uses_one_thread(self):
+        calls = []
+        debouncer = Debouncer(0.05, calls.append)
+        for i in range(1000):
+            debouncer(i)
+        time.sleep(0.2)
+        self.assertEqual(calls, [999])
+        self.assertEqual(debouncer.threads, 1, "серия событий не должна запускать поток на каждое")
+        debouncer("снова")
+        debouncer.cancel()
+        time.sleep(0.1)
+        self.assertEqual(calls, [999], "отменённый вызов не должен срабатывать")
+
+class TestSearchTab(unittest.TestCase):
+    def test_click_plays_result(self):
+        page = FakePage()
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        manager = AudioPlayerManager(None, None, library=temp_library(tmp))
+        self.addCleanup(manager.catalog.close)
+        self.addCleanup(manager.close)
+        manager.original_playlist = [track(f"track{i}.mp3", f"track{i}") for i in range(3)] + [track("song.mp3", "Песня")]
+        manager.playlist = manager.original_playlist.copy()
+        manager.play_counts = {t["url"]: 0 for t in manager.playlist}
+        ui = UIComponents(page, manager)
+        manager.ui = ui
+        asyncio.run(manager.index_library())
+        ui.ensure_tab(3)
+        ui.run_search("пес")
+        self.assertEqual([tile.data for tile in ui.search_list.controls], ["song.mp3"], "результаты должны попадать во вкладку поиска")
+        ui.search_click(type("Event", (), {"control": ui.search_list.controls[0]})())
+        self.assertEqual(manager.current_track_index, 3, "клик по результату должен включать трек")
+
+if __name__ == "__main__":
+    unittest.main()
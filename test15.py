@@ -0,0 +1,72 @@
+import unittest
+import shutil
+import tempfile
+import asyncio
+import threading
+from types import SimpleNamespace
+from audio_player import AudioPlayerManager, UIComponents
+from fixtures import temp_library, FakePage
+
+class TestAsyncHandlers(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.page = FakePage()
+        self.tmp = tempfile.mkdtemp()
+        self.manager = AudioPlayerManager(None, None, library=temp_library(self.tmp))
+        self.manager.original_playlist = [{"url": f"track{i}.mp3", "title": f"track{i}"} for i in range(3)]
+        self.manager.playlist = self.manager.original_playlist.copy()
+        self.manager.play_counts = {track["url"]: 0 for track in self.manager.playlist}
+        self.ui = UIComponents(self.page, self.manager)
+        self.manager.ui = self.ui
+
+    def tearDown(self):
+        self.manager.close()
+        self.manager.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    async def test_position_waits_for_running_handler(self):
+        self.manager.duration_ms = 180000
+        async with self.manager.lock:
+            tick = asyncio.create_task(self.manager.on_position_changed(SimpleNamespace(control=self.manager.audio_player, data="5000")))
+            await asyncio.sleep(0)
+            self.assertEqual(self.manager.position_ms, 0, "тик позиции не должен выполняться, пока занят lock")
+        await tick
+        self.assertEqual(self.manager.position_ms, 5000, "тик позиции должен выполниться после освобождения lock")
+
+    async def test_scan_runs_off_loop(self):
+        threads = []
+        def stream():
+            threads.append(threading.current_thread())
+            yield [{"url": "new.mp3", "title": "new"}]
+        self.manager.stream_local_tracks = stream
+        await self.manager.scan_library()
+        self.assertNotIn(threading.main_thread(), threads, "обход папки не должен выполняться на цикле событий")
+        self.assertEqual([track["url"] for track in self.manager.original_playlist], ["new.mp3"], "найденные треки должны попадать в очередь")
+
+    async def test_timer_is_handled_on_loop(self):
+        self.manager.loop = asyncio.get_running_loop()
+        finished = []
+        self.manager.track_finished = lambda: finished.append(threading.current_thread())
+        timer_thread = threading.Thread(target=self.manager.end_timer_fired)
+        timer_thread.start()
+        timer_thread.join()
+        await asyncio.sleep(0.05)
+        self.assertEqual(finished, [threading.current_thread()], "конец трека должен обрабатываться в потоке цикла событий")
+
+    async def test_ui_handlers_are_async(self):
+        self.assertTrue(asyncio.iscoroutinefunction(self.ui.play_pause_button.on_click), "Flet должен вызывать обработчик на цикле событий")
+        await self.ui.next_button.on_click(None)
+        self.assertEqual(self.manager.current_track_index, 1, "кнопка должна переключать трек")
+
+    async def test_seek_waits_for_running_handler(self):
+        sought = []
+        self.manager.audio_player.seek = sought.append
+        self.assertTrue(asyncio.iscoroutinefunction(self.ui.progress_slider.on_change_end))
+        async with self.manager.lock:
+            seek = asyncio.create_task(self.ui.progress_slider.on_change_end(SimpleNamespace(control=SimpleNamespace(value=5000.0))))
+            await asyncio.sleep(0)
+            self.assertEqual(sought, [], "перемотка не должна выполняться, пока занят lock")
+        await seek
+        self.assertEqual(sought, [5000])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import time
+from playback import PlaybackCore, NullOutput
+from simulation import VirtualClock, FakeAudioBackend
+
+class RecordingOutput(NullOutput):
+    def __init__(self):
+        self.tracks = []
+        self.positions = 0
+
+    def show_track(self, track):
+        self.tracks.append(track["url"])
+
+    def show_position(self, position_ms):
+        self.positions += 1
+
+class Recorder(PlaybackCore):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ended = []
+        self.playing = None
+
+    def track_started(self, track):
+        self.playing = track["url"]
+
+    def track_ended(self, completed):
+        if self.playing is not None:
+            self.ended.append((self.playing, completed))
+            self.playing = None
+
+class TestHeadlessPlayback(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        tracks = [{"url": f"track{i}.mp3", "title": f"track{i}"} for i in range(10)]
+        self.backend = FakeAudioBackend(self.clock, {track["url"]: 60000 + 1000 * i for i, track in enumerate(tracks)})
+        self.output = RecordingOutput()
+        self.core = Recorder(self.backend, self.output, self.clock)
+        self.core.original_playlist = tracks
+        self.core.playlist = tracks.copy()
+
+    def test_whole_playlist_on_virtual_clock(self):
+        started = time.perf_counter()
+        self.core.load_track(0, True)
+        self.clock.advance(sum(self.backend.durations.values()) / 1000 + 1)
+        self.assertLess(time.perf_counter() - started, 2, "виртуальные часы должны быть намного быстрее реальных")
+        self.assertEqual(self.output.tracks, [f"track{i}.mp3" for i in range(10)] + ["track0.mp3"], "треки должны играть по порядку и пойти на второй круг")
+        self.assertEqual(len(self.core.swap_latencies), 10, "все переходы должны быть бесшовными")
+        self.assertEqual(set(self.core.swap_latencies), {0}, "на виртуальных часах переход мгновенный")
+        self.assertTrue(all(completed for _, completed in self.core.ended), "треки должны доигрываться до конца")
+        self.assertGreater(self.output.positions, 1000, "события позиции должны приходить от симулятора")
+
+    def test_two_tracks_stay_gapless(self):
+        tracks = self.core.original_playlist[:2]
+        self.core.original_playlist = tracks
+        self.core.playlist = tracks.copy()
+        self.core.load_track(0, True)
+        self.clock.advance((60000 + 61000) * 3 / 1000)
+        self.assertEqual(self.output.tracks, ["track0.mp3", "track1.mp3"] * 3 + ["track0.mp3"])
+        self.assertEqual(len(self.core.load_latencies), 1, "загружается только первый трек")
+        self.assertEqual(len(self.core.swap_latencies), 6, "плееры должны меняться на каждом переходе")
+        self.assertTrue(all(completed for _, completed in self.core.ended), "переиспользованный плеер должен играть трек с начала")
+
+    def test_pause_and_resume(self):
+        self.core.load_track(0, True)
+        self.clock.advance(10)
+        self.core.play_pause_click()
+        position = self.core.audio_player.position
+        self.clock.advance(100)
+        self.assertEqual(self.core.audio_player.position, position, "на паузе позиция не должна меняться")
+        self.core.play_pause_click()
+        self.clock.advance(55)
+        self.assertEqual(self.output.tracks, ["track0.mp3", "track1.mp3"], "после паузы трек должен доиграть и переключиться")
+
+    def test_repeat(self):
+        self.core.toggle_repeat()
+        self.core.load_track(3, True)
+        self.clock.advance(63 * 3 + 1)
+        self.assertEqual(self.output.tracks, ["track3.mp3"], "в режиме повтора трек не должен меняться")
+        self.assertEqual([url for url, _ in self.core.ended], ["track3.mp3"] * 3, "каждый повтор должен считаться отдельным прослушиванием")
+
+if __name__ == "__main__":
+    unittest.main()
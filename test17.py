@@ -0,0 +1,36 @@
+import unittest
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import benchmark
+
+class TestBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.baseline = os.path.join(self.tmp, "baseline.json")
+
+    def run_bench(self, *args):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return benchmark.main(["--sizes", "200", "--repeat", "1", "--baseline", self.baseline, *args])
+
+    def test_save_and_compare(self):
+        self.assertEqual(self.run_bench("--save"), 0, "сохранение базы не должно падать")
+        with open(self.baseline, encoding="utf-8") as f:
+            results = json.load(f)["results"]
+        self.assertEqual(results["200/next_track linear"]["updates"], 1, "переключение трека должно давать один page.update()")
+        self.assertLessEqual(results["200/audio_position_changed x1000"]["updates"], 1, "пачка событий позиции должна сливаться")
+        self.assertEqual(self.run_bench("--compare", "--threshold", "1000"), 0, "без регрессий сравнение должно проходить")
+
+    def test_regression_detected(self):
+        results = {"a": {"median_ms": 30.0}}
+        self.assertEqual(benchmark.compare(results, {"a": {"median_ms": 10.0}}, 1.25), [("a", 3.0)], "замедление в 3 раза должно считаться регрессией")
+        self.assertEqual(benchmark.compare({"a": {"median_ms": 0.03}}, {"a": {"median_ms": 0.01}}, 1.25), [], "шум в сотые доли миллисекунды не регрессия")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+import shutil
+import asyncio
+import json
+import os
+import tempfile
+import urllib.request
+from audio_player import AudioPlayerManager, UIComponents
+from metrics import Metrics, Histogram, REGISTRY, serve
+from scheduler import UpdateScheduler
+from fixtures import temp_library, FakePage
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_quantiles(self):
+        histogram = Histogram((1, 2, 5, 10))
+        for value in (1, 1, 1, 2, 7):
+            histogram.observe(value)
+        self.assertEqual(histogram.quantile(0.5), 1, "медиана должна попасть в первую корзину")
+        self.assertEqual(histogram.quantile(0.95), 10, "p95 должен попасть в корзину до 10")
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.sum, 12)
+
+    def test_prometheus_format(self):
+        metrics = Metrics()
+        metrics.inc("player_errors_total", handler="next")
+        metrics.observe("player_handler_seconds", 0.003, handler="next")
+        metrics.gauge("player_threads", lambda: 3)
+        text = metrics.to_prometheus()
+        self.assertIn('# TYPE player_handler_seconds histogram', text)
+        self.assertIn('player_handler_seconds_bucket{handler="next",le="0.005"} 1', text, "корзины должны быть накопительными")
+        self.assertIn('player_handler_seconds_bucket{handler="next",le="0.0025"} 0', text)
+        self.assertIn('player_handler_seconds_count{handler="next"} 1', text)
+        self.assertIn('player_errors_total{handler="next"} 1', text)
+        self.assertIn('player_threads 3', text)
+
+    def test_write_json_and_text(self):
+        metrics = Metrics()
+        metrics.inc("player_flushes_total", 2)
+        with tempfile.TemporaryDirectory() as folder:
+            metrics.write(os.path.join(folder, "m.json"))
+            metrics.write(os.path.join(folder, "m.prom"))
+            with open(os.path.join(folder, "m.json"), encoding="utf-8") as f:
+                data = json.load(f)
+            with open(os.path.join(folder, "m.prom"), encoding="utf-8") as f:
+                text = f.read()
+        self.assertEqual(data["counters"], [{"name": "player_flushes_total", "labels": {}, "value": 2}])
+        self.assertIn("player_flushes_total 2", text)
+
+    def test_disabled_registry_records_nothing(self):
+        metrics = Metrics()
+        metrics.enabled = False
+        metrics.inc("a")
+        metrics.observe("b", 1.0)
+        self.assertEqual((metrics.counters, metrics.histograms), ({}, {}), "выключенный реестр не должен ничего копить")
+
+    def test_http_endpoint(self):
+        metrics = Metrics()
+        metrics.inc("player_test_total")
+        server = serve(0, metrics)
+        try:
+            port = server.server_address[1]
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+                self.assertIn("player_test_total 1", response.read().decode())
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics.json") as response:
+                self.assertEqual(json.load(response)["counters"][0]["name"], "player_test_total")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        REGISTRY.reset()
+        self.page = FakePage()
+        self.tmp = tempfile.mkdtemp()
+        self.manager = AudioPlayerManager(None, None, library=temp_library(self.tmp))
+        self.manager.original_playlist = [{"url": f"track{i}.mp3", "title": f"track{i}"} for i in range(3)]
+        self.manager.playlist = self.manager.original_playlist.copy()
+        self.manager.play_counts = {track["url"]: 0 for track in self.manager.playlist}
+        self.ui = UIComponents(self.page, self.manager, diagnostics=True)
+        self.manager.ui = self.ui
+
+    def tearDown(self):
+        self.ui.search_debouncer.cancel()
+        self.ui.animation_loop.shutdown()
+        self.manager.close()
+        self.manager.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def test_handlers_are_timed(self):
+        asyncio.run(self.ui.next_button.on_click(None))
+        asyncio.run(self.ui.next_button.on_click(None))
+        histogram = REGISTRY.histogram("player_handler_seconds", handler="PlaybackCore.next_track")
+        self.assertIsNotNone(histogram, "время обработчика должно попадать в метрики")
+        self.assertEqual(histogram.count, 2, "каждый вызов обработчика должен учитываться")
+        self.assertEqual(REGISTRY.histogram("player_lock_wait_seconds").count, 2, "ожидание lock тоже должно учитываться")
+
+    def test_flush_size_is_recorded(self):
+        metrics = Metrics()
+        scheduler = UpdateScheduler(self.page, metrics=metrics)
+        with scheduler.batch():
+            scheduler.mark(object(), object(), object())
+        sizes = metrics.histogram("player_page_update_controls")
+        self.assertEqual((sizes.count, sizes.sum), (1, 3), "должен учитываться размер каждой отправки")
+        self.assertEqual(metrics.histogram("player_page_update_seconds", kind="partial").count, 1)
+
+    def test_diagnostics_tab(self):
+        self.assertEqual(self.ui.tabs.tabs[-1].text, "Диагностика", "вкладка диагностики должна добавляться по флагу")
+        asyncio.run(self.ui.next_button.on_click(None))
+        self.ui.tabs.selected_index = len(self.ui.tabs.tabs) - 1
+        self.ui.tab_changed(None)
+        self.assertIn("PlaybackCore.next_track", self.ui.diagnostics_text.value, "в сводке должны быть обработчики")
+        self.assertIn("потоков:", self.ui.diagnostics_text.value)
+
+    def test_diagnostics_tab_is_optional(self):
+        ui = UIComponents(FakePage(), self.manager)
+        self.assertNotIn("Диагностика", [tab.text for tab in ui.tabs.tabs], "без флага вкладки диагностики быть не должно")
+        ui.animation_loop.shutdown()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import shutil
+import tempfile
+import asyncio
+from audio_player import AudioPlayerManager, UIComponents
+from metrics import Metrics, StartupTimer
+from fixtures import temp_library, FakePage
+
+class TestLazyTabs(unittest.TestCase):
+    def setUp(self):
+        self.page = FakePage()
+        self.tmp = tempfile.mkdtemp()
+        self.manager = AudioPlayerManager(None, None, library=temp_library(self.tmp))
+        self.manager.original_playlist = [{"url": f"track{i}.mp3", "title": f"track{i}"} for i in range(5)]
+        self.manager.playlist = self.manager.original_playlist.copy()
+        self.manager.play_counts = {track["url"]: 0 for track in self.manager.playlist}
+        self.ui = UIComponents(self.page, self.manager)
+        self.manager.ui = self.ui
+
+    def tearDown(self):
+        self.ui.animation_loop.shutdown()
+        self.manager.close()
+        self.manager.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def test_only_player_tab_is_built(self):
+        self.assertIsNotNone(self.ui.tabs.tabs[0].content, "вкладка плеера должна строиться сразу")
+        self.assertEqual([tab.content for tab in self.ui.tabs.tabs[1:]], [None, None, None], "остальные вкладки не должны строиться до открытия")
+        self.assertEqual(self.page.overlay, [], "справка не должна строиться до открытия")
+
+    def test_tab_is_built_on_first_select(self):
+        self.manager.load_track(2, False)
+        self.manager.count_play(self.manager.playlist[2])
+        self.ui.tabs.selected_index = 1
+        self.ui.tab_changed(None)
+        content = self.ui.tabs.tabs[1].content
+        self.assertEqual(len(self.ui.queue_list.controls), 5, "очередь должна строиться при первом открытии")
+        self.assertEqual(self.ui.queue_list.controls[2].title.color, "purpleaccent400", "текущий трек должен подсвечиваться сразу")
+        self.ui.tabs.selected_index = 0
+        self.ui.tab_changed(None)
+        self.ui.tabs.selected_index = 1
+        self.ui.tab_changed(None)
+        self.assertIs(self.ui.tabs.tabs[1].content, content, "вкладка должна строиться один раз")
+        self.ui.ensure_tab(2)
+        self.assertEqual(self.ui.stats_list.controls[0].title.value, "1. track2 (1 прослушиваний)", "статистика должна учитывать прослушивания до открытия")
+
+    def test_help_is_built_on_first_open(self):
+        self.ui.toggle_help(None)
+        self.assertIn(self.ui.help_container, self.page.overlay, "справка должна добавляться при первом открытии")
+        self.assertTrue(self.ui.help_container.visible)
+        self.assertIn((), self.page.updated, "новый контрол в overlay требует полного обновления")
+
+    def test_buttons_before_library_loaded(self):
+        self.manager.original_playlist = []
+        self.manager.playlist = []
+        self.manager.next_track()
+        self.manager.prev_track()
+        self.assertEqual(self.manager.audio_player.src, None, "пока библиотека не загружена, кнопки ничего не делают")
+
+class TestDeferredIndex(unittest.TestCase):
+    def test_catalog_is_indexed_in_background(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        manager = AudioPlayerManager(None, None, library=temp_library(tmp))
+        self.addCleanup(manager.catalog.close)
+        self.addCleanup(manager.close)
+        manager.original_playlist = [{"url": "song.mp3", "title": "Песня"}]
+        self.assertEqual(manager.search_index.search("песня"), [], "до фоновой индексации каталог в поиске не виден")
+        asyncio.run(manager.index_library())
+        self.assertEqual([track["url"] for track in manager.search_index.search("песня")], ["song.mp3"], "после индексации трек должен находиться")
+        manager.original_playlist = [{"url": "other.mp3", "title": "Другая"}]
+        self.assertEqual([track["url"] for track in manager.search_index.search("другая")], ["other.mp3"], "после индексации смена библиотеки должна сразу попадать в поиск")
+
+class TestStartupTimer(unittest.TestCase):
+    def test_phases_are_reported(self):
+        metrics = Metrics()
+        timer = StartupTimer(metrics=metrics)
+        timer.record("import", 0.5)
+        with timer.phase("ui build"):
+            pass
+        timer.mark("first paint")
+        self.assertEqual([name for name, _ in timer.phases], ["import", "ui build", "first paint"])
+        self.assertEqual(timer.report()[0], "import          500.0 мс")
+        self.assertEqual(metrics.histogram("player_startup_seconds", phase="import").sum, 0.5, "этапы должны попадать в метрики")
+
+class TestSessionStartup(unittest.TestCase):
+    def test_each_session_reports_its_own_phases(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        library = temp_library(tmp)
+        self.addCleanup(library.catalog.close)
+        uis = []
+        for name in ("первая", "вторая"):
+            manager = AudioPlayerManager(None, None, library=library)
+            self.addCleanup(manager.close)
+            timer = StartupTimer(metrics=Metrics())
+            ui = UIComponents(FakePage(), manager, startup=timer)
+            self.addCleanup(ui.animation_loop.shutdown)
+            timer.record(name, 0.1)
+            uis.append(ui)
+        self.assertEqual(uis[0].diagnostics_lines()[-1].split()[0], "первая")
+        self.assertEqual(uis[1].diagnostics_lines()[-1].split()[0], "вторая", "этапы второй вкладки не должны смешиваться с первой")
+        self.assertEqual(len(uis[1].startup.phases), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,13 @@
 import unittest
+import shutil
+import tempfile
 from audio_player import AudioPlayerManager
+from fixtures import temp_library
 
 class TestToggleShuffle(unittest.TestCase):
     def setUp(self):
-        self.manager = AudioPlayerManager(None, None)
+        self.tmp = tempfile.mkdtemp()
+        self.manager = AudioPlayerManager(None, None, library=temp_library(self.tmp))
         self.manager.original_playlist = [
             {"url": "track1.mp3", "title": "track1"},
             {"url": "track2.mp3", "title": "track2"},
@@ -12,8 +16,13 @@ class TestToggleShuffle(unittest.TestCase):
         self.manager.playlist = self.manager.original_playlist.copy()
         self.manager.current_track_index = 1
 
+    def tearDown(self):
+        self.manager.close()
+        self.manager.catalog.close()
+        shutil.rmtree(self.tmp)
+
     def test_toggle_shuffle(self):
-        self.manager.toggle_shuffle(None, None, None)
+        self.manager.toggle_shuffle(None)
         self.assertTrue(self.manager.shuffle_mode, "перемешивание должно быть включено")
         self.assertEqual(self.manager.playlist[1]["title"], "track2", "текущий трек должен быть track2")
         self.assertNotEqual(self.manager.playlist, self.manager.original_playlist, "плейлист должен измениться")
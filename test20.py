@@ -0,0 +1,121 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from audio_player import AudioPlayerManager
+from watcher import LibraryWatcher, PollingSource
+from fixtures import temp_library
+
+def write(path, size):
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+class TestIncrementalUpdates(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.folder = os.path.join(self.tmp, "tracks")
+        os.makedirs(self.folder)
+        for i in range(5):
+            write(os.path.join(self.folder, f"t{i}.mp3"), 100 + i)
+        self.manager = AudioPlayerManager(None, None, library=temp_library(self.tmp))
+        self.manager.original_playlist = self.manager.load_local_tracks()
+        self.manager.playlist = self.manager.original_playlist.copy()
+        self.manager.play_counts = {self.manager.track_key(track): 0 for track in self.manager.playlist}
+
+    def tearDown(self):
+        self.manager.close()
+        self.manager.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def url(self, name):
+        return f"{self.folder}/{name}"
+
+    def test_changes_keep_current_track_and_shuffle(self):
+        self.manager.load_track(2, False)
+        self.manager.toggle_shuffle(None)
+        current = self.manager.playlist[self.manager.current_track_index]["url"]
+        renamed = next(track for track in self.manager.playlist if track["url"] not in (current, self.url("t0.mp3")))
+        self.manager.count_play(renamed)
+        order = [track["url"] for track in self.manager.playlist]
+
+        os.remove(os.path.join(self.folder, "t0.mp3"))
+        os.rename(renamed["url"], self.url("renamed.mp3"))
+        write(os.path.join(self.folder, "new.mp3"), 200)
+        self.manager.library_changed([self.folder])
+
+        expected = [self.url("renamed.mp3") if url == renamed["url"] else url for url in order if url != self.url("t0.mp3")] + [self.url("new.mp3")]
+        self.assertEqual([track["url"] for track in self.manager.playlist], expected, "порядок перемешивания должен сохраниться, новый трек - в конце")
+        self.assertEqual(self.manager.playlist[self.manager.current_track_index]["url"], current, "текущий трек не должен смениться")
+        self.assertEqual(self.manager.play_counts[self.manager.track_key(renamed)], 1, "после переименования счётчик прослушиваний должен сохраниться")
+        self.assertEqual(self.manager.index_of_url(self.url("renamed.mp3")), expected.index(self.url("renamed.mp3")))
+        self.assertEqual([track["url"] for track in self.manager.search_index.search("renamed")], [self.url("renamed.mp3")], "поиск должен находить трек под новым именем")
+
+    def test_new_subfolder_is_scanned(self):
+        album = os.path.join(self.folder, "album")
+        os.makedirs(album)
+        write(os.path.join(album, "a.mp3"), 300)
+        self.manager.library_changed([self.folder])
+        self.assertIn(f"{album}/a.mp3", self.manager.url_index, "треки новой подпапки должны попасть в очередь")
+        shutil.rmtree(album)
+        self.manager.library_changed([self.folder])
+        self.assertNotIn(f"{album}/a.mp3", self.manager.url_index, "треки удалённой подпапки должны пропасть")
+        self.assertEqual(len(self.manager.playlist), 5)
+
+class TestWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.batches = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_burst_becomes_one_batch(self):
+        watcher = LibraryWatcher(self.tmp, self.batches.append, delay=0.2).start()
+        try:
+            album = os.path.join(self.tmp, "album")
+            os.makedirs(album)
+            for i in range(10):
+                write(os.path.join(album, f"{i}.mp3"), i)
+            write(os.path.join(self.tmp, "cover.jpg"), 1)
+            self.assertTrue(wait_for(lambda: self.batches), "изменения должны дойти до callback")
+            time.sleep(0.3)
+        finally:
+            watcher.stop()
+        self.assertEqual(len(self.batches), 1, "серия событий должна слиться в одну пачку")
+        self.assertIn(self.tmp, self.batches[0], "создание подпапки должно отмечать родительскую папку")
+
+    def test_polling_detects_changes(self):
+        album = os.path.join(self.tmp, "album")
+        os.makedirs(album)
+        changed = []
+        source = PollingSource(self.tmp, changed.append)
+        old = os.stat(album).st_mtime - 60
+        os.utime(album, (old, old))
+        source.mtimes = source._snapshot()
+        write(os.path.join(album, "a.mp3"), 1)
+        source.poll()
+        self.assertEqual(changed, [album], "изменившаяся папка должна отмечаться")
+        changed.clear()
+        shutil.rmtree(album)
+        source.poll()
+        self.assertEqual(changed, [self.tmp], "удаление подпапки должно отмечать родителя")
+
+    def test_falls_back_to_polling(self):
+        watcher = LibraryWatcher(self.tmp, self.batches.append, use_inotify=False, poll_interval=0.05, delay=0.05).start()
+        try:
+            self.assertEqual(watcher.mode, "polling")
+            time.sleep(0.1)
+            write(os.path.join(self.tmp, "a.mp3"), 1)
+            self.assertTrue(wait_for(lambda: self.batches), "опрос должен находить новые файлы")
+        finally:
+            watcher.stop()
+
+if __name__ == "__main__":
+    unittest.main()
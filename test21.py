@@ -0,0 +1,153 @@
+import unittest
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from audio_player import AudioPlayerManager, UIComponents
+from analysis import TrackAnalyzer, integrated_loudness, analyse_loudness, file_hash, k_weighting
+from fixtures import temp_library, FakePage, sine, write_wav
+
+class TestLoudness(unittest.TestCase):
+    def test_reference_sine(self):
+        self.assertAlmostEqual(10 * np.log10(k_weighting(np.array([997.0]), 48000)[0]), 0.691, 2, "на 997 Гц K-фильтр должен давать +0.691 дБ")
+        self.assertAlmostEqual(integrated_loudness(sine(1.0), 22050), -3.0, 0, "полная синусоида 997 Гц - около -3 LUFS")
+        self.assertAlmostEqual(integrated_loudness(sine(0.1), 22050), -23.0, 0, "синусоида на 20 дБ тише - около -23 LUFS")
+
+    def test_silence_is_gated(self):
+        self.assertIsNone(integrated_loudness(np.zeros(22050, dtype=np.float32), 22050), "у тишины нет громкости")
+        quiet = np.concatenate([sine(0.1), np.zeros(5 * 22050, dtype=np.float32)])
+        self.assertAlmostEqual(integrated_loudness(quiet, 22050), -23.0, 0, "паузы не должны занижать громкость трека")
+
+    def test_cached_by_file_hash(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "a.wav")
+            write_wav(path, sine(0.5))
+            lufs, digest, mtime_ns, size = analyse_loudness(path, tmp)
+            self.assertAlmostEqual(lufs, -9.0, 0)
+            self.assertEqual(digest, file_hash(path))
+            self.assertEqual((mtime_ns, size), (os.stat(path).st_mtime_ns, os.stat(path).st_size))
+            target = os.path.join(tmp, f"{digest}.loudness.npy")
+            mtime = os.stat(target).st_mtime_ns
+            self.assertEqual(analyse_loudness(path, tmp), (lufs, digest, mtime_ns, size))
+            self.assertEqual(os.stat(target).st_mtime_ns, mtime, "повторный анализ должен брать результат из кэша")
+        finally:
+            shutil.rmtree(tmp)
+
+class TestAnalyzerResults(unittest.TestCase):
+    def test_loudness_is_number_and_results_bounded(self):
+        tmp = tempfile.mkdtemp()
+        analyzer = TrackAnalyzer(tmp, cache_size=2)
+        try:
+            paths = []
+            for i in range(3):
+                paths.append(os.path.join(tmp, f"t{i}.wav"))
+                write_wav(paths[-1], sine(0.5, seconds=1))
+            results = []
+            futures = [analyzer.loudness(path, results.append) for path in paths]
+            for future in futures:
+                future.result(timeout=60)
+            #callback вызывается уже после того, как future отдала результат
+            for _ in range(100):
+                if len(results) == 3:
+                    break
+                time.sleep(0.05)
+            self.assertTrue(all(isinstance(result[0], float) for result in results), "громкость должна приходить числом, а не memmap")
+            self.assertLessEqual(len(analyzer._results), 2, "готовые результаты не должны копиться без предела")
+        finally:
+            analyzer.close()
+            shutil.rmtree(tmp)
+
+class TestTrackGain(unittest.TestCase):
+    def setUp(self):
+        self.page = FakePage()
+        self.tmp = tempfile.mkdtemp()
+        self.manager = AudioPlayerManager(None, None, library=temp_library(self.tmp))
+        self.manager.original_playlist = [{"url": f"track{i}.mp3", "title": f"track{i}"} for i in range(3)]
+        self.manager.playlist = self.manager.original_playlist.copy()
+        self.manager.play_counts = {track["url"]: 0 for track in self.manager.playlist}
+        self.ui = UIComponents(self.page, self.manager)
+        self.manager.ui = self.ui
+        self.manager.track_loading = lambda track: None
+
+    def tearDown(self):
+        self.manager.close()
+        self.manager.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def test_gain_applied_through_volume(self):
+        self.manager.gain_ready("track1.mp3", -24.0)
+        self.manager.gain_ready("track2.mp3", -6.0)
+        self.assertAlmostEqual(self.manager.track_gain("track1.mp3"), 6.0, 5, "тихий трек должен подниматься до -18 LUFS")
+        self.assertAlmostEqual(self.manager.player_volume("track1.mp3"), 0.5 * 10 ** (6 / 20), 5)
+        self.assertAlmostEqual(self.manager.player_volume("track2.mp3"), 0.5 * 10 ** (-12 / 20), 5)
+        self.manager.set_volume(0.9)
+        self.assertEqual(self.manager.player_volume("track1.mp3"), 1.0, "громкость плеера не может быть больше 1")
+        self.manager.normalize_loudness = False
+        self.assertEqual(self.manager.player_volume("track1.mp3"), 0.9, "без нормализации поправка не применяется")
+
+    def test_gain_reaches_loaded_players(self):
+        self.manager.gain_ready("track0.mp3", -24.0)
+        self.manager.load_track(0, False)
+        self.manager.preload_next()
+        self.assertAlmostEqual(self.manager.audio_player.volume, 0.5 * 10 ** (6 / 20), 5, "трек должен загружаться уже с поправкой")
+        self.assertEqual(self.manager.standby_player.src, "track1.mp3")
+        self.assertEqual(self.manager.standby_player.volume, 0.5, "трек без анализа играет с громкостью пользователя")
+        self.manager.gain_ready("track1.mp3", -12.0)
+        self.assertAlmostEqual(self.manager.standby_player.volume, 0.5 * 10 ** (-6 / 20), 5, "поправка должна дойти до уже загруженного следующего трека")
+        self.manager.gain_ready("track2.mp3", float("nan"))
+        self.assertEqual(self.manager.track_gain("track2.mp3"), 0.0, "у тишины поправки нет")
+
+    def test_library_sweep(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            tracks = []
+            for i, amplitude in enumerate((0.02, 0.5)):
+                path = os.path.join(tmp, f"t{i}.wav")
+                write_wav(path, sine(amplitude, seconds=1))
+                tracks.append({"url": path, "title": f"t{i}"})
+            self.manager.original_playlist = tracks
+            self.manager.loudness_analyzer.close()
+            self.manager.loudness_analyzer = TrackAnalyzer(tmp, max_workers=1)
+            asyncio.run(self.manager.analyze_loudness())
+            self.assertAlmostEqual(self.manager.track_gain(tracks[0]["url"]), 12.0, 5, "поправка ограничена 12 дБ")
+            self.assertAlmostEqual(self.manager.track_gain(tracks[1]["url"]), -9.0, 0, "громкий трек должен становиться тише")
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_sweep_remembered_in_catalog(self):
+        folder = self.manager.tracks_folder
+        os.makedirs(folder)
+        for i, amplitude in enumerate((0.1, 0.5)):
+            write_wav(os.path.join(folder, f"t{i}.wav"), sine(amplitude, seconds=1))
+        self.manager.original_playlist = self.manager.load_local_tracks()
+        asyncio.run(self.manager.analyze_loudness())
+        gains = dict(self.manager.track_gains)
+        self.assertEqual(len(gains), 2)
+
+        class NoAnalyzer:
+            max_workers = 1
+
+            def loudness(self, path, callback):
+                raise AssertionError("известный трек не должен анализироваться заново")
+
+            def close(self):
+                pass
+
+        self.manager.track_gains.clear()
+        self.manager.loudness_analyzer.close()
+        self.manager.loudness_analyzer = NoAnalyzer()
+        asyncio.run(self.manager.analyze_loudness())
+        self.assertEqual(self.manager.track_gains, gains, "громкость должна браться из каталога")
+        self.manager.track_gains.clear()
+        self.manager.request_gain(os.path.join(folder, "t1.wav"))
+        self.assertEqual(self.manager.track_gains, {os.path.join(folder, "t1.wav"): gains[os.path.join(folder, "t1.wav")]})
+
+        write_wav(os.path.join(folder, "t0.wav"), sine(0.5, seconds=2))
+        self.manager.catalog.refresh(folder)
+        self.assertNotIn(os.path.join(folder, "t0.wav"), self.manager.catalog.loudness(folder), "изменённый файл анализируется заново")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import asyncio
+import os
+import shutil
+import tempfile
+import numpy as np
+from audio_player import AudioPlayerManager, UIComponents
+from analysis import waveform_peaks, peak_envelope, analyse_loudness, analyse_peaks, file_hash
+from fixtures import temp_library, FakePage, sine, write_wav
+
+class TestWaveformPeaks(unittest.TestCase):
+    def test_peaks_follow_signal(self):
+        samples = np.concatenate([sine(0.1, seconds=1), sine(1.0, seconds=1)])
+        peaks = waveform_peaks(samples, 100)
+        self.assertEqual(peaks.shape, (100, 2))
+        self.assertEqual(peaks.dtype, np.int8)
+        self.assertTrue(np.all(np.abs(peaks[:50]) <= 13), "тихая половина должна давать маленькие пики")
+        self.assertTrue(np.all(peaks[50:, 1] >= 120) and np.all(peaks[50:, 0] <= -120), "громкая половина - почти полный размах")
+        low, high = peak_envelope(peaks, 10)
+        self.assertEqual(len(high), 10)
+        self.assertLess(high[0], 0.15)
+        self.assertGreater(high[-1], 0.9)
+
+    def test_short_and_empty_tracks(self):
+        self.assertEqual(waveform_peaks(np.zeros(0, dtype=np.float32), 16).shape, (16, 2))
+        self.assertEqual(waveform_peaks(np.ones(5, dtype=np.float32), 16).shape, (16, 2), "трек короче числа точек не должен ломать расчёт")
+
+    def test_loudness_sweep_fills_peak_cache(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "a.wav")
+            write_wav(path, sine(0.5, seconds=1))
+            analyse_loudness(path, tmp, 64)
+            target = os.path.join(tmp, f"{file_hash(path)}.peaks-64.npy")
+            self.assertTrue(os.path.exists(target), "анализ громкости должен заодно сохранить пики")
+            mtime = os.stat(target).st_mtime_ns
+            self.assertEqual(analyse_peaks(path, tmp, 64), target)
+            self.assertEqual(os.stat(target).st_mtime_ns, mtime, "пики не должны пересчитываться")
+            peaks = np.load(target, mmap_mode="r")
+            self.assertIsInstance(peaks, np.memmap, "кэш пиков должен отображаться в память, а не читаться")
+        finally:
+            shutil.rmtree(tmp)
+
+class TestWaveformView(unittest.TestCase):
+    def setUp(self):
+        self.page = FakePage()
+        self.tmp = tempfile.mkdtemp()
+        self.manager = AudioPlayerManager(None, None, library=temp_library(self.tmp))
+        self.manager.original_playlist = [{"url": f"track{i}.mp3", "title": f"track{i}"} for i in range(3)]
+        self.manager.playlist = self.manager.original_playlist.copy()
+        self.manager.play_counts = {track["url"]: 0 for track in self.manager.playlist}
+        self.ui = UIComponents(self.page, self.manager)
+        self.manager.ui = self.ui
+        self.manager.track_loading = lambda track: None
+        self.peaks = waveform_peaks(sine(0.5, seconds=1), 256)
+
+    def tearDown(self):
+        self.manager.close()
+        self.manager.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def test_waveform_for_current_track_only(self):
+        self.manager.load_track(1, False)
+        self.manager.peaks_ready("track0.mp3", self.peaks)
+        self.assertEqual(self.ui.waveform.outline.elements, [], "пики чужого трека не должны рисоваться")
+        self.manager.peaks_ready("track1.mp3", self.peaks)
+        self.assertEqual(len(self.ui.waveform.outline.elements), 2 * self.ui.waveform.columns + 2, "огибающая - один замкнутый контур")
+        self.assertIn((self.ui.waveform,), self.page.updated, "должен обновляться только контрол огибающей")
+        self.manager.load_track(2, False)
+        self.assertEqual(self.ui.waveform.outline.elements, [], "при смене трека огибающая сбрасывается")
+
+    def test_swept_peaks_mapped_without_pool(self):
+        folder = self.manager.tracks_folder
+        os.makedirs(folder)
+        write_wav(os.path.join(folder, "a.wav"), sine(0.5, seconds=1))
+        self.manager.original_playlist = self.manager.load_local_tracks()
+        self.manager.playlist = self.manager.original_playlist.copy()
+        asyncio.run(self.manager.analyze_loudness())
+        self.manager.load_track(0, False)
+        submitted = []
+        self.manager.analyzer._submit = lambda job, *args: submitted.append(job.__name__)
+        AudioPlayerManager.track_loading(self.manager, self.manager.playlist[0])
+        self.assertEqual(len(self.ui.waveform.outline.elements), 2 * self.ui.waveform.columns + 2, "пики из кэша должны рисоваться сразу")
+        self.assertEqual(submitted, ["analyse_spectrum"], "за готовыми пиками в пул ходить не нужно")
+        self.assertIsInstance(self.manager.analyzer._results[("peaks", self.manager.playlist[0]["url"])], np.memmap)
+
+if __name__ == "__main__":
+    unittest.main()
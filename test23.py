@@ -0,0 +1,103 @@
+import unittest
+import os
+import shutil
+import tempfile
+from audio_player import AudioPlayerManager
+from duplicates import DuplicateFinder
+from fixtures import temp_library
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+class TestDuplicateFinder(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        big = os.urandom(300 * 1024)
+        changed = bytearray(big)
+        changed[150 * 1024] ^= 1
+        small = os.urandom(1000)
+        self.files = {
+            "a.mp3": big, "a copy.mp3": big, "sub/a (1).mp3": big,
+            "middle.mp3": bytes(changed),
+            "s.mp3": small, "s2.mp3": small,
+            "other.mp3": os.urandom(1000),
+            "unique.mp3": os.urandom(5000),
+            "empty.mp3": b"", "empty2.mp3": b"",
+        }
+        os.makedirs(os.path.join(self.tmp, "sub"))
+        for name, data in self.files.items():
+            write(self.path(name), data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, name):
+        return f"{self.tmp}/{name}"
+
+    def test_groups_and_stages(self):
+        finder = DuplicateFinder(max_workers=4)
+        groups = finder.find([(self.path(name), len(data)) for name, data in self.files.items()])
+        self.assertEqual(groups, [
+            sorted([self.path("a.mp3"), self.path("a copy.mp3"), self.path("sub/a (1).mp3")]),
+            sorted([self.path("s.mp3"), self.path("s2.mp3")]),
+        ], "совпадение начала и конца без совпадения середины - не дубликат")
+        self.assertEqual(finder.partial_hashed, 7, "файлы с уникальным размером и пустые не должны читаться")
+        self.assertEqual(finder.full_hashed, 4, "полный хэш - только для больших файлов с совпавшим началом и концом")
+
+    def test_unreadable_file_is_skipped(self):
+        files = [(self.path("s.mp3"), 1000), (self.path("s2.mp3"), 1000), (self.path("gone.mp3"), 1000)]
+        self.assertEqual(DuplicateFinder().find(files), [[self.path("s.mp3"), self.path("s2.mp3")]])
+
+class TestCollapseDuplicates(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.folder = os.path.join(self.tmp, "tracks")
+        os.makedirs(self.folder)
+        song = os.urandom(200 * 1024)
+        for name in ("a.mp3", "b.mp3", "c.mp3"):
+            write(os.path.join(self.folder, name), song)
+        write(os.path.join(self.folder, "d.mp3"), os.urandom(200 * 1024))
+        write(os.path.join(self.folder, "e.mp3"), os.urandom(100))
+        self.manager = AudioPlayerManager(None, None, library=temp_library(self.tmp))
+        self.manager.original_playlist = self.manager.load_local_tracks()
+        self.manager.playlist = self.manager.original_playlist.copy()
+        self.manager.play_counts = {self.manager.track_key(track): 0 for track in self.manager.playlist}
+
+    def tearDown(self):
+        self.manager.close()
+        self.manager.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def url(self, name):
+        return f"{self.folder}/{name}"
+
+    def test_report_and_collapse(self):
+        self.assertEqual(len(self.manager.catalog.same_size_files(self.folder)), 4, "кандидаты отбираются по размеру в каталоге")
+        self.manager.load_track(self.manager.index_of_url(self.url("c.mp3")), False)
+        track_b = self.manager.original_playlist[self.manager.url_index[self.url("b.mp3")]]
+        stored = self.manager.play_store.get(self.manager.track_key(track_b))
+        self.manager.count_play(track_b)
+        self.manager.count_play(track_b)
+        groups = self.manager.find_duplicates()
+        self.assertEqual(groups, [[self.url("a.mp3"), self.url("b.mp3"), self.url("c.mp3")]])
+
+        self.manager.duplicates_found(groups)
+        self.assertEqual(len(self.manager.playlist), 5, "без схлопывания очередь не меняется")
+        self.manager.collapse_duplicates = True
+        self.manager.duplicates_found(groups)
+        self.assertEqual([track["url"] for track in self.manager.playlist], [self.url(name) for name in ("c.mp3", "d.mp3", "e.mp3")], "должна остаться одна копия")
+        self.assertEqual(self.manager.playlist[self.manager.current_track_index]["url"], self.url("c.mp3"), "играющая копия должна остаться")
+        current = self.manager.playlist[self.manager.current_track_index]
+        self.assertEqual(self.manager.play_counts[self.manager.track_key(current)], 2, "прослушивания копий засчитываются оставшейся")
+        self.assertNotIn(self.manager.track_key(track_b), self.manager.play_counts, "убранная копия уходит из рейтинга")
+        self.assertEqual(self.manager.play_store.get(self.manager.track_key(track_b)), stored + 2, "на диске счётчики не меняются")
+
+        write(os.path.join(self.folder, "f.mp3"), os.urandom(100))
+        self.manager.library_changed([self.folder])
+        self.assertEqual([track["url"] for track in self.manager.playlist], [self.url(name) for name in ("c.mp3", "d.mp3", "e.mp3", "f.mp3")], "схлопнутые копии не должны возвращаться")
+        self.manager.merge_tracks([], self.manager.load_local_tracks())
+        self.assertEqual(len(self.manager.playlist), 4, "и после полного пересканирования")
+
+if __name__ == "__main__":
+    unittest.main()
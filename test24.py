@@ -0,0 +1,155 @@
+import unittest
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+import urllib.request
+import library
+from audio_player import AudioPlayerManager, UIComponents
+from library import shared_library
+from fixtures import temp_library, FakePage
+
+def make_tracks(count, start=0):
+    return [{"id": i + 1, "url": f"track{i}.mp3", "title": f"track{i}", "artist": None, "album": None, "track_no": None} for i in range(start, start + count)]
+
+class TestSharedLibrary(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.library = temp_library(self.tmp)
+        self.library.set_tracks(make_tracks(20000))
+        self.sessions = []
+
+    def tearDown(self):
+        for session in self.sessions:
+            session.close()
+        self.library.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def session(self):
+        session = AudioPlayerManager(None, None, library=self.library)
+        session.track_loading = lambda track: None
+        self.sessions.append(session)
+        return session
+
+    def test_sessions_share_snapshot(self):
+        first = self.session()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        others = [self.session() for _ in range(3)]
+        grown = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        for session in [first] + others:
+            self.assertIs(session.original_playlist, self.library.snapshot.tracks, "список треков должен быть общим")
+            self.assertIs(session.playlist, self.library.snapshot.tracks, "без перемешивания очередь - тот же список")
+            self.assertIs(session.url_index, self.library.snapshot.url_index)
+            self.assertIs(session.key_index, self.library.snapshot.key_index)
+            self.assertIs(session.search_index, self.library.search_index)
+            self.assertIs(session.ranking, self.library.ranking)
+        self.assertLess(grown, sys.getsizeof(self.library.snapshot.url_index), "три сессии не должны стоить даже одного индекса библиотеки")
+
+    def test_changes_reach_every_session(self):
+        first, second = self.session(), self.session()
+        second.load_track(5, False)
+        second.toggle_shuffle()
+        order = [track["url"] for track in second.playlist]
+        current = second.playlist[second.current_track_index]["url"]
+        old_snapshot = self.library.snapshot
+
+        first.add_tracks(make_tracks(2, 20000))
+        first.remove_tracks({"track7.mp3"})
+        renamed = dict(make_tracks(1, 3)[0], url="renamed3.mp3", title="renamed3")
+        first.replace_tracks([("track3.mp3", renamed)])
+
+        self.assertEqual(len(old_snapshot.tracks), 20000, "старый снимок не должен меняться")
+        for session in (first, second):
+            self.assertIs(session.original_playlist, self.library.snapshot.tracks)
+        self.assertIs(first.playlist, self.library.snapshot.tracks)
+        expected = [{"track3.mp3": "renamed3.mp3"}.get(url, url) for url in order if url != "track7.mp3"] + ["track20000.mp3", "track20001.mp3"]
+        self.assertEqual([track["url"] for track in second.playlist], expected, "порядок перемешивания сессии должен сохраниться")
+        self.assertEqual(second.playlist[second.current_track_index]["url"], current, "текущий трек сессии не должен смениться")
+        self.assertEqual(second.index_of_url("track20001.mp3"), len(expected) - 1)
+        self.assertEqual([track["url"] for track in second.search_index.search("renamed3")], ["renamed3.mp3"], "поиск общий на все сессии")
+
+    def test_scan_publishes_growing_snapshots(self):
+        first, second = self.session(), self.session()
+        batches = [make_tracks(200, 20000 + i * 200) for i in range(100)]
+        first.stream_local_tracks = lambda: iter(batches + [make_tracks(20000)])
+        first.scan_publish_interval = 3600
+        version = self.library.snapshot.version
+        asyncio.run(first.scan_library())
+        self.assertEqual(len(second.playlist), 40000, "найденные треки должны дойти до всех сессий")
+        self.assertIs(second.url_index, self.library.snapshot.url_index)
+        self.assertEqual(second.index_of_url("track39999.mp3"), 39999)
+        self.assertLessEqual(self.library.snapshot.version - version, 2, "снимок не должен пересобираться на каждую пачку")
+
+    def test_stats_follow_shared_ranking(self):
+        self.library.set_tracks(make_tracks(4))
+        first, second = self.session(), self.session()
+        for session in (first, second):
+            session.ui = UIComponents(FakePage(), session)
+            session.ui.ensure_tab(2)
+        rows = lambda session: [tile.title.value for tile in session.ui.stats_list.controls]
+        for i in (3, 3, 2):
+            first.count_play(first.original_playlist[i])
+        expected = ["1. track3 (2 прослушиваний)", "2. track2 (1 прослушиваний)", "3. track1 (0 прослушиваний)", "4. track0 (0 прослушиваний)"]
+        self.assertEqual(rows(first), expected)
+        self.assertEqual(rows(second), expected, "прослушивание в одной вкладке должно менять статистику во всех")
+        second.count_play(second.original_playlist[1])
+        first.remove_tracks({"track3.mp3"})
+        self.assertEqual(sorted(row.split(" ", 1)[1] for row in rows(first)), ["track0 (0 прослушиваний)", "track1 (1 прослушиваний)", "track2 (1 прослушиваний)"])
+        self.assertEqual(rows(second), rows(first), "после пересборки рейтинга строки должны совпадать с ним")
+
+    def test_closed_with_last_session(self):
+        first, second = self.session(), self.session()
+        self.sessions.clear()
+        first.close()
+        self.assertFalse(self.library.closed, "библиотека нужна оставшейся сессии")
+        second.close()
+        self.assertTrue(self.library.closed, "с последней сессией библиотека закрывается")
+
+    def test_loader_handed_over(self):
+        first, second = self.session(), self.session()
+        calls = []
+        first.library_changed = lambda directories: calls.append((first, directories))
+        second.library_changed = lambda directories: calls.append((second, directories))
+        self.assertTrue(self.library.claim_loader(first))
+        self.library.library_changed(["a"])
+        self.sessions.remove(first)
+        first.close()
+        self.library.library_changed(["b"])
+        self.assertEqual(calls, [(first, ["a"]), (second, ["b"])], "после закрытия первой вкладки изменения папки должна применять оставшаяся")
+
+    def test_metrics_served_once(self):
+        first, second = self.session(), self.session()
+        server = self.library.serve_metrics(0)
+        self.assertIs(self.library.serve_metrics(server.server_address[1]), server, "вторая вкладка не должна занимать порт заново")
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=5) as response:
+            self.assertEqual(response.status, 200)
+        self.sessions.clear()
+        first.close()
+        second.close()
+        self.assertEqual(server.socket.fileno(), -1, "порт освобождается вместе с библиотекой")
+
+    def test_process_library(self):
+        created = []
+        paths = {"tracks_folder": os.path.join(self.tmp, "tracks"), "db_path": os.path.join(self.tmp, "shared.db"), "cache_dir": os.path.join(self.tmp, ".cache"),
+                 "play_counts_path": os.path.join(self.tmp, "shared_counts"), "history_dir": os.path.join(self.tmp, "shared_history")}
+        try:
+            shared = shared_library(**paths)
+            created.append(shared)
+            self.assertIs(shared_library(**paths), shared, "все вкладки получают одну библиотеку")
+            self.assertTrue(shared.claim_loader(object()))
+            self.assertFalse(shared.claim_loader(object()), "фоновую загрузку запускает только первая сессия")
+            shared.closed = True
+            created.append(shared_library(**paths))
+            self.assertIsNot(created[-1], shared, "после закрытия создаётся новая библиотека")
+        finally:
+            for opened in created:
+                opened.close()
+                opened.catalog.close()
+            library._shared = None
+
+if __name__ == "__main__":
+    unittest.main()
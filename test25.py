@@ -0,0 +1,133 @@
+import unittest
+import http.client
+import os
+import shutil
+import tempfile
+from audio_player import AudioPlayerManager
+from trackserver import TrackServer, parse_range
+from fixtures import temp_library
+
+class TestParseRange(unittest.TestCase):
+    def test_ranges(self):
+        self.assertIsNone(parse_range(None, 100))
+        self.assertEqual(parse_range("bytes=10-19", 100), (10, 19))
+        self.assertEqual(parse_range("bytes=90-", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=90-500", 100), (90, 99), "конец за файлом обрезается")
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=-500", 100), (0, 99))
+        self.assertFalse(parse_range("bytes=100-", 100))
+        self.assertIsNone(parse_range("bytes=20-10", 100), "неверный диапазон игнорируется")
+        self.assertIsNone(parse_range("bytes=-10", 0), "у пустого файла диапазонов нет")
+        self.assertIsNone(parse_range("bytes=0-1,5-6", 100), "несколько диапазонов - весь файл")
+
+class TestTrackServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.folder = os.path.join(self.tmp, "tracks")
+        os.makedirs(os.path.join(self.folder, "sub"))
+        self.data = os.urandom(3 * 1024 * 1024 + 17)
+        with open(os.path.join(self.folder, "sub", "a song.mp3"), "wb") as f:
+            f.write(self.data)
+        with open(os.path.join(self.tmp, "secret.txt"), "w") as f:
+            f.write("secret")
+        self.server = TrackServer(self.folder).start()
+        self.source = self.server.source(f"{self.folder}/sub/a song.mp3")
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def request(self, path, method="GET", **headers):
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=5)
+        connection.request(method, path, headers=headers)
+        response = connection.getresponse()
+        body = response.read()
+        connection.close()
+        return response, body
+
+    def path(self):
+        return self.source[len(self.server.base_url):]
+
+    def test_source_round_trip(self):
+        self.assertEqual(self.source, f"{self.server.base_url}/tracks/sub/a%20song.mp3")
+        self.assertEqual(self.server.track_url(self.source), f"{self.folder}/sub/a song.mp3")
+        self.assertEqual(self.server.source("/elsewhere/b.mp3"), "/elsewhere/b.mp3", "файлы вне папки не раздаются")
+
+    def test_full_file(self):
+        response, body = self.request(self.path())
+        self.assertEqual(response.status, 200)
+        self.assertEqual(body, self.data)
+        self.assertEqual(response.getheader("Content-Type"), "audio/mpeg")
+        self.assertEqual(response.getheader("Accept-Ranges"), "bytes")
+        self.assertTrue(response.getheader("ETag"))
+        self.assertTrue(response.getheader("Last-Modified"))
+        head, body = self.request(self.path(), "HEAD")
+        self.assertEqual(head.status, 200)
+        self.assertEqual(body, b"")
+        self.assertEqual(int(head.getheader("Content-Length")), len(self.data))
+
+    def test_range(self):
+        response, body = self.request(self.path(), Range="bytes=1048576-1048675")
+        self.assertEqual(response.status, 206)
+        self.assertEqual(body, self.data[1048576:1048676], "перемотка должна получить нужный кусок")
+        self.assertEqual(response.getheader("Content-Range"), f"bytes 1048576-1048675/{len(self.data)}")
+        response, body = self.request(self.path(), Range="bytes=-100")
+        self.assertEqual(body, self.data[-100:])
+        response, body = self.request(self.path(), Range=f"bytes={len(self.data)}-")
+        self.assertEqual(response.status, 416)
+        self.assertEqual(response.getheader("Content-Range"), f"bytes */{len(self.data)}")
+
+    def test_validators(self):
+        response, _ = self.request(self.path())
+        etag = response.getheader("ETag")
+        response, body = self.request(self.path(), **{"If-None-Match": etag})
+        self.assertEqual(response.status, 304, "повтор трека не должен качать его заново")
+        self.assertEqual(body, b"")
+        response, _ = self.request(self.path(), **{"If-Modified-Since": response.getheader("Last-Modified")})
+        self.assertEqual(response.status, 304)
+        response, body = self.request(self.path(), Range="bytes=0-9", **{"If-Range": '"stale"'})
+        self.assertEqual(response.status, 200, "после замены файла кусок старой версии не отдаётся")
+        self.assertEqual(body, self.data)
+        response, body = self.request(self.path(), Range="bytes=0-9", **{"If-Range": etag})
+        self.assertEqual(response.status, 206)
+
+    def test_outside_root(self):
+        for path in ("/tracks/../secret.txt", "/tracks/%2e%2e/secret.txt", "/tracks/sub/missing.mp3", "/secret.txt"):
+            response, _ = self.request(path)
+            self.assertEqual(response.status, 404, path)
+
+class TestManagerSource(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        folder = os.path.join(self.tmp, "tracks")
+        os.makedirs(folder)
+        self.library = temp_library(self.tmp)
+        self.library.set_tracks([{"id": i + 1, "url": f"{folder}/t{i}.mp3", "title": f"t{i}", "artist": None, "album": None, "track_no": None} for i in range(3)])
+        self.server = self.library.serve_tracks()
+        self.manager = AudioPlayerManager(None, None, library=self.library)
+        self.manager.track_loading = lambda track: None
+        self.manager.gapless = True
+
+    def tearDown(self):
+        self.manager.close()
+        self.library.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def test_players_get_server_urls(self):
+        self.assertIs(self.library.serve_tracks(), self.server, "сервер один на процесс")
+        self.manager.load_track(0, False)
+        url = self.manager.playlist[0]["url"]
+        self.assertEqual(self.manager.audio_player.src, self.server.source(url), "плеер должен получать трек по http")
+        self.assertEqual(self.manager.player_url(self.manager.audio_player), url)
+        self.manager.preload_next()
+        next_url = self.manager.playlist[1]["url"]
+        self.assertTrue(self.manager.standby_player.src.startswith(self.server.base_url))
+        self.manager.standby_loaded(None, 1000)
+        self.assertEqual(self.manager.standby_ready_url, next_url, "готовность резервного плеера - по пути трека")
+        self.manager.normalize_loudness = True
+        self.manager.set_volume(0.25)
+        self.manager.gain_ready(next_url, -30.0)
+        self.assertGreater(self.manager.standby_player.volume, self.manager.player_volume(url), "поправка должна дойти до плеера с http-адресом")
+
+if __name__ == "__main__":
+    unittest.main()
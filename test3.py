@@ -0,0 +1,40 @@
+import unittest
+import os
+import shutil
+import tempfile
+from catalog import TrackCatalog
+
+class TestTrackCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.folder = os.path.join(self.tmp, "tracks")
+        os.makedirs(self.folder)
+        for name in ["b.mp3", "a.mp3", "cover.jpg"]:
+            open(os.path.join(self.folder, name), "w").close()
+        self.catalog = TrackCatalog(os.path.join(self.tmp, "library.db"))
+
+    def test_tracks_from_catalog(self):
+        self.assertTrue(self.catalog.refresh(self.folder), "первый проход должен просканировать папку")
+        tracks = self.catalog.tracks(self.folder)
+        self.assertEqual([t["title"] for t in tracks], ["a", "b"], "в каталоге должны быть только mp3, по порядку")
+        self.assertEqual(tracks[0]["url"], f"{self.folder}/a.mp3", "url должен совпадать с путём к файлу")
+
+    def test_unchanged_folder_is_not_rescanned(self):
+        self.catalog.refresh(self.folder)
+        old = os.stat(self.folder).st_mtime - 60
+        os.utime(self.folder, (old, old))
+        self.assertTrue(self.catalog.refresh(self.folder), "после смены mtime папка должна пересканироваться")
+        self.assertFalse(self.catalog.refresh(self.folder), "папка без изменений не должна пересканироваться")
+
+    def test_removed_file_disappears(self):
+        self.catalog.refresh(self.folder)
+        os.remove(os.path.join(self.folder, "a.mp3"))
+        self.catalog.refresh(self.folder)
+        self.assertEqual([t["title"] for t in self.catalog.tracks(self.folder)], ["b"], "удалённый трек должен пропасть")
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.tmp)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+import os
+import shutil
+import tempfile
+from catalog import TrackCatalog
+from scanner import LibraryScanner
+
+class TestLibraryScanner(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.folder = os.path.join(self.tmp, "tracks")
+        for sub in ["", "album1", "album2/cd1"]:
+            os.makedirs(os.path.join(self.folder, sub), exist_ok=True)
+        for name in ["top.mp3", "album1/a.flac", "album1/b.ogg", "album2/cd1/c.m4a", "album2/cd1/notes.txt"]:
+            open(os.path.join(self.folder, name), "w").close()
+        self.catalog = TrackCatalog(os.path.join(self.tmp, "library.db"))
+
+    def test_recursive_scan_in_batches(self):
+        scanner = LibraryScanner(self.catalog, max_workers=2, batch_size=1)
+        batches = list(scanner.scan(self.folder))
+        self.assertTrue(all(len(batch) >= 1 for batch in batches), "пачки не должны быть пустыми")
+        titles = sorted(track["title"] for batch in batches for track in batch)
+        self.assertEqual(titles, ["a", "b", "c", "top"], "должны найтись треки во всех подпапках")
+        self.assertEqual(len(self.catalog.tracks(self.folder)), 4, "все треки должны попасть в каталог")
+
+    def test_removed_subfolder_is_dropped(self):
+        self.catalog.refresh(self.folder)
+        shutil.rmtree(os.path.join(self.folder, "album2"))
+        self.catalog.refresh(self.folder)
+        titles = sorted(track["title"] for track in self.catalog.tracks(self.folder))
+        self.assertEqual(titles, ["a", "b", "top"], "треки удалённой подпапки должны пропасть")
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.tmp)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import os
+import shutil
+import tempfile
+import metadata
+from catalog import TrackCatalog
+
+def id3v23_frame(frame_id, payload):
+    return frame_id.encode() + len(payload).to_bytes(4, "big") + b"\x00\x00" + payload
+
+def id3v23_tag(frames):
+    body = b"".join(frames) + b"\x00" * 32
+    size = len(body)
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x03\x00\x00" + syncsafe + body
+
+class TestMetadata(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.folder = os.path.join(self.tmp, "tracks")
+        os.makedirs(self.folder)
+        tag = id3v23_tag([
+            id3v23_frame("APIC", b"\x00" * 20000),
+            id3v23_frame("TIT2", b"\x03CRUSH"),
+            id3v23_frame("TPE1", b"\x01" + "Playboi Carti".encode("utf-16")),
+            id3v23_frame("TALB", b"\x00Music"),
+            id3v23_frame("TRCK", b"\x003/12"),
+        ])
+        with open(os.path.join(self.folder, "v2.mp3"), "wb") as f:
+            f.write(tag + b"\xff\xfb" * 1000)
+        v1 = b"TAG" + b"Title".ljust(30, b"\x00") + b"Artist".ljust(30, b"\x00") + b"Album".ljust(30, b"\x00") + b"2020" + b"\x00" * 28 + b"\x00\x07" + b"\xff"
+        with open(os.path.join(self.folder, "v1.mp3"), "wb") as f:
+            f.write(b"\xff\xfb" * 1000 + v1)
+
+    def test_id3v2_tags(self):
+        tags = metadata.read_tags(os.path.join(self.folder, "v2.mp3"))
+        self.assertEqual(tags, {"title": "CRUSH", "artist": "Playboi Carti", "album": "Music", "track_no": 3}, "теги id3v2 должны прочитаться")
+
+    def test_id3v1_tags(self):
+        tags = metadata.read_tags(os.path.join(self.folder, "v1.mp3"))
+        self.assertEqual(tags, {"title": "Title", "artist": "Artist", "album": "Album", "track_no": 7}, "теги id3v1 должны прочитаться")
+
+    def test_unchanged_files_are_not_reread(self):
+        calls = []
+        original = metadata.read_tags
+        metadata.read_tags = lambda path: calls.append(path) or original(path)
+        try:
+            catalog = TrackCatalog(os.path.join(self.tmp, "library.db"))
+            catalog.refresh(self.folder)
+            self.assertEqual(len(calls), 2, "при первом сканировании теги читаются у всех файлов")
+            tracks = {t["url"].rsplit("/", 1)[1]: t for t in catalog.tracks(self.folder)}
+            self.assertEqual(tracks["v2.mp3"]["title"], "Playboi Carti - CRUSH", "название берётся из тегов")
+            self.assertEqual(tracks["v2.mp3"]["track_no"], 3, "номер трека берётся из тегов")
+            os.utime(self.folder, (0, 0))
+            catalog.refresh(self.folder)
+            self.assertEqual(len(calls), 2, "неизменённые файлы не должны перечитываться")
+            catalog.close()
+        finally:
+            metadata.read_tags = original
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import shutil
+import tempfile
+import flet as ft
+from audio_player import AudioPlayerManager, UIComponents
+from fixtures import temp_library, FakePage
+
+class TestQueueRows(unittest.TestCase):
+    def setUp(self):
+        self.page = FakePage()
+        self.tmp = tempfile.mkdtemp()
+        self.manager = AudioPlayerManager(None, None, library=temp_library(self.tmp))
+        self.manager.original_playlist = [{"url": f"track{i}.mp3", "title": f"track{i}"} for i in range(5)]
+        self.manager.playlist = self.manager.original_playlist.copy()
+        self.manager.play_counts = {track["url"]: 0 for track in self.manager.playlist}
+        self.ui = UIComponents(self.page, self.manager)
+        self.ui.ensure_tab(1)
+        self.manager.ui = self.ui
+
+    def tearDown(self):
+        self.manager.close()
+        self.manager.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def test_track_change_patches_two_rows(self):
+        tiles = list(self.ui.queue_list.controls)
+        self.manager.current_track_index = 3
+        self.page.updated.clear()
+        self.ui.update_queue_list()
+        self.assertEqual(self.page.updated, [(tiles[0], tiles[3])], "должны обновиться только старая и новая строки")
+        self.assertEqual(self.ui.queue_list.controls, tiles, "строки очереди не должны пересоздаваться")
+        self.assertEqual(tiles[3].title.color, ft.Colors.PURPLE_ACCENT_400, "текущая строка должна подсвечиваться")
+        self.assertIsNone(tiles[0].leading, "со старой строки должна пропасть точка")
+
+    def test_shuffle_reuses_rows(self):
+        tiles = {tile.data: tile for tile in self.ui.queue_list.controls}
+        self.manager.toggle_shuffle(None)
+        for tile, track in zip(self.ui.queue_list.controls, self.manager.playlist):
+            self.assertIs(tile, tiles[track["url"]], "после перемешивания строки должны переиспользоваться")
+        self.assertEqual(self.ui.queue_index[self.manager.playlist[4]["url"]], 4, "индекс строки должен совпадать с позицией в плейлисте")
+
+    def test_retagged_track_refreshes_row(self):
+        tile = self.ui.queue_list.controls[2]
+        self.manager.replace_tracks([("track2.mp3", {"url": "track2.mp3", "title": "new title"})])
+        self.assertIs(self.ui.queue_list.controls[2], tile, "строка с тем же url должна переиспользоваться")
+        self.assertEqual(tile.title.value, "new title", "название в строке должно обновиться")
+
+class TestStatsRows(unittest.TestCase):
+    def setUp(self):
+        self.page = FakePage()
+        self.tmp = tempfile.mkdtemp()
+        self.manager = AudioPlayerManager(None, None, library=temp_library(self.tmp))
+        self.manager.original_playlist = [{"url": f"track{i}.mp3", "title": f"track{i}"} for i in range(5)]
+        self.manager.playlist = self.manager.original_playlist.copy()
+        self.manager.play_counts = {track["url"]: 0 for track in self.manager.playlist}
+        self.ui = UIComponents(self.page, self.manager, stats_limit=3)
+        self.ui.ensure_tab(2)
+        self.manager.ui = self.ui
+
+    def tearDown(self):
+        self.manager.close()
+        self.manager.catalog.close()
+        shutil.rmtree(self.tmp)
+
+    def test_play_patches_changed_rows(self):
+        rows = list(self.ui.stats_list.controls)
+        self.assertEqual(len(rows), 3, "в статистике должно быть не больше stats_limit строк")
+        self.page.updated.clear()
+        self.manager.count_play(self.manager.playlist[4])
+        self.assertEqual(self.page.updated, [(rows[0],)], "должна обновиться только строка с новым лидером")
+        self.assertEqual(rows[0].title.value, "1. track4 (1 прослушиваний)", "лидер должен переехать наверх")
+        self.manager.count_play(self.manager.playlist[1])
+        self.assertEqual(rows[1].title.value, "2. track1 (1 прослушиваний)", "второй трек должен занять вторую строку")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+import random
+from ranking import PlayRanking
+
+class TestPlayRanking(unittest.TestCase):
+    def test_matches_full_sort(self):
+        counts = {f"track{i}": 0 for i in range(50)}
+        ranking = PlayRanking(counts)
+        rng = random.Random(7)
+        for _ in range(2000):
+            ranking.increment(f"track{rng.randrange(50)}")
+            values = [count for _, count in ranking.top()]
+            self.assertEqual(values, sorted(counts.values(), reverse=True), "рейтинг должен оставаться отсортированным")
+        for key, pos in ranking.pos.items():
+            self.assertEqual(ranking.order[pos], key, "позиции должны совпадать с порядком")
+
+    def test_increment_reports_changed_ranks(self):
+        ranking = PlayRanking({"a": 2, "b": 1, "c": 1, "d": 1})
+        self.assertEqual(ranking.increment("d"), (1, 3), "трек должен поменяться местами с началом своего блока")
+        self.assertEqual(ranking.top(2), [("a", 2), ("d", 2)], "топ должен учитывать новый счётчик")
+        self.assertEqual(ranking.increment("a"), (0,), "лидер остаётся на месте")
+
+    def test_add_new_track(self):
+        ranking = PlayRanking({"a": 1})
+        ranking.add("b")
+        ranking.increment("b")
+        ranking.increment("b")
+        self.assertEqual(ranking.top(), [("b", 2), ("a", 1)], "новый трек должен участвовать в рейтинге")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import time
+import threading
+from scheduler import UpdateScheduler, AnimationLoop
+from fixtures import FakePage
+
+class TestUpdateScheduler(unittest.TestCase):
+    def setUp(self):
+        self.page = FakePage()
+        self.scheduler = UpdateScheduler(self.page)
+
+    def test_batch_flushes_once(self):
+        a, b = object(), object()
+        with self.scheduler.batch():
+            self.scheduler.mark(a)
+            with self.scheduler.batch():
+                self.scheduler.mark(b, a)
+            self.scheduler.mark(b)
+            self.assertEqual(self.page.updated, [], "внутри обработчика ничего не должно отправляться")
+        self.assertEqual(self.page.updated, [(a, b)], "все изменения должны уйти одним update")
+        self.assertEqual(self.scheduler.saved, 2, "должны сэкономиться два update")
+
+    def test_full_update_wins(self):
+        with self.scheduler.batch():
+            self.scheduler.mark(object())
+            self.scheduler.mark()
+        self.assertEqual(self.page.updated, [()], "полное обновление должно заменить частичные")
+
+class FakeAnimation:
+    def __init__(self):
+        self.running = False
+        self.ticks = 0
+
+    def tick(self, now):
+        self.ticks += 1
+        return [self]
+
+class TestAnimationLoop(unittest.TestCase):
+    def test_single_thread_and_pause(self):
+        page = FakePage()
+        loop = AnimationLoop(UpdateScheduler(page), fps=200)
+        animation = FakeAnimation()
+        loop.add(animation)
+        threads_before = set(threading.enumerate())
+        animation.running = True
+        loop.wake()
+        time.sleep(0.1)
+        self.assertGreater(animation.ticks, 3, "анимация должна получать кадры")
+        self.assertEqual(set(threading.enumerate()) - threads_before, {loop._thread}, "на все кадры должен быть один поток")
+        loop.set_visible(False)
+        time.sleep(0.02)
+        ticks = animation.ticks
+        time.sleep(0.05)
+        self.assertEqual(animation.ticks, ticks, "на скрытой вкладке кадры не должны идти")
+        loop.shutdown()
+        self.assertFalse(loop._thread.is_alive(), "поток должен завершиться")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+import os
+import shutil
+import tempfile
+import wave
+import numpy as np
+import analysis
+
+class TestSpectrum(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "tone.wav")
+        t = np.arange(1102 * 20) / 22050
+        samples = (np.sin(2 * np.pi * 440 * t) * 20000).astype(np.int16)
+        with wave.open(self.path, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(22050)
+            w.writeframes(samples.tobytes())
+
+    def test_band_energies(self):
+        samples, rate = analysis.decode_pcm(self.path)
+        levels = analysis.band_energies(samples, rate, bars=8, fps=20)
+        self.assertEqual(levels.shape, (20, 8), "на секунду звука должно быть 20 кадров по 8 полос")
+        self.assertEqual(levels.dtype, np.uint8, "кадры должны храниться компактно")
+        self.assertEqual(int(levels[10].argmax()), 3, "тон 440 Гц должен попасть в четвёртую полосу")
+
+    def test_result_is_cached_by_hash(self):
+        target = analysis.analyse_spectrum(self.path, self.tmp, 8, 20)
+        self.assertTrue(os.path.basename(target).startswith(analysis.file_hash(self.path)), "кэш должен ключеваться хэшем файла")
+        mtime = os.stat(target).st_mtime_ns
+        self.assertEqual(analysis.analyse_spectrum(self.path, self.tmp, 8, 20), target, "повторный анализ должен вернуть тот же файл")
+        self.assertEqual(os.stat(target).st_mtime_ns, mtime, "повторный анализ не должен пересчитывать спектр")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+if __name__ == "__main__":
+    unittest.main()
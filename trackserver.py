@@ -0,0 +1,193 @@
+import email.utils
+import mimetypes
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+from metrics import REGISTRY
+
+AUDIO_TYPES = {
+    ".mp3": "audio/mpeg", ".m4a": "audio/mp4", ".aac": "audio/aac", ".flac": "audio/flac",
+    ".ogg": "audio/ogg", ".oga": "audio/ogg", ".opus": "audio/ogg", ".wav": "audio/wav",
+}
+RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+SENDFILE_CHUNK = 1 << 20
+
+
+#нужный кусок файла: (start, end) включительно, None - отдать целиком, False - диапазон вне файла.
+#несколько диапазонов сразу и неверные диапазоны вроде 5-2 игнорируются: отдаётся весь файл, как требует RFC 9110
+def parse_range(header, size):
+    match = RANGE.match(header.strip()) if header else None
+    if match is None or size == 0:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last or int(last) == 0:
+            return False
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return False
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+#раздаёт файлы из папки с треками по http: Range для перемотки, ETag и Last-Modified,
+#чтобы клиент при повторе и перемотке переспрашивал, а не качал трек заново.
+#тело ответа уходит через os.sendfile, без копирования в память процесса
+class TrackServer:
+    def __init__(self, root, host="127.0.0.1", port=0, public_url=None):
+        self.root = root
+        self.real_root = os.path.realpath(root)
+        self.host = host
+        self.port = port
+        self.public_url = public_url
+        self.server = None
+        self.base_url = None
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.base_url = (self.public_url or f"http://{self.host}:{self.port}").rstrip("/")
+        threading.Thread(target=self.server.serve_forever, name="track-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    #адрес трека на сервере; пути вне папки с треками остаются как есть
+    def source(self, url):
+        prefix = self.root + "/"
+        if self.base_url is None or not url.startswith(prefix):
+            return url
+        return f"{self.base_url}/tracks/{quote(url[len(prefix):])}"
+
+    def track_url(self, source):
+        prefix = f"{self.base_url}/tracks/"
+        if self.base_url is None or not source.startswith(prefix):
+            return source
+        return f"{self.root}/{unquote(source[len(prefix):])}"
+
+    def resolve(self, request_path):
+        if not request_path.startswith("/tracks/"):
+            return None
+        path = os.path.realpath(os.path.join(self.real_root, unquote(request_path[len("/tracks/"):].split("?", 1)[0])))
+        if not path.startswith(self.real_root + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_HEAD(self):
+                self.respond(body=False)
+
+            def do_GET(self):
+                self.respond(body=True)
+
+            def respond(self, body):
+                path = server.resolve(self.path)
+                if path is None:
+                    self.finish_error(404)
+                    return
+                try:
+                    f = open(path, "rb")
+                except OSError:
+                    self.finish_error(404)
+                    return
+                with f:
+                    st = os.fstat(f.fileno())
+                    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+                    if self.not_modified(etag, st.st_mtime):
+                        self.send_response(304)
+                        self.send_validators(etag, st.st_mtime)
+                        self.end_headers()
+                        REGISTRY.inc("player_track_requests_total", status="304")
+                        return
+                    span = None
+                    if_range = self.headers.get("If-Range")
+                    if if_range is None or if_range == etag:
+                        span = parse_range(self.headers.get("Range"), st.st_size)
+                    if span is False:
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{st.st_size}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        REGISTRY.inc("player_track_requests_total", status="416")
+                        return
+                    start, end = span or (0, st.st_size - 1)
+                    length = end - start + 1
+                    self.send_response(206 if span else 200)
+                    self.send_header("Content-Type", AUDIO_TYPES.get(os.path.splitext(path)[1].lower()) or mimetypes.guess_type(path)[0] or "application/octet-stream")
+                    self.send_header("Content-Length", str(length))
+                    self.send_header("Accept-Ranges", "bytes")
+                    if span:
+                        self.send_header("Content-Range", f"bytes {start}-{end}/{st.st_size}")
+                    self.send_validators(etag, st.st_mtime)
+                    self.end_headers()
+                    REGISTRY.inc("player_track_requests_total", status="206" if span else "200")
+                    if body and length > 0:
+                        self.send_body(f, start, length)
+
+            #кэш у клиента есть всегда, но перед использованием он переспрашивает сервер
+            def send_validators(self, etag, mtime):
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", email.utils.formatdate(mtime, usegmt=True))
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Access-Control-Allow-Origin", "*")
+
+            def not_modified(self, etag, mtime):
+                if_none_match = self.headers.get("If-None-Match")
+                if if_none_match is not None:
+                    return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+                if_modified_since = self.headers.get("If-Modified-Since")
+                if if_modified_since:
+                    try:
+                        since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+                    except (TypeError, ValueError):
+                        return False
+                    return int(mtime) <= since
+                return False
+
+            #перемотка на клиенте обычно обрывает соединение посреди ответа - это не ошибка
+            def send_body(self, f, offset, length):
+                sent = 0
+                try:
+                    if hasattr(os, "sendfile"):
+                        while sent < length:
+                            count = os.sendfile(self.connection.fileno(), f.fileno(), offset + sent, min(SENDFILE_CHUNK, length - sent))
+                            if count == 0:
+                                break
+                            sent += count
+                    else:
+                        f.seek(offset)
+                        while sent < length:
+                            chunk = f.read(min(SENDFILE_CHUNK, length - sent))
+                            if not chunk:
+                                break
+                            self.wfile.write(chunk)
+                            sent += len(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    REGISTRY.inc("player_track_bytes_sent_total", sent)
+                #файл укоротился или клиент ушёл: Content-Length уже не совпадает, соединение не переиспользуем
+                if sent < length:
+                    self.close_connection = True
+
+            def finish_error(self, code):
+                self.send_error(code)
+                REGISTRY.inc("player_track_requests_total", status=str(code))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
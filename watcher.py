@@ -0,0 +1,222 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+from scanner import AUDIO_EXTENSIONS
+from scheduler import Debouncer
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+EVENT = struct.Struct("iIII")
+
+
+def _subdirs(directory):
+    with os.scandir(directory) as entries:
+        return [f"{directory}/{entry.name}" for entry in entries if entry.is_dir(follow_symlinks=False)]
+
+
+#события ядра через inotify: по одному watch на каждую папку библиотеки.
+#пути собираются так же, как в LibraryScanner, чтобы совпадать с каталогом
+class InotifySource:
+    def __init__(self, root, changed, extensions=AUDIO_EXTENSIONS):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("libc не найдена")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify недоступен")
+        self.root = root
+        self.changed = changed
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.paths = {}
+        self._stopped = False
+        self._thread = None
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        try:
+            self._watch_tree(root)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _watch_tree(self, directory):
+        pending = [directory]
+        while pending:
+            directory = pending.pop()
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                #папку успели удалить - это не повод отказываться от inotify
+                if directory != self.root and errno in (2, 20):
+                    continue
+                raise OSError(errno, "inotify_add_watch", directory)
+            self.paths[wd] = directory
+            try:
+                pending.extend(_subdirs(directory))
+            except OSError:
+                continue
+
+    def _forget_tree(self, directory):
+        prefix = directory + "/"
+        for wd, path in list(self.paths.items()):
+            if path == directory or path.startswith(prefix):
+                del self.paths[wd]
+                self.libc.inotify_rm_watch(self.fd, wd)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="library-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        if self._thread is not None:
+            self._thread.join()
+        os.close(self.fd)
+
+    def _run(self):
+        while not self._stopped:
+            ready, _, _ = select.select([self.fd], [], [], 0.2)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0")
+                offset += EVENT.size + length
+                self._event(wd, mask, os.fsdecode(name))
+
+    def _event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            #очередь ядра переполнилась и события потеряны - проверяем все папки
+            for path in list(self.paths.values()):
+                self.changed(path)
+            return
+        if mask & IN_IGNORED:
+            self.paths.pop(wd, None)
+            return
+        directory = self.paths.get(wd)
+        if directory is None:
+            return
+        if mask & IN_ISDIR:
+            path = f"{directory}/{name}"
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self._watch_tree(path)
+                except OSError:
+                    pass
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._forget_tree(path)
+            self.changed(directory)
+        elif name.lower().endswith(self.extensions):
+            self.changed(directory)
+
+
+#запасной вариант без inotify: раз в interval сравниваем mtime папок.
+#mtime папки меняется при создании, удалении и переименовании файлов в ней
+class PollingSource:
+    def __init__(self, root, changed, interval=2.0):
+        self.root = root
+        self.changed = changed
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.mtimes = self._snapshot()
+
+    def _snapshot(self):
+        mtimes = {}
+        pending = [self.root]
+        while pending:
+            directory = pending.pop()
+            try:
+                mtimes[directory] = os.stat(directory).st_mtime_ns
+                pending.extend(_subdirs(directory))
+            except OSError:
+                continue
+        return mtimes
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="library-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def poll(self):
+        mtimes = self._snapshot()
+        changed = {directory for directory, mtime_ns in mtimes.items() if self.mtimes.get(directory) != mtime_ns}
+        for directory in self.mtimes.keys() - mtimes.keys():
+            parent = directory.rsplit("/", 1)[0]
+            if parent in mtimes:
+                changed.add(parent)
+        self.mtimes = mtimes
+        for directory in sorted(changed):
+            self.changed(directory)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+
+#следит за папкой с треками и отдаёт callback изменившиеся папки пачками:
+#серия событий (копирование альбома, переименования) сливается в один вызов
+class LibraryWatcher:
+    def __init__(self, root, callback, delay=0.5, poll_interval=2.0, use_inotify=True):
+        self.root = root
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.mode = None
+        self.batches = 0
+        self.source = None
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._debouncer = Debouncer(delay, self._flush)
+
+    def start(self):
+        if self.use_inotify:
+            try:
+                self.source = InotifySource(self.root, self._changed)
+                self.mode = "inotify"
+            except OSError:
+                self.source = None
+        if self.source is None:
+            self.source = PollingSource(self.root, self._changed, self.poll_interval)
+            self.mode = "polling"
+        self.source.start()
+        return self
+
+    def stop(self):
+        if self.source is not None:
+            self.source.stop()
+        self._debouncer.cancel()
+
+    def _changed(self, directory):
+        with self._lock:
+            self._dirty.add(directory)
+        self._debouncer()
+
+    def _flush(self):
+        with self._lock:
+            directories, self._dirty = self._dirty, set()
+        if directories:
+            self.batches += 1
+            self.callback(sorted(directories))